@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from contextlib import aclosing
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.core.database import get_db
-from app.schemas.alarm_schema import AlarmOut, AlarmCreate, AlarmUpdate
+from app.schemas.alarm_schema import AlarmOut, AlarmCreate, AlarmUpdate, AlarmPage
+from app.services.alarm_archive import alarm_archive
+from app.services.alarm_feed import AlarmFilter, alarm_feed
 from app.services.alarm_service import AlarmService
 from app.services.video_service import VideoService
 
@@ -9,9 +14,50 @@ router = APIRouter(prefix="/alarms", tags=["Alarm Records"])
 service = AlarmService()
 video_service = VideoService()
 
+def alarm_filter_params(device_id: str | None = None, severity: str | None = None,
+                        alarm_type: str | None = None, status: str | None = None,
+                        fence_id: str | None = None, region_id: str | None = None,
+                        branch_id: str | None = None) -> AlarmFilter:
+    # Comma-separated values; branch_id is branches.id (the device owner's department)
+    try:
+        return AlarmFilter.parse(
+            device_id=device_id, severity=severity, region_id=region_id, alarm_type=alarm_type,
+            status=status, fence_id=fence_id, branch_id=branch_id,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="fence_id, region_id and branch_id must be lists of integers")
+
 @router.get("/", response_model=list[AlarmOut])
-def get_alarms(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return service.get_alarms(db, skip, limit)
+def get_alarms(
+    skip: int = 0,
+    limit: int = 100,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    alarm_filter: AlarmFilter = Depends(alarm_filter_params),
+    db: Session = Depends(get_db),
+):
+    # Offset paging kept for existing clients; deep pages should use /alarms/page
+    return service.get_alarms(db, skip, limit, alarm_filter, start, end)
+
+@router.get("/page", response_model=AlarmPage)
+def get_alarm_page(
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    archived: bool = False,
+    alarm_filter: AlarmFilter = Depends(alarm_filter_params),
+    db: Session = Depends(get_db),
+):
+    """
+    Alarms newest first in [start, end), one keyset page at a time (follow next_cursor).
+    archived=true also returns alarms moved to the archive (slower).
+    """
+    return service.query_alarms(db, limit, cursor, alarm_filter, start, end, include_archive=archived)
+
+@router.get("/archive/stats")
+def archive_stats():
+    return alarm_archive.snapshot_stats()
 
 # @router.post("/", response_model=AlarmOut)
 @router.post("/", response_model=AlarmOut)
@@ -26,6 +72,55 @@ def create_alarm(alarm: AlarmCreate, background_tasks: BackgroundTasks, db: Sess
         
     return new_alarm
 
+@router.get("/stream")
+async def stream_alarms(
+    last_id: int | None = None,
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+    alarm_filter: AlarmFilter = Depends(alarm_filter_params),
+):
+    """
+    Server-Sent Events feed of alarm changes ("created" / "updated" / "deleted").
+    Created events carry the alarm id as the SSE id, so a reconnecting EventSource
+    resumes from its Last-Event-ID; last_id does the same for other clients.
+    """
+    if last_id is None and last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+
+    async def frames():
+        yield "retry: 3000\n\n"
+        async with aclosing(alarm_feed.events(alarm_filter, last_id)) as changes:
+            async for change in changes:
+                if change is None:
+                    yield ": keepalive\n\n"
+                    continue
+                head = f"id: {change['id']}\n" if change["event"] == "created" else ""
+                yield f"{head}event: {change['event']}\ndata: {change['data']}\n\n"
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/ws")
+async def alarms_ws(websocket: WebSocket, last_id: int | None = None,
+                    alarm_filter: AlarmFilter = Depends(alarm_filter_params)):
+    """WebSocket version of /alarms/stream: one JSON message per change, "ping" when idle."""
+    await websocket.accept()
+    try:
+        async with aclosing(alarm_feed.events(alarm_filter, last_id)) as changes:
+            async for change in changes:
+                if change is None:
+                    await websocket.send_text('{"event": "ping"}')
+                else:
+                    await websocket.send_text(change["data"])
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/stream/stats")
+def stream_stats():
+    return alarm_feed.snapshot_stats()
+
 @router.put("/{alarm_id}", response_model=AlarmOut)
 def update_alarm(alarm_id: int, alarm: AlarmUpdate, db: Session = Depends(get_db)):
     updated = service.update_alarm(db, alarm_id, alarm)
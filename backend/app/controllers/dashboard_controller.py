@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from app.core.database import get_db
 from app.core.security import get_current_user  # ✅ 新增：按你项目实际路径调整
+from app.services.alarm_feed import AlarmFilter
+from app.services.alarm_rollup import alarm_rollups
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
 
+def _utc(ts: datetime) -> datetime:
+    """报警时间统一用 UTC（alarm_records.timestamp 由 utcnow() 写入）；带时区的参数先换算成 UTC"""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _today_utc():
+    """服务器本地时区的“今天” [00:00, 次日 00:00)，换算成 UTC 区间"""
+    midnight = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    return _utc(midnight), _utc(midnight + timedelta(days=1))
+
+
 @router.get("/summary")
 def dashboard_summary(db: Session = Depends(get_db)):
     """
@@ -15,20 +31,15 @@ def dashboard_summary(db: Session = Depends(get_db)):
     - fenceCount: 电子围栏数量
     - alarmCount: 今日报警数量（使用 alarm_records.timestamp）
     - deviceCount: 设备数量
+    时钟与 /alarm-chart 相同（UTC）：“今日”为服务器本地日历日，换算成 UTC 区间后查询
     """
     # 设备数量
     device_count = db.execute(
         text("SELECT COUNT(*) FROM devices")
     ).scalar() or 0
 
-    # 今日报警数量（你的表字段名就是 timestamp）
-    alarm_count = db.execute(
-        text("""
-            SELECT COUNT(*)
-            FROM alarm_records
-            WHERE DATE(`timestamp`) = CURDATE()
-        """)
-    ).scalar() or 0
+    # 今日报警数量：按小时汇总表求和（DATE(timestamp) 无法走索引，会扫全表）
+    alarm_count = alarm_rollups.total(db, *_today_utc())
 
     # 围栏数量
     fence_count = db.execute(
@@ -42,6 +53,38 @@ def dashboard_summary(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/alarm-chart")
+def alarm_chart(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    bucket: str = "hour",
+    group_by: str | None = None,
+    alarm_type: str | None = None,
+    severity: str | None = None,
+    device_id: str | None = None,
+    branch_id: str | None = None,
+    db: Session = Depends(get_db),
+    user: dict = Depends(get_current_user),
+):
+    """
+    报警趋势图：按小时 / 天分桶的报警数量，来自 alarm_rollups_hourly 汇总表
+    - 时钟与 /summary 相同（UTC，即 alarm_records.timestamp 的时钟）：不带时区的 start / end 按 UTC 解释，
+      带时区的先换算成 UTC；返回的桶时间也是 UTC。默认最近 24 小时
+    - group_by 可按 alarm_type / severity / device_id / branch_id 拆成多条曲线
+    - 过滤参数均可逗号分隔多个值；分部账号只能看本分公司
+    """
+    end = _utc(end) if end else datetime.utcnow()
+    start = _utc(start) if start else end - timedelta(days=1)
+    try:
+        alarm_filter = AlarmFilter.parse(alarm_type=alarm_type, severity=severity,
+                                         device_id=device_id, branch_id=branch_id)
+        if user.get("role") == "BRANCH":
+            alarm_filter.branch_ids = {user.get("department_id")}
+        return alarm_rollups.chart(db, start, end, bucket, group_by, alarm_filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/branches")
 def list_branches(
     db: Session = Depends(get_db),
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends
+import json
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.models.device import Device
 from app.schemas.device_schema import DeviceOut, DeviceCreate, DeviceUpdate
+from app.services.fence_service import FenceService
+from app.services.location_store import location_store
+from app.services.track_store import track_store
+from app.utils.coord_transform import gcj02_to_wgs84_array
 
 router = APIRouter(prefix="/devices", tags=["Devices"])
+fence_service = FenceService()
+
+# Points per chunk written to the streamed track response
+TRACK_CHUNK = 500
 
 @router.get("/", response_model=list[DeviceOut])
 def get_devices(db: Session = Depends(get_db)):
@@ -31,6 +43,10 @@ def update_device(device_id: str, device_in: DeviceUpdate, db: Session = Depends
     
     db.commit()
     db.refresh(db_device)
+    # Keep fence worker_count in sync with manual location edits
+    if "last_latitude" in update_data or "last_longitude" in update_data:
+        location_store.discard(device_id)
+        fence_service.sync_device(db, db_device)
     return db_device
 
 @router.delete("/{device_id}")
@@ -42,4 +58,56 @@ def delete_device(device_id: str, db: Session = Depends(get_db)):
     
     db.delete(db_device)
     db.commit()
+    location_store.discard(device_id)
+    fence_service.forget_device(db, device_id)
     return {"status": "success"}
+
+def _local_naive(ts: datetime) -> datetime:
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+@router.get("/{device_id}/track")
+def get_device_track(
+    device_id: str,
+    start: datetime = Query(..., alias="from"),
+    end: datetime | None = Query(None, alias="to"),
+    interval: float | None = Query(None, gt=0, description="Keep at most one point per N seconds"),
+    max_points: int | None = Query(None, gt=0, description="Thin the track to about this many points"),
+    coords: str = Query("gcj02", pattern="^(gcj02|wgs84)$", description="Coordinate system of the output"),
+    db: Session = Depends(get_db),
+):
+    """Stream a device's trajectory as a JSON array of {ts, lat, lng}, oldest first."""
+    if not db.query(Device.id).filter(Device.id == device_id).first():
+        raise HTTPException(status_code=404, detail="Device not found")
+    # Tracks are partitioned by local time; compare everything as naive local datetimes
+    start = _local_naive(start)
+    end = _local_naive(end) if end else datetime.now()
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be earlier than 'from'")
+    if end - start > timedelta(days=31):
+        raise HTTPException(status_code=400, detail="Track range is limited to 31 days")
+
+    def encode(points):
+        # Tracks are stored in GCJ-02; convert a whole chunk per call when asked for WGS-84
+        lats = [p[1] for p in points]
+        lngs = [p[2] for p in points]
+        if coords == "wgs84":
+            lngs, lats = gcj02_to_wgs84_array(lngs, lats)
+            lngs, lats = np.round(lngs, 7).tolist(), np.round(lats, 7).tolist()
+        return ",".join(
+            json.dumps({"ts": p[0].isoformat(), "lat": lat, "lng": lng})
+            for p, lat, lng in zip(points, lats, lngs)
+        )
+
+    def stream():
+        yield "["
+        chunk, first = [], True
+        for point in track_store.read_downsampled(device_id, start, end, interval, max_points):
+            chunk.append(point)
+            if len(chunk) >= TRACK_CHUNK:
+                yield ("" if first else ",") + encode(chunk)
+                chunk, first = [], False
+        if chunk:
+            yield ("" if first else ",") + encode(chunk)
+        yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
 from typing import List
 from app.core.database import get_db
 from app.schemas.fence_schema import (
     FenceCreate, FenceOut, FenceUpdate,
-    ProjectRegionCreate, ProjectRegionOut, ProjectRegionUpdate
+    ProjectRegionCreate, ProjectRegionOut, ProjectRegionUpdate,
+    LocationPing, LocationBatchResult
 )
+from app.services.fence_recount import fence_recounts
 from app.services.fence_service import FenceService
+from app.services.ingest_filter import ingest_filter
+from app.services.location_ingest import location_ingest, parse_frames, to_gcj02
+from app.services.track_store import track_store
 
 router = APIRouter(prefix="/fence", tags=["Electronic Fence"])
 service = FenceService()
@@ -44,16 +49,27 @@ def read_fences(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
 @router.post("/", response_model=FenceOut)
 def create_fence(fence: FenceCreate, db: Session = Depends(get_db)):
     try:
-        return service.create_fence(db, fence)
+        created = service.create_fence(db, fence)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return _with_recount_status(created)
 
 @router.put("/{fence_id}", response_model=FenceOut)
 def update_fence(fence_id: int, fence: FenceUpdate, db: Session = Depends(get_db)):
     updated_fence = service.update_fence(db, fence_id, fence)
     if not updated_fence:
         raise HTTPException(status_code=404, detail="Fence not found")
-    return updated_fence
+    # worker_count is refreshed by the background recount; see /fence/{id}/recount
+    return _with_recount_status(updated_fence)
+
+@router.get("/{fence_id}/recount")
+def fence_recount_status(fence_id: int):
+    return fence_recounts.status(fence_id)
+
+def _with_recount_status(fence) -> FenceOut:
+    out = FenceOut.model_validate(fence)
+    out.recount_status = fence_recounts.state(fence.id)
+    return out
 
 @router.delete("/{fence_id}")
 def delete_fence(fence_id: int, db: Session = Depends(get_db)):
@@ -65,5 +81,44 @@ def delete_fence(fence_id: int, db: Session = Depends(get_db)):
 @router.post("/check-status")
 def check_fence_violation(device_id: str, lat: float, lng: float, db: Session = Depends(get_db)):
     # This endpoint receives GPS updates from the helmet
+    if not ingest_filter.admit(db, device_id, lat, lng):
+        track_store.record(device_id, lat, lng)
+        return {"status": "filtered"}
     service.check_fence_status(db, device_id, lat, lng)
     return {"status": "checked"}
+
+@router.post("/check-status/batch", response_model=LocationBatchResult)
+def check_fence_violation_batch(
+    pings: List[LocationPing],
+    coords: str = Query("gcj02", pattern="^(gcj02|wgs84)$", description="Coordinate system of the pings"),
+    db: Session = Depends(get_db),
+):
+    # Bulk GPS updates from helmet gateways: positions go to the write-behind location
+    # store (flushed in bulk every LOCATION_FLUSH_INTERVAL), one fence pass, one commit
+    to_gcj02(pings, coords)
+    passed = ingest_filter.filter_pings(db, pings)
+    result = service.check_fence_status_batch(db, passed)
+    result["filtered"] = len(pings) - len(passed)
+    return result
+
+@router.websocket("/ingest/ws")
+async def ingest_ws(websocket: WebSocket):
+    """
+    Persistent GPS ingest channel for devices and gateways.
+    Each message holds one or more frames ("id,lat,lng[,ts]" lines or JSON);
+    the reply acknowledges how many frames were queued / rejected.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            pings, rejected = parse_frames(message)
+            location_ingest.stats["rejected"] += rejected
+            await location_ingest.submit(pings)
+            await websocket.send_json({"accepted": len(pings), "rejected": rejected})
+    except WebSocketDisconnect:
+        pass
+
+@router.get("/ingest/stats")
+def ingest_stats():
+    return location_ingest.snapshot_stats()
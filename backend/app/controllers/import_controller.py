@@ -0,0 +1,48 @@
+import io
+import os
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.core.database import get_db
+from app.services.bulk_import import BulkImportService, KINDS
+
+router = APIRouter(prefix="/import", tags=["Bulk Import"])
+service = BulkImportService()
+
+# Uploads above this many bytes are rejected (default 200 MB)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+@router.post("/{kind}")
+async def bulk_import(
+    kind: str,
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|geojson)$", description="csv or geojson"),
+    coords: str = Query("gcj02", pattern="^(gcj02|wgs84)$", description="Coordinate system of the file"),
+    db: Session = Depends(get_db),
+):
+    """
+    Import devices, regions or fences from the raw request body (CSV or GeoJSON,
+    UTF-8). The body is spooled to disk while it arrives and then parsed row by row;
+    the response reports inserted / skipped rows and the first row errors.
+    """
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown import kind: {kind}")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Import file too large")
+            spool.write(chunk)
+        spool.seek(0)
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        try:
+            return await run_in_threadpool(service.run, db, kind, format, text, coords)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Unreadable {format} file: {e}")
+    finally:
+        spool.close()
@@ -0,0 +1,62 @@
+import time
+from sqlalchemy import inspect, text
+from app.utils.logger import get_logger
+
+logger = get_logger("Schema")
+
+
+def ensure_columns(engine, metadata):
+    """
+    Add columns that exist on the models but not yet in the database.
+
+    Base.metadata.create_all() only creates missing tables, so columns added to an
+    existing model would otherwise require a manual ALTER (or reset_db.py). New columns
+    are added as nullable with their scalar default, which is safe for existing rows.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)} NULL"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if isinstance(default, (int, float)) and not isinstance(default, bool):
+                    ddl += f" DEFAULT {default}"
+                elif isinstance(default, str):
+                    ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    if added:
+        logger.info(f"Added missing columns: {', '.join(added)}")
+    return added
+
+
+def ensure_indexes(engine, metadata):
+    """
+    Create indexes declared on the models that are missing in the database.
+
+    Like columns, indexes added to an existing model are not created by create_all().
+    Indexes are matched by name. On MySQL (InnoDB) CREATE INDEX builds online, so
+    the table stays writable, but it can take a while on a large table.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in present:
+                continue
+            started = time.monotonic()
+            index.create(bind=engine)
+            added.append(index.name)
+            logger.info(f"Created index {index.name} on {table.name} in {time.monotonic() - started:.1f}s")
+    return added
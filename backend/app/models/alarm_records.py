@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 from datetime import datetime
@@ -24,3 +24,13 @@ class AlarmRecord(Base):
     # device = relationship("Device", back_populates="alarms")
     
     fence_id = Column(Integer, ForeignKey("electronic_fences.id"), nullable=True)
+
+    # Keyset pagination walks (timestamp, id) newest first; each filter that narrows
+    # the list on its own gets its equality column in front of that order
+    __table_args__ = (
+        Index("ix_alarm_records_timestamp_id", "timestamp", "id"),
+        Index("ix_alarm_records_status_timestamp", "status", "timestamp", "id"),
+        Index("ix_alarm_records_device_timestamp", "device_id", "timestamp", "id"),
+        Index("ix_alarm_records_fence_timestamp", "fence_id", "timestamp", "id"),
+        Index("ix_alarm_records_type_timestamp", "alarm_type", "timestamp", "id"),
+    )
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.core.database import Base
+
+class AlarmRollup(Base):
+    """Alarm counts per hour x alarm_type x severity x device x branch."""
+    __tablename__ = "alarm_rollups_hourly"
+
+    # Whole key is the primary key, so a count is updated in place (upsert).
+    # Missing values are stored as "" / 0 because NULLs never collide in a key.
+    bucket = Column(DateTime, primary_key=True)  # Start of the hour (alarm_records.timestamp clock)
+    alarm_type = Column(String(50), primary_key=True, default="")
+    severity = Column(String(20), primary_key=True, default="")  # Upper case
+    device_id = Column(String(50), primary_key=True, default="")
+    branch_id = Column(Integer, primary_key=True, default=0)  # users.department_id of the device owner
+
+    alarm_count = Column(Integer, nullable=False, default=0)
@@ -42,5 +42,9 @@ class ElectronicFence(Base):
     alarm_type = Column(SQLEnum(AlarmLevel), default=AlarmLevel.MEDIUM, comment="报警类型")
     is_active = Column(Integer, default=1, comment="是否启用 1-启用 0-禁用")
 
+    # Debouncing of violations at jittery boundaries
+    dwell_seconds = Column(Integer, default=0, comment="违规持续多少秒后才报警 (0 为立即)")
+    hysteresis_m = Column(Float, default=0, comment="解除违规需离开边界的距离(米)")
+
     # Relationships
     project_region = relationship("ProjectRegion", back_populates="fences")
@@ -28,3 +28,8 @@ class AlarmOut(AlarmCreate):
     
     class Config:
         from_attributes=True
+
+class AlarmPage(BaseModel):
+    items: list[AlarmOut]
+    # Pass back as ?cursor= for the next (older) page; None on the last page
+    next_cursor: str | None = None
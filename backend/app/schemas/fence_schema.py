@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
+from datetime import datetime
 from enum import Enum
 import json
 
@@ -53,6 +54,8 @@ class FenceBase(BaseModel):
     effective_time: str = Field(..., description="生效时间 (如 5.00-23.00)", example="5.00-23.00")
     remark: Optional[str] = Field(None, description="围栏备注")
     alarm_type: AlarmLevel = Field(default=AlarmLevel.MEDIUM, description="报警类型: high, medium, low")
+    dwell_seconds: Optional[int] = Field(0, ge=0, description="违规持续多少秒后才报警并计数 (0 为立即)")
+    hysteresis_m: Optional[float] = Field(0, ge=0, description="已违规设备需回到安全侧超过该距离(米)才解除")
 
     @field_validator('radius')
     def validate_radius(cls, v, values):
@@ -80,11 +83,28 @@ class FenceUpdate(BaseModel):
     remark: Optional[str] = None
     alarm_type: Optional[AlarmLevel] = None
     is_active: Optional[int] = None
+    dwell_seconds: Optional[int] = Field(None, ge=0)
+    hysteresis_m: Optional[float] = Field(None, ge=0)
 
 class FenceOut(FenceBase):
     id: int
     worker_count: int = Field(0, description="当前围栏内工人数")
     is_active: int
+    recount_status: Optional[str] = Field(None, description="后台重算状态: pending, running, done, failed, idle")
 
     class Config:
         from_attributes = True
+
+# --- Location Ingest Schemas ---
+class LocationPing(BaseModel):
+    device_id: str = Field(..., description="设备ID")
+    lat: float = Field(..., ge=-90, le=90, description="纬度 (GCJ-02)")
+    lng: float = Field(..., ge=-180, le=180, description="经度 (GCJ-02)")
+    ts: Optional[datetime] = Field(None, description="定位时间")
+
+class LocationBatchResult(BaseModel):
+    status: str = "checked"
+    accepted: int = Field(0, description="已处理的定位点数")
+    filtered: int = Field(0, description="静止/限频被过滤的定位点数")
+    devices: int = Field(0, description="涉及的设备数")
+    unknown_devices: List[str] = Field(default_factory=list, description="未注册的设备ID")
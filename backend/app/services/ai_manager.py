@@ -3,9 +3,10 @@ import time
 import cv2
 import os
 import uuid
-from datetime import datetime
 from app.services.ai_service import AIService
 from app.models.alarm_records import AlarmRecord
+from app.services.alarm_bus import alarm_bus
+from app.services.alarm_service import detection_alarm_row
 from app.core.database import SessionLocal
 
 class AIManager:
@@ -143,22 +144,18 @@ class AIManager:
         if not details:
             return
 
+        row = detection_alarm_row(device_id, details, image_path)
+
+        # 交给报警总线批量写库，不阻塞推理循环
+        future = alarm_bus.publish(row)
+        if future is not None:
+            future.add_done_callback(self._on_alarm_saved)
+            return
+
         db = SessionLocal()
         try:
             # 创建记录
-            record = AlarmRecord(
-                device_id=str(device_id),
-                alarm_type=details.get('type', 'unknown'),
-                severity="HIGH", # 默认为高优先级
-                
-                # ✅ 使用你数据库里的正确字段名
-                description=details.get('msg', '检测到异常'),
-                recording_path=image_path,
-                
-                status="pending",
-                timestamp=datetime.now()
-            )
-            
+            record = AlarmRecord(**row)
             db.add(record)
             db.commit()
             print(f"✅ [数据库] 报警记录已保存 (ID: {record.id})")
@@ -169,5 +166,12 @@ class AIManager:
         finally:
             db.close()
 
+    @staticmethod
+    def _on_alarm_saved(future):
+        if future.exception() is not None:
+            print(f"❌ 数据库保存失败: {future.exception()}")
+        else:
+            print(f"✅ [数据库] 报警记录已保存 (ID: {future.result()['id']})")
+
 # 全局单例
 ai_manager = AIManager()
\ No newline at end of file
@@ -0,0 +1,243 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.models.alarm_records import AlarmRecord
+from app.services.alarm_bus import alarm_to_dict
+from app.services.alarm_scope import alarm_scope
+from app.utils.logger import get_logger
+
+logger = get_logger("AlarmArchive")
+
+DEFAULT_ARCHIVE_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "alarm_archive")
+)
+ARCHIVE_SUFFIX = ".ndjson.gz"
+_DATETIME_FIELDS = ("timestamp", "handled_at")
+
+
+def _month_of(ts: datetime) -> str:
+    return ts.strftime("%Y%m")
+
+
+def _encode(alarm: dict) -> str:
+    row = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in alarm.items()}
+    return json.dumps(row, ensure_ascii=False)
+
+
+def _decode(line: str) -> dict:
+    alarm = json.loads(line)
+    for name in _DATETIME_FIELDS:
+        if alarm.get(name):
+            alarm[name] = datetime.fromisoformat(alarm[name])
+    return alarm
+
+
+class AlarmArchive:
+    """
+    Rolling hot table for alarm_records with compressed cold storage.
+
+    The archive job moves resolved alarms whose timestamp is older than
+    ALARM_ARCHIVE_AFTER_DAYS (default 90) out of alarm_records into one gzip'd
+    NDJSON file per month:
+
+        ALARM_ARCHIVE_DIR/YYYYMM.ndjson.gz
+
+    It works in chunks of ALARM_ARCHIVE_CHUNK alarms (default 1000), oldest first
+    along the (status, timestamp, id) index: the chunk is appended to its month files
+    (one gzip member per chunk, fsynced), then deleted by id and committed, with
+    ALARM_ARCHIVE_PAUSE_S (default 0.2) between chunks, so no transaction holds many
+    locks or lasts long. Pending alarms are never archived, so the open-alarm
+    registry and the fence engine's dedup only ever see the hot table. Rollup counts
+    (alarm_rollups_hourly) are kept. A crash between the file write and the delete
+    can leave a copy of a chunk in the file; readers keep one row per id.
+
+    Archived alarms are read back by scanning the month files of the requested range
+    (slow path, see page()); the last decoded months are cached. A background thread
+    runs the job every ALARM_ARCHIVE_INTERVAL seconds (default 3600, 0 disables it).
+    """
+
+    def __init__(self, root: str = None, after_days: float = None, chunk_size: int = None,
+                 pause_s: float = None, interval: float = None, cached_months: int = 3,
+                 session_factory=SessionLocal):
+        self.root = root or os.getenv("ALARM_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+        if after_days is None:
+            after_days = float(os.getenv("ALARM_ARCHIVE_AFTER_DAYS", "90"))
+        if chunk_size is None:
+            chunk_size = int(os.getenv("ALARM_ARCHIVE_CHUNK", "1000"))
+        if pause_s is None:
+            pause_s = float(os.getenv("ALARM_ARCHIVE_PAUSE_S", "0.2"))
+        if interval is None:
+            interval = float(os.getenv("ALARM_ARCHIVE_INTERVAL", "3600"))
+        self.after_days = after_days
+        self.chunk_size = chunk_size
+        self.pause_s = pause_s
+        self.interval = interval
+        self.cached_months = cached_months
+        self.session_factory = session_factory
+        self._cache = {}  # month -> (mtime, size, alarms newest first)
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"runs": 0, "archived": 0, "chunks": 0, "errors": 0, "last_run_at": None}
+
+    # --- Archive job ---
+    def run_once(self, db: Session = None, now: datetime = None) -> int:
+        """Archive everything due, chunk by chunk. Returns the number of alarms moved."""
+        if self.after_days <= 0:
+            return 0
+        # Alarm timestamps are written with utcnow()
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.after_days)
+        own = db is None
+        db = db or self.session_factory()
+        moved = 0
+        try:
+            with self._run_lock:
+                while not self._stop.is_set():
+                    count = self.archive_chunk(db, cutoff)
+                    moved += count
+                    if count < self.chunk_size:
+                        break
+                    self._stop.wait(self.pause_s)
+        finally:
+            if own:
+                db.close()
+        self.stats["runs"] += 1
+        self.stats["last_run_at"] = datetime.now().isoformat(timespec="seconds")
+        if moved:
+            logger.info(f"Archived {moved} resolved alarms older than {cutoff:%Y-%m-%d %H:%M}")
+        return moved
+
+    def archive_chunk(self, db: Session, cutoff: datetime) -> int:
+        """Move one chunk of resolved alarms older than cutoff to the archive files."""
+        records = (
+            db.query(AlarmRecord)
+            .filter(AlarmRecord.status == "resolved", AlarmRecord.timestamp < cutoff)
+            .order_by(AlarmRecord.timestamp, AlarmRecord.id)
+            .limit(self.chunk_size)
+            .all()
+        )
+        if not records:
+            db.rollback()
+            return 0
+        by_month = {}
+        for record in records:
+            by_month.setdefault(_month_of(record.timestamp), []).append(alarm_to_dict(record))
+        try:
+            for month, alarms in by_month.items():
+                self._append(month, alarms)
+            db.execute(delete(AlarmRecord).where(AlarmRecord.id.in_([r.id for r in records])))
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.stats["errors"] += 1
+            raise
+        db.expunge_all()
+        self.stats["archived"] += len(records)
+        self.stats["chunks"] += 1
+        return len(records)
+
+    def _append(self, month: str, alarms):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, month + ARCHIVE_SUFFIX)
+        data = "".join(_encode(alarm) + "\n" for alarm in alarms).encode("utf-8")
+        with open(path, "ab") as f:
+            # Each chunk is its own gzip member; gzip readers concatenate members
+            f.write(gzip.compress(data))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- Read path ---
+    def months(self) -> list:
+        """Archived months (YYYYMM), newest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            (name[:-len(ARCHIVE_SUFFIX)] for name in os.listdir(self.root) if name.endswith(ARCHIVE_SUFFIX)),
+            reverse=True,
+        )
+
+    def page(self, limit: int, after=None, alarm_filter=None, start: datetime = None, end: datetime = None) -> list:
+        """
+        Up to `limit` archived alarms (dicts) newest first by (timestamp, id), starting
+        after the (timestamp, id) pair `after`, within [start, end) and the filter.
+        """
+        upper = after[0] if after else end
+        results = []
+        for month in self.months():
+            if upper is not None and month > _month_of(upper):
+                continue
+            if start is not None and month < _month_of(start):
+                break
+            for alarm in self._load(month):
+                ts = alarm["timestamp"]
+                if after and (ts, alarm["id"]) >= after:
+                    continue
+                if end is not None and ts >= end:
+                    continue
+                if start is not None and ts < start:
+                    break
+                if alarm_filter is not None and not alarm_filter.matches(self._scoped(alarm, alarm_filter)):
+                    continue
+                results.append(alarm)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _scoped(self, alarm: dict, alarm_filter) -> dict:
+        if alarm_filter.branch_ids or alarm_filter.region_ids:
+            return alarm_scope.annotate(alarm)
+        return alarm
+
+    def _load(self, month: str) -> list:
+        path = os.path.join(self.root, month + ARCHIVE_SUFFIX)
+        st = os.stat(path)
+        cached = self._cache.get(month)
+        if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+            return cached[2]
+        by_id = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    alarm = _decode(line)
+                    by_id[alarm["id"]] = alarm
+        alarms = sorted(by_id.values(), key=lambda a: (a["timestamp"], a["id"]), reverse=True)
+        self._cache[month] = (st.st_mtime, st.st_size, alarms)
+        while len(self._cache) > self.cached_months:
+            self._cache.pop(next(iter(self._cache)))
+        return alarms
+
+    def snapshot_stats(self) -> dict:
+        months = self.months()
+        size = sum(os.path.getsize(os.path.join(self.root, m + ARCHIVE_SUFFIX)) for m in months)
+        return dict(self.stats, months=len(months), bytes=size, after_days=self.after_days)
+
+    # --- Background job ---
+    def start(self):
+        if self.interval <= 0 or self.after_days <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alarm-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the job; a run in progress ends after its current chunk."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Alarm archive run failed: {e}")
+
+
+# 全局单例
+alarm_archive = AlarmArchive()
@@ -0,0 +1,193 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from app.core.database import SessionLocal
+from app.models.alarm_records import AlarmRecord
+from app.services.alarm_registry import open_alarms
+# Importing registers the hook that keeps alarm_rollups_hourly in step with every alarm write
+from app.services import alarm_rollup  # noqa: F401
+from app.utils.logger import get_logger
+
+logger = get_logger("AlarmBus")
+
+_STOP = object()
+
+# AlarmRecord columns copied into the dicts handed to futures and subscribers
+ALARM_FIELDS = (
+    "id", "device_id", "fence_id", "alarm_type", "severity", "description", "location",
+    "status", "timestamp", "handled_at", "recording_path", "recording_status", "recording_error",
+)
+
+
+def alarm_to_dict(alarm: AlarmRecord) -> dict:
+    return {name: getattr(alarm, name) for name in ALARM_FIELDS}
+
+
+class AlarmBus:
+    """
+    In-process alarm bus: alarm rows from the API, the AI monitor threads and the
+    fence engine go into one bounded queue, and a single writer thread inserts them
+    in batches with one commit per batch (group commit). A batch is flushed when it
+    holds ALARM_BUS_BATCH rows (default 500) or ALARM_BUS_FLUSH_MS (default 5) after
+    its first row, so a burst from many cameras / fences costs one transaction and
+    the publisher never waits on the database.
+
+    publish() returns a Future that resolves to the committed alarm as a dict (with
+    its id). A publisher that stops waiting can cancel() the future while the row is
+    still queued; the writer then skips it, so the alarm is certainly not written.
+    After each commit the batch is handed to the subscribers. A row that
+    breaks its batch is retried on its own, so one bad alarm does not drop the rest.
+
+    Fence alarms are reserved in the open-alarm registry while queued (see
+    OpenAlarmRegistry.reserve), so the engine does not raise the same alarm twice
+    before it is written. Without the writer thread (scripts, benchmarks) publish()
+    returns None and callers write synchronously. When the queue is full (default
+    ALARM_BUS_MAX_QUEUE 10000) publishers wait for room.
+    """
+
+    def __init__(self, batch_size: int = None, flush_ms: float = None, max_queue: int = None,
+                 session_factory=SessionLocal):
+        if batch_size is None:
+            batch_size = int(os.getenv("ALARM_BUS_BATCH", "500"))
+        if flush_ms is None:
+            flush_ms = float(os.getenv("ALARM_BUS_FLUSH_MS", "5"))
+        if max_queue is None:
+            max_queue = int(os.getenv("ALARM_BUS_MAX_QUEUE", "10000"))
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.session_factory = session_factory
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._subscribers = []
+        self._thread = None
+        self.stats = {"published": 0, "written": 0, "batches": 0, "failed": 0, "max_batch": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def publish(self, row: dict, reserved: bool = False):
+        """
+        Queue one alarm (AlarmRecord column values). Returns a Future, or None when
+        the bus is not running. With reserved=True the (device_id, fence_id) pair was
+        reserved in open_alarms by the caller and is released once the row is settled.
+        """
+        if not self.running:
+            return None
+        future = Future()
+        self.queue.put((row, reserved, future))
+        self.stats["published"] += 1
+        return future
+
+    def publish_many(self, rows, reserved: bool = False):
+        """Queue several alarms; returns their futures (None when the bus is not running)."""
+        if not self.running:
+            return None
+        return [self.publish(row, reserved) for row in rows]
+
+    def subscribe(self, callback):
+        """callback(alarms: list of dicts) runs in the writer thread after every commit."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def snapshot_stats(self) -> dict:
+        return dict(self.stats, queued=self.queue.qsize(), running=self.running)
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="alarm-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the writer after everything queued so far has been written."""
+        if not self.running:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        for item in batch:
+            if not item[2].set_running_or_notify_cancel() and item[1]:
+                # Cancelled by its publisher: never written, free its pair
+                open_alarms.release(item[0].get("device_id"), item[0].get("fence_id"))
+        batch = [item for item in batch if not item[2].cancelled()]
+        if not batch:
+            return
+        written = self._commit(batch)
+        if written is None:
+            # Something in the batch failed: write the rows one by one
+            written = []
+            for item in batch:
+                result = self._commit([item])
+                if result is None:
+                    self.stats["failed"] += 1
+                    logger.error(f"Dropping alarm for device {item[0].get('device_id')}: {item[2].exception()}")
+                else:
+                    written.extend(result)
+
+        for item in batch:
+            row, reserved = item[0], item[1]
+            if reserved:
+                open_alarms.release(row.get("device_id"), row.get("fence_id"))
+        if not written:
+            return
+        self.stats["written"] += len(written)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(written))
+        for callback in list(self._subscribers):
+            try:
+                callback(written)
+            except Exception as e:
+                logger.error(f"Alarm subscriber {getattr(callback, '__name__', callback)} failed: {e}")
+
+    def _commit(self, batch):
+        """Insert and commit a batch; resolve its futures. None if the transaction failed."""
+        db = self.session_factory()
+        try:
+            records = [AlarmRecord(**row) for row, _, _ in batch]
+            db.add_all(records)
+            db.flush()
+            for record in records:
+                open_alarms.stage_alarm(db, record)
+            # Read before commit expires the instances (ids and defaults are set by the flush)
+            alarms = [alarm_to_dict(record) for record in records]
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+            return None
+        finally:
+            db.close()
+        for (_, _, future), alarm in zip(batch, alarms):
+            future.set_result(alarm)
+        return alarms
+
+
+# 全局单例
+alarm_bus = AlarmBus()
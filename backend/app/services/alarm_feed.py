@@ -0,0 +1,309 @@
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.models.admin_user import User
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.models.fence import ElectronicFence
+from app.services.alarm_bus import ALARM_FIELDS, alarm_to_dict
+from app.services.alarm_scope import alarm_scope
+from app.utils.logger import get_logger
+
+logger = get_logger("AlarmFeed")
+
+# Key in Session.info where alarm changes wait for the transaction to commit
+_STAGED_KEY = "alarm_feed_changes"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _split(value, cast=str):
+    """'a,b' -> {'a', 'b'}; None / '' -> empty set."""
+    if not value:
+        return set()
+    return {cast(part.strip()) for part in str(value).split(",") if part.strip()}
+
+
+class AlarmFilter:
+    """
+    Server-side alarm filter, shared by the push feed and the alarm query API. Each
+    field is a set of accepted values and an empty set accepts everything. A branch
+    filter keeps alarms of devices owned by that branch's users, a region filter
+    alarms raised by fences of those project regions (see AlarmScope). Severities
+    compare case-insensitively (the AI monitor writes "HIGH", the fence engine "high").
+    """
+
+    def __init__(self, device_ids=None, severities=None, region_ids=None, alarm_types=None,
+                 statuses=None, fence_ids=None, branch_ids=None):
+        self.device_ids = set(device_ids or ())
+        self.severities = {s.upper() for s in severities or ()}
+        self.region_ids = set(region_ids or ())
+        self.alarm_types = set(alarm_types or ())
+        self.statuses = set(statuses or ())
+        self.fence_ids = set(fence_ids or ())
+        self.branch_ids = set(branch_ids or ())
+
+    @classmethod
+    def parse(cls, device_id: str = None, severity: str = None, region_id: str = None, alarm_type: str = None,
+              status: str = None, fence_id: str = None, branch_id: str = None):
+        """Build a filter from comma-separated query parameters (ValueError on bad ids)."""
+        return cls(_split(device_id), _split(severity), _split(region_id, int), _split(alarm_type),
+                   _split(status), _split(fence_id, int), _split(branch_id, int))
+
+    def matches(self, alarm: dict) -> bool:
+        if self.device_ids and alarm.get("device_id") not in self.device_ids:
+            return False
+        if self.severities and (alarm.get("severity") or "").upper() not in self.severities:
+            return False
+        if self.region_ids and alarm.get("region_id") not in self.region_ids:
+            return False
+        if self.alarm_types and alarm.get("alarm_type") not in self.alarm_types:
+            return False
+        if self.statuses and alarm.get("status") not in self.statuses:
+            return False
+        if self.fence_ids and alarm.get("fence_id") not in self.fence_ids:
+            return False
+        if self.branch_ids and alarm.get("branch_id") not in self.branch_ids:
+            return False
+        return True
+
+    def apply(self, query):
+        """The same filter as SQL conditions on a query over AlarmRecord."""
+        if self.device_ids:
+            query = query.filter(AlarmRecord.device_id.in_(self.device_ids))
+        if self.severities:
+            query = query.filter(func.upper(AlarmRecord.severity).in_(self.severities))
+        if self.region_ids:
+            fences = select(ElectronicFence.id).where(ElectronicFence.project_region_id.in_(self.region_ids))
+            query = query.filter(AlarmRecord.fence_id.in_(fences))
+        if self.alarm_types:
+            query = query.filter(AlarmRecord.alarm_type.in_(self.alarm_types))
+        if self.statuses:
+            query = query.filter(AlarmRecord.status.in_(self.statuses))
+        if self.fence_ids:
+            query = query.filter(AlarmRecord.fence_id.in_(self.fence_ids))
+        if self.branch_ids:
+            devices = (
+                select(Device.id)
+                .join(User, Device.owner_id == User.id)
+                .where(User.department_id.in_(self.branch_ids))
+            )
+            query = query.filter(AlarmRecord.device_id.in_(devices))
+        return query
+
+
+class AlarmSubscription:
+    """One connected client: a bounded asyncio queue fed from any thread."""
+
+    def __init__(self, alarm_filter: AlarmFilter, loop, max_queue: int):
+        self.filter = alarm_filter
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def deliver(self, change: dict):
+        self.loop.call_soon_threadsafe(self._put, change)
+
+    def _put(self, change: dict):
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # The client is not keeping up: it is caught up from the database instead
+            self.lagged = True
+
+    async def get(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class AlarmFeed:
+    """
+    Push channel for alarm changes, so dashboards do not have to re-poll GET /alarms/.
+
+    Every committed insert, update or delete of an AlarmRecord made through the ORM
+    (alarm bus, AlarmService, fence engine) is staged on its session after the flush
+    and published once the session commits; rolled back changes are dropped. Each
+    change is encoded once as {"event": "created" | "updated" | "deleted", "alarm":
+    {...}} and handed to the clients whose filter accepts it.
+
+    Clients resume with the last alarm id they saw: events() first replays the
+    committed alarms after that id from the database (ALARM_FEED_BACKFILL_PAGE rows,
+    default 500, per query) and then switches to live changes, skipping alarms
+    already replayed. A client that falls more than ALARM_FEED_MAX_QUEUE (default
+    1000) changes behind gets a "resync" event and is caught up the same way; status
+    changes it missed meanwhile are only covered by refetching the list.
+    """
+
+    def __init__(self, max_queue: int = None, backfill_page: int = None, keepalive_s: float = None,
+                 session_factory=SessionLocal):
+        if max_queue is None:
+            max_queue = int(os.getenv("ALARM_FEED_MAX_QUEUE", "1000"))
+        if backfill_page is None:
+            backfill_page = int(os.getenv("ALARM_FEED_BACKFILL_PAGE", "500"))
+        if keepalive_s is None:
+            keepalive_s = float(os.getenv("ALARM_FEED_KEEPALIVE_S", "15"))
+        self.max_queue = max_queue
+        self.backfill_page = backfill_page
+        self.keepalive_s = keepalive_s
+        self.session_factory = session_factory
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "lagged": 0, "backfilled": 0}
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, alarm_filter: AlarmFilter) -> AlarmSubscription:
+        """Register a client; must be called from its event loop."""
+        subscription = AlarmSubscription(alarm_filter, asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AlarmSubscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def snapshot_stats(self) -> dict:
+        return dict(self.stats, subscribers=len(self._subscribers))
+
+    def stage_rows(self, session: Session, alarms):
+        """Publish alarms inserted with Core (mappings of AlarmRecord columns) when session commits."""
+        if not self.has_subscribers:
+            return
+        changes = [("created", {name: alarm.get(name) for name in ALARM_FIELDS}) for alarm in alarms]
+        if changes:
+            session.info.setdefault(_STAGED_KEY, []).extend(changes)
+
+    def publish(self, changes):
+        """Fan committed changes [(kind, alarm dict), ...] out to the matching clients."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers or not changes:
+            return
+        encoded = [self._encode(kind, alarm) for kind, alarm in changes]
+        self.stats["published"] += len(encoded)
+        for subscription in subscribers:
+            for change in encoded:
+                if not subscription.filter.matches(change["alarm"]):
+                    continue
+                try:
+                    subscription.deliver(change)
+                    self.stats["delivered"] += 1
+                except RuntimeError:
+                    # Event loop already closed: the client is gone
+                    self.unsubscribe(subscription)
+                    break
+
+    def backfill(self, alarm_filter: AlarmFilter, after_id: int) -> list:
+        """Committed alarms with id > after_id accepted by the filter, oldest first (one page)."""
+        db = self.session_factory()
+        try:
+            query = alarm_filter.apply(db.query(AlarmRecord).filter(AlarmRecord.id > after_id))
+            rows = query.order_by(AlarmRecord.id).limit(self.backfill_page).all()
+            changes = [self._encode("created", alarm_to_dict(record)) for record in rows]
+        finally:
+            db.close()
+        self.stats["backfilled"] += len(changes)
+        return changes
+
+    async def events(self, alarm_filter: AlarmFilter, last_id: int = None):
+        """
+        Changes for one client: the backlog after last_id, then live changes.
+        Yields None every keepalive_s seconds without a change.
+        """
+        subscription = self.subscribe(alarm_filter)
+        replayed = set()
+        try:
+            if last_id is not None:
+                async for change in self._replay(alarm_filter, last_id, replayed):
+                    last_id = change["id"]
+                    yield change
+            while True:
+                if subscription.lagged:
+                    subscription.lagged = False
+                    self.stats["lagged"] += 1
+                    yield self._encode("resync", {"reason": "lagged"}, scoped=False)
+                    if last_id is not None:
+                        async for change in self._replay(alarm_filter, last_id, replayed):
+                            last_id = max(last_id, change["id"])
+                            yield change
+                change = await subscription.get(self.keepalive_s)
+                if change is None:
+                    yield None
+                    continue
+                if change["event"] == "created":
+                    if change["id"] in replayed:
+                        continue
+                    last_id = change["id"] if last_id is None else max(last_id, change["id"])
+                yield change
+        finally:
+            self.unsubscribe(subscription)
+
+    async def _replay(self, alarm_filter: AlarmFilter, after_id: int, replayed: set):
+        while True:
+            page = await asyncio.to_thread(self.backfill, alarm_filter, after_id)
+            for change in page:
+                replayed.add(change["id"])
+                yield change
+            if len(page) < self.backfill_page:
+                return
+            after_id = page[-1]["id"]
+
+    def _encode(self, kind: str, alarm: dict, scoped: bool = True) -> dict:
+        if scoped:
+            alarm = alarm_scope.annotate(alarm)
+        data = json.dumps({"event": kind, "alarm": alarm}, default=_json_default, ensure_ascii=False)
+        return {"event": kind, "id": alarm.get("id"), "alarm": alarm, "data": data}
+
+
+# 全局单例
+alarm_feed = AlarmFeed()
+
+
+@event.listens_for(Session, "after_flush")
+def _stage_changes(session, flush_context):
+    if not alarm_feed.has_subscribers:
+        return
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, AlarmRecord):
+            changes.append(("created", alarm_to_dict(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, AlarmRecord) and session.is_modified(obj, include_collections=False):
+            changes.append(("updated", alarm_to_dict(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, AlarmRecord):
+            # The row is gone: only read what is already loaded
+            loaded = inspect(obj).dict
+            changes.append(("deleted", {name: loaded.get(name) for name in ALARM_FIELDS}))
+    if changes:
+        session.info.setdefault(_STAGED_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_staged(session):
+    changes = session.info.pop(_STAGED_KEY, None)
+    if changes:
+        try:
+            alarm_feed.publish(changes)
+        except Exception as e:
+            logger.error(f"Alarm feed publish failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop(_STAGED_KEY, None)
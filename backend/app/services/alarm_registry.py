@@ -0,0 +1,131 @@
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models.alarm_records import AlarmRecord
+from app.utils.logger import get_logger
+
+logger = get_logger("AlarmRegistry")
+
+# Key in Session.info where changes are staged until the transaction commits
+_STAGED_KEY = "open_alarm_ops"
+
+
+class OpenAlarmRegistry:
+    """
+    In-memory set of (device_id, fence_id) pairs that have a pending alarm,
+    used by the fence engine to dedup alarms without querying alarm_records.
+
+    AlarmService stages changes on the session (stage_*); they are applied only
+    when that session commits and dropped if it rolls back, so the registry never
+    reports an alarm that was not actually written. Alarms queued on the alarm bus
+    hold a reservation on their pair until they are written, so is_open() already
+    reports them.
+    """
+
+    def __init__(self):
+        self._pairs = {}  # (device_id, fence_id) -> set(alarm_id)
+        self._by_alarm = {}  # alarm_id -> (device_id, fence_id)
+        self._reserved = set()  # (device_id, fence_id) queued but not written yet
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def warm_up(self, db: Session):
+        rows = (
+            db.query(AlarmRecord.id, AlarmRecord.device_id, AlarmRecord.fence_id)
+            .filter(AlarmRecord.status == "pending", AlarmRecord.fence_id.isnot(None))
+            .all()
+        )
+        with self._lock:
+            self._pairs.clear()
+            self._by_alarm.clear()
+            for alarm_id, device_id, fence_id in rows:
+                self._add(alarm_id, device_id, fence_id)
+            self.loaded = True
+        logger.info(f"Open alarm registry loaded: {len(rows)} pending fence alarms")
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.warm_up(db)
+
+    def is_open(self, device_id, fence_id) -> bool:
+        with self._lock:
+            pair = (device_id, fence_id)
+            return pair in self._pairs or pair in self._reserved
+
+    def reserve(self, device_id, fence_id) -> bool:
+        """Claim a pair for an alarm about to be queued. False if it is open or claimed."""
+        with self._lock:
+            pair = (device_id, fence_id)
+            if pair in self._pairs or pair in self._reserved:
+                return False
+            self._reserved.add(pair)
+            return True
+
+    def release(self, device_id, fence_id):
+        """Drop a reservation once the queued alarm is written (or failed)."""
+        with self._lock:
+            self._reserved.discard((device_id, fence_id))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_alarm)
+
+    # --- Staging (applied on commit) ---
+    def stage_alarm(self, db: Session, alarm: AlarmRecord):
+        """Record the state of an alarm row after an insert or update."""
+        if alarm.status == "pending" and alarm.fence_id is not None:
+            self.stage_add(db, alarm.id, alarm.device_id, alarm.fence_id)
+        else:
+            self.stage_remove(db, alarm.id)
+
+    def stage_add(self, db: Session, alarm_id: int, device_id: str, fence_id: int):
+        db.info.setdefault(_STAGED_KEY, []).append(("add", alarm_id, device_id, fence_id))
+
+    def stage_remove(self, db: Session, alarm_id: int):
+        db.info.setdefault(_STAGED_KEY, []).append(("remove", alarm_id))
+
+    def stage_remove_fence(self, db: Session, fence_id: int):
+        db.info.setdefault(_STAGED_KEY, []).append(("remove_fence", fence_id))
+
+    def apply(self, ops):
+        with self._lock:
+            for op in ops:
+                if op[0] == "add":
+                    self._remove(op[1])
+                    self._add(op[1], op[2], op[3])
+                elif op[0] == "remove":
+                    self._remove(op[1])
+                elif op[0] == "remove_fence":
+                    for alarm_id, pair in list(self._by_alarm.items()):
+                        if pair[1] == op[1]:
+                            self._remove(alarm_id)
+
+    def _add(self, alarm_id, device_id, fence_id):
+        self._by_alarm[alarm_id] = (device_id, fence_id)
+        self._pairs.setdefault((device_id, fence_id), set()).add(alarm_id)
+
+    def _remove(self, alarm_id):
+        pair = self._by_alarm.pop(alarm_id, None)
+        if pair is None:
+            return
+        ids = self._pairs.get(pair)
+        if ids is not None:
+            ids.discard(alarm_id)
+            if not ids:
+                del self._pairs[pair]
+
+
+# 全局单例
+open_alarms = OpenAlarmRegistry()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_staged(session):
+    ops = session.info.pop(_STAGED_KEY, None)
+    if ops:
+        open_alarms.apply(ops)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_staged(session):
+    session.info.pop(_STAGED_KEY, None)
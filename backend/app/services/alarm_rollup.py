@@ -0,0 +1,250 @@
+import math
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.admin_user import User
+from app.models.alarm_records import AlarmRecord
+from app.models.alarm_rollup import AlarmRollup
+from app.models.device import Device
+from app.services.alarm_scope import alarm_scope
+from app.utils.logger import get_logger
+
+logger = get_logger("AlarmRollup")
+
+# Dimensions a chart can be split by
+GROUP_BY = ("alarm_type", "severity", "device_id", "branch_id")
+BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+_KEY = ("bucket", "alarm_type", "severity", "device_id", "branch_id")
+_UPSERTS = {"mysql": mysql.insert, "postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def hour_of(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_expr(dialect: str, column):
+    """SQL for the start of the hour of `column`, in the form the DateTime column stores."""
+    if dialect == "mysql":
+        return func.date_format(column, "%Y-%m-%d %H:00:00")
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00.000000", column)
+    if dialect == "postgresql":
+        return func.date_trunc("hour", column)
+    return None
+
+
+class AlarmRollups:
+    """
+    Hourly alarm counts per alarm_type x severity x device x branch (alarm_rollups_hourly),
+    so dashboards and charts read O(buckets) rows instead of scanning alarm_records.
+
+    The counts are kept in step with alarm_records in the same transaction: a session
+    hook turns every flushed insert / delete / change of an AlarmRecord into count
+    deltas and upserts them before the commit, and the fence engine's bulk INSERT
+    path calls add_rows(). Branches come from AlarmScope at write time. Rows removed
+    with bulk (Core) deletes, e.g. by archiving, keep their counts.
+
+    ensure_built() fills the table from alarm_records once (first start after the
+    upgrade); rebuild() recomputes it from scratch with one INSERT ... SELECT.
+    """
+
+    def __init__(self, max_buckets: int = None):
+        if max_buckets is None:
+            max_buckets = int(os.getenv("ALARM_CHART_MAX_BUCKETS", "2000"))
+        self.max_buckets = max_buckets
+
+    def key_of(self, db, timestamp, alarm_type, severity, device_id):
+        """Rollup key of one alarm; None for rows without a timestamp."""
+        if timestamp is None:
+            return None
+        return (
+            hour_of(timestamp),
+            alarm_type or "",
+            (severity or "").upper(),
+            device_id or "",
+            alarm_scope.branch_of(device_id, db) or 0,
+        )
+
+    def add_rows(self, db: Session, rows):
+        """Count alarms inserted with Core (dicts of AlarmRecord columns) in db's transaction."""
+        conn = db.connection()
+        deltas = Counter()
+        for row in rows:
+            key = self.key_of(conn, row.get("timestamp"), row.get("alarm_type"), row.get("severity"),
+                              row.get("device_id"))
+            if key is not None:
+                deltas[key] += 1
+        self.apply(conn, deltas)
+
+    def apply(self, conn, deltas):
+        """Add {key: delta} to the stored counts (keys in sorted order, so writers lock alike)."""
+        rows = [dict(zip(_KEY, key), alarm_count=n) for key, n in sorted(deltas.items()) if n]
+        if not rows:
+            return
+        table = AlarmRollup.__table__
+        upsert = _UPSERTS.get(conn.dialect.name)
+        if upsert is None:
+            for row in rows:
+                matched = conn.execute(
+                    update(table)
+                    .where(*[table.c[name] == row[name] for name in _KEY])
+                    .values(alarm_count=table.c.alarm_count + row["alarm_count"])
+                )
+                if matched.rowcount == 0:
+                    conn.execute(insert(table), row)
+            return
+        stmt = upsert(table)
+        if conn.dialect.name == "mysql":
+            stmt = stmt.on_duplicate_key_update(alarm_count=table.c.alarm_count + stmt.inserted.alarm_count)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(_KEY),
+                set_={"alarm_count": table.c.alarm_count + stmt.excluded.alarm_count},
+            )
+        conn.execute(stmt, rows)
+
+    def rebuild(self, db: Session) -> int:
+        """Recompute every count from alarm_records. Returns the number of rollup rows."""
+        table = AlarmRollup.__table__
+        db.execute(delete(table))
+        hour = _hour_expr(db.bind.dialect.name, AlarmRecord.timestamp)
+        dims = [
+            func.coalesce(AlarmRecord.alarm_type, ""),
+            func.upper(func.coalesce(AlarmRecord.severity, "")),
+            func.coalesce(AlarmRecord.device_id, ""),
+            func.coalesce(User.department_id, 0),
+        ]
+        source = (
+            select(AlarmRecord.timestamp if hour is None else hour, *dims, func.count())
+            .select_from(AlarmRecord)
+            .outerjoin(Device, Device.id == AlarmRecord.device_id)
+            .outerjoin(User, User.id == Device.owner_id)
+            .where(AlarmRecord.timestamp.isnot(None))
+        )
+        if hour is not None:
+            db.execute(insert(table).from_select(list(_KEY) + ["alarm_count"], source.group_by(hour, *dims)))
+        else:
+            # No hour function for this dialect: group in Python
+            deltas = Counter()
+            for timestamp, *key, n in db.execute(source.group_by(AlarmRecord.timestamp, *dims)):
+                deltas[(hour_of(timestamp), *key)] += n
+            self.apply(db.connection(), deltas)
+        db.commit()
+        rows = db.query(func.count()).select_from(AlarmRollup).scalar()
+        logger.info(f"Alarm rollups rebuilt: {rows} rows")
+        return rows
+
+    def ensure_built(self, db: Session):
+        """Fill the rollups from alarm_records if they are empty but alarms exist."""
+        if db.query(AlarmRollup.bucket).first() is None and db.query(AlarmRecord.id).first() is not None:
+            self.rebuild(db)
+
+    def total(self, db: Session, start: datetime, end: datetime, alarm_filter=None) -> int:
+        """Alarms in [start, end), to the hour."""
+        query = db.query(func.sum(AlarmRollup.alarm_count)).filter(
+            AlarmRollup.bucket >= hour_of(start), AlarmRollup.bucket < end
+        )
+        return int(self._filtered(query, alarm_filter).scalar() or 0)
+
+    def chart(self, db: Session, start: datetime, end: datetime, bucket: str = "hour",
+              group_by: str = None, alarm_filter=None) -> dict:
+        """
+        Alarm counts per bucket ("hour" / "day") in [start, end), optionally one series
+        per value of group_by. Raises ValueError on a bad bucket / group_by or range.
+        """
+        step = BUCKETS.get(bucket)
+        if step is None:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        first = hour_of(start) if bucket == "hour" else start.replace(hour=0, minute=0, second=0, microsecond=0)
+        count = math.ceil((end - first) / step)
+        if count <= 0:
+            raise ValueError("end must be after start")
+        if count > self.max_buckets:
+            raise ValueError(f"At most {self.max_buckets} buckets per chart")
+
+        columns = [AlarmRollup.bucket]
+        if group_by:
+            columns.append(getattr(AlarmRollup, group_by))
+        query = db.query(*columns, func.sum(AlarmRollup.alarm_count)).filter(
+            AlarmRollup.bucket >= first, AlarmRollup.bucket < end
+        )
+        rows = self._filtered(query, alarm_filter).group_by(*columns).all()
+
+        series = {}
+        for row in rows:
+            key = row[1] if group_by else None
+            counts = series.setdefault(key, [0] * count)
+            counts[int((row[0] - first) / step)] += int(row[-1])
+        if not series:
+            series[None] = [0] * count
+        return {
+            "bucket": bucket,
+            "group_by": group_by,
+            "buckets": [(first + i * step).isoformat() for i in range(count)],
+            "series": sorted(
+                ({"key": key or None, "total": sum(counts), "counts": counts} for key, counts in series.items()),
+                key=lambda s: -s["total"],
+            ),
+        }
+
+    def _filtered(self, query, alarm_filter):
+        if alarm_filter is None:
+            return query
+        if alarm_filter.alarm_types:
+            query = query.filter(AlarmRollup.alarm_type.in_(alarm_filter.alarm_types))
+        if alarm_filter.severities:
+            query = query.filter(AlarmRollup.severity.in_(alarm_filter.severities))
+        if alarm_filter.device_ids:
+            query = query.filter(AlarmRollup.device_id.in_(alarm_filter.device_ids))
+        if alarm_filter.branch_ids:
+            query = query.filter(AlarmRollup.branch_id.in_(alarm_filter.branch_ids))
+        return query
+
+
+# 全局单例
+alarm_rollups = AlarmRollups()
+
+
+@event.listens_for(Session, "after_flush")
+def _count_changes(session, flush_context):
+    deltas = Counter()
+    conn = None
+    for obj in session.new:
+        if isinstance(obj, AlarmRecord):
+            conn = conn or session.connection()
+            key = alarm_rollups.key_of(conn, obj.timestamp, obj.alarm_type, obj.severity, obj.device_id)
+            if key is not None:
+                deltas[key] += 1
+    for obj in session.deleted:
+        if isinstance(obj, AlarmRecord):
+            conn = conn or session.connection()
+            loaded = inspect(obj).dict
+            key = alarm_rollups.key_of(conn, loaded.get("timestamp"), loaded.get("alarm_type"),
+                                       loaded.get("severity"), loaded.get("device_id"))
+            if key is not None:
+                deltas[key] -= 1
+    for obj in session.dirty:
+        if not isinstance(obj, AlarmRecord):
+            continue
+        state = inspect(obj)
+        old, new = [], []
+        for name in ("timestamp", "alarm_type", "severity", "device_id"):
+            history = state.attrs[name].history
+            value = getattr(obj, name)
+            new.append(value)
+            old.append(history.deleted[0] if history.deleted else value)
+        if old == new:
+            continue
+        conn = conn or session.connection()
+        for values, delta in ((old, -1), (new, 1)):
+            key = alarm_rollups.key_of(conn, *values)
+            if key is not None:
+                deltas[key] += delta
+    if deltas:
+        alarm_rollups.apply(conn, deltas)
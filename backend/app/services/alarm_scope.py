@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from sqlalchemy import select
+from app.core.database import SessionLocal
+from app.models.admin_user import User
+from app.models.device import Device
+from app.models.fence import ElectronicFence
+
+
+class _CachedMap:
+    """
+    A whole-table {key: value} map, reloaded after ttl_s. A key missing from the map
+    is looked up on its own and the answer, None included, is kept until the next
+    reload, so unknown keys cost one indexed query and never a full reload.
+    """
+
+    def __init__(self, statement, key_column, ttl_s: float):
+        self.statement = statement
+        self.key_column = key_column
+        self.ttl_s = ttl_s
+        self._map = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self, key, session_factory, db=None):
+        now = time.monotonic()
+        loaded_at = self._loaded_at
+        if loaded_at is None or now - loaded_at > self.ttl_s:
+            with self._lock:
+                if self._loaded_at == loaded_at:
+                    self._map = dict(self._load(self.statement, session_factory, db))
+                    self._loaded_at = now
+        mapping = self._map
+        if key not in mapping:
+            rows = self._load(self.statement.where(self.key_column == key), session_factory, db)
+            mapping[key] = rows[0][1] if rows else None
+        return mapping[key]
+
+    def _load(self, statement, session_factory, db):
+        if db is not None:
+            return db.execute(statement).all()
+        own = session_factory()
+        try:
+            return own.execute(statement).all()
+        finally:
+            own.close()
+
+
+class AlarmScope:
+    """
+    Which branch and project region an alarm belongs to.
+
+    Alarms only store device_id and fence_id. The branch is the department of the
+    device owner (users.department_id, i.e. branches.id, as used for BRANCH
+    accounts); the region is the fence's project region. Both maps are cached for
+    ALARM_SCOPE_TTL_S (default 60) seconds; a device or fence missing from them is
+    looked up by id and remembered (also when it does not exist) until the next
+    reload. Callers inside a transaction (flush hooks) pass their session or
+    connection as `db` so lookups read through it.
+    """
+
+    def __init__(self, ttl_s: float = None, session_factory=SessionLocal):
+        if ttl_s is None:
+            ttl_s = float(os.getenv("ALARM_SCOPE_TTL_S", "60"))
+        self.session_factory = session_factory
+        self._branches = _CachedMap(
+            select(Device.id, User.department_id).outerjoin(User, Device.owner_id == User.id),
+            Device.id,
+            ttl_s,
+        )
+        self._regions = _CachedMap(
+            select(ElectronicFence.id, ElectronicFence.project_region_id), ElectronicFence.id, ttl_s
+        )
+
+    def branch_of(self, device_id, db=None):
+        if device_id is None:
+            return None
+        return self._branches.get(device_id, self.session_factory, db)
+
+    def region_of(self, fence_id, db=None):
+        if fence_id is None:
+            return None
+        return self._regions.get(fence_id, self.session_factory, db)
+
+    def annotate(self, alarm: dict) -> dict:
+        """Copy of an alarm dict with its branch_id and region_id."""
+        return dict(
+            alarm,
+            branch_id=self.branch_of(alarm.get("device_id")),
+            region_id=self.region_of(alarm.get("fence_id")),
+        )
+
+
+# 全局单例
+alarm_scope = AlarmScope()
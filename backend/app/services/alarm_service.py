@@ -1,16 +1,62 @@
+import base64
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from app.models.alarm_records import AlarmRecord
 from app.models.device import Device
 from app.models.fence import ElectronicFence
 from app.schemas.alarm_schema import AlarmCreate, AlarmUpdate
+from app.services.alarm_archive import alarm_archive
+from app.services.alarm_bus import alarm_bus
+from app.services.alarm_feed import AlarmFilter
+from app.services.alarm_registry import open_alarms
 from app.utils.logger import get_logger
 from datetime import datetime
 
 logger = get_logger("AlarmService")
 
+# Seconds an API call waits for the alarm bus to write its alarm
+ALARM_WRITE_TIMEOUT = 10
+
+
+def detection_alarm_row(device_id, details: dict, image_path: str) -> dict:
+    """AlarmRecord column values for an AI detection; stamped in UTC like every stored alarm."""
+    return dict(
+        device_id=str(device_id),
+        alarm_type=details.get('type', 'unknown'),
+        severity="HIGH",  # 默认为高优先级
+        description=details.get('msg', '检测到异常'),
+        recording_path=image_path,
+        status="pending",
+        timestamp=datetime.utcnow(),
+    )
+
+
+def _sort_key(alarm):
+    """(timestamp, id) of an AlarmRecord or of an archived alarm dict."""
+    if isinstance(alarm, dict):
+        return alarm["timestamp"], alarm["id"]
+    return alarm.timestamp, alarm.id
+
+
+def encode_cursor(alarm) -> str:
+    """Opaque page cursor: the (timestamp, id) of the last alarm on the page."""
+    timestamp, alarm_id = _sort_key(alarm)
+    raw = f"{timestamp.isoformat()}|{alarm_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, alarm_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(alarm_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 class AlarmService:
-    def create_alarm(self, db: Session, alarm: AlarmCreate):
+    def create_alarm(self, db: Session, alarm: AlarmCreate, commit: bool = True):
         logger.warning(f"ALARM TRIGGERED: Device {alarm.device_id}, Type {alarm.alarm_type}")
         device = db.query(Device).filter(Device.id == alarm.device_id).first()
         if not device:
@@ -22,7 +68,7 @@ class AlarmService:
             # Prepend fence name to location coordinates
             alarm.location = f"{fence.name} {alarm.location}"
 
-        new_alarm = AlarmRecord(
+        row = dict(
             device_id=alarm.device_id,
             fence_id=alarm.fence_id,
             alarm_type=alarm.alarm_type,
@@ -31,13 +77,79 @@ class AlarmService:
             location=alarm.location,
             status=alarm.status
         )
+        if commit:
+            # Group-committed with other alarms by the bus; wait for our row to get its id
+            future = alarm_bus.publish(row)
+            if future is not None:
+                try:
+                    return AlarmRecord(**future.result(timeout=ALARM_WRITE_TIMEOUT))
+                except FutureTimeoutError:
+                    if future.cancel():
+                        # Still queued: withdrawn, so a retry cannot duplicate it
+                        logger.error(f"Alarm for device {alarm.device_id} not written within {ALARM_WRITE_TIMEOUT}s")
+                        raise HTTPException(status_code=503, detail="Alarm queue is busy, alarm not saved; retry later")
+                    # Already being written: give its transaction one more period to settle
+                    try:
+                        return AlarmRecord(**future.result(timeout=ALARM_WRITE_TIMEOUT))
+                    except FutureTimeoutError:
+                        logger.error(f"Alarm for device {alarm.device_id} still being written after"
+                                     f" {2 * ALARM_WRITE_TIMEOUT}s")
+                        raise HTTPException(status_code=504,
+                                            detail="Alarm write timed out, outcome unknown; check before retrying")
+
+        new_alarm = AlarmRecord(**row)
         db.add(new_alarm)
-        db.commit()
-        db.refresh(new_alarm)
+        db.flush()
+        open_alarms.stage_alarm(db, new_alarm)
+        if commit:
+            db.commit()
+            db.refresh(new_alarm)
+        # else: caller batches several writes into one transaction
         return new_alarm
 
-    def get_alarms(self, db: Session, skip: int = 0, limit: int = 100):
-        return db.query(AlarmRecord).order_by(AlarmRecord.timestamp.desc()).offset(skip).limit(limit).all()
+    def get_alarms(self, db: Session, skip: int = 0, limit: int = 100, alarm_filter: AlarmFilter = None,
+                   start: datetime = None, end: datetime = None):
+        query = self._filtered(db, alarm_filter, start, end)
+        return query.order_by(AlarmRecord.timestamp.desc(), AlarmRecord.id.desc()).offset(skip).limit(limit).all()
+
+    def query_alarms(self, db: Session, limit: int = 50, cursor: str = None, alarm_filter: AlarmFilter = None,
+                     start: datetime = None, end: datetime = None, include_archive: bool = False):
+        """
+        One page of alarms, newest first, and the cursor of the next page.
+
+        Keyset pagination on (timestamp, id): a page starts right after the cursor
+        row instead of skipping OFFSET rows, so with the composite indexes on
+        alarm_records every page costs the same as the first one. With
+        include_archive the page is merged with archived alarms (slow path: the
+        archive files of the range are scanned).
+        """
+        query = self._filtered(db, alarm_filter, start, end)
+        after = decode_cursor(cursor) if cursor else None
+        if after:
+            timestamp, alarm_id = after
+            # The redundant `timestamp <= x` bounds the index range scan
+            query = query.filter(
+                AlarmRecord.timestamp <= timestamp,
+                or_(AlarmRecord.timestamp < timestamp, AlarmRecord.id < alarm_id),
+            )
+        rows = query.order_by(AlarmRecord.timestamp.desc(), AlarmRecord.id.desc()).limit(limit + 1).all()
+        if include_archive:
+            hot_ids = {row.id for row in rows}
+            archived = alarm_archive.page(limit + 1, after, alarm_filter, start, end)
+            rows.extend(alarm for alarm in archived if alarm["id"] not in hot_ids)
+            rows = sorted(rows, key=_sort_key, reverse=True)[:limit + 1]
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {"items": rows[:limit], "next_cursor": next_cursor}
+
+    def _filtered(self, db: Session, alarm_filter: AlarmFilter, start: datetime, end: datetime):
+        query = db.query(AlarmRecord)
+        if alarm_filter is not None:
+            query = alarm_filter.apply(query)
+        if start is not None:
+            query = query.filter(AlarmRecord.timestamp >= start)
+        if end is not None:
+            query = query.filter(AlarmRecord.timestamp < end)
+        return query
 
     def update_alarm(self, db: Session, alarm_id: int, update_data: AlarmUpdate):
         db_alarm = db.query(AlarmRecord).filter(AlarmRecord.id == alarm_id).first()
@@ -55,6 +167,7 @@ class AlarmService:
         if update_data.severity:
             db_alarm.severity = update_data.severity
             
+        open_alarms.stage_alarm(db, db_alarm)
         db.commit()
         db.refresh(db_alarm)
         return db_alarm
@@ -63,6 +176,7 @@ class AlarmService:
         db_alarm = db.query(AlarmRecord).filter(AlarmRecord.id == alarm_id).first()
         if db_alarm:
             db.delete(db_alarm)
+            open_alarms.stage_remove(db, alarm_id)
             db.commit()
             return True
         return False
@@ -0,0 +1,513 @@
+import csv
+import itertools
+import json
+import os
+import time
+import numpy as np
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.models.device import Device
+from app.models.fence import AlarmLevel, ElectronicFence, FenceShape, ProjectRegion
+from app.schemas.device_schema import DeviceCreate
+from app.schemas.fence_schema import FenceCreate, ProjectRegionCreate
+from app.services.fence_index import fence_index
+from app.services.fence_scheduler import fence_scheduler
+from app.services.fence_service import FenceService
+from app.services.fence_state import engine_gate
+from app.utils.coord_transform import wgs84_to_gcj02_array
+from app.utils.logger import get_logger
+
+logger = get_logger("BulkImport")
+
+KINDS = ("devices", "regions", "fences")
+FORMATS = ("csv", "geojson")
+
+# Rows per multi-row INSERT / transaction
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "1000"))
+# Row errors kept in the report (all of them are counted)
+MAX_REPORTED_ERRORS = 100
+# Characters read at a time while streaming a GeoJSON FeatureCollection
+GEOJSON_READ_SIZE = 64 * 1024
+
+_JSON_DECODER = json.JSONDecoder()
+# JSON whitespace and the record separator of GeoJSON text sequences
+_JSON_SKIP = " \t\r\n\x1e"
+
+
+class RowError(ValueError):
+    pass
+
+
+# --- Parsing ---
+def iter_csv(stream):
+    """(line number, {column: value}) per data row; empty cells are left out."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {
+            k.strip().lower(): v.strip()
+            for k, v in row.items()
+            if k and isinstance(v, str) and v.strip() != ""
+        }
+
+
+class _JsonStream:
+    """
+    Reads JSON values one at a time from a text stream, so a FeatureCollection is
+    parsed feature by feature: only the value being decoded is buffered.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def peek(self) -> str:
+        """Next significant character, "" at the end of the stream."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _JSON_SKIP:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ""
+
+    def take(self, expected: str) -> str:
+        char = self.peek()
+        if not char or char not in expected:
+            raise ValueError(f"Expected {' or '.join(repr(c) for c in expected)}, got {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next read
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._read()
+
+    def rest(self) -> str:
+        """Text read from the stream but not consumed yet."""
+        return self.buffer[self.pos:]
+
+    def _read(self) -> bool:
+        text = self.stream.read(GEOJSON_READ_SIZE)
+        if not text:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+
+def iter_geojson(stream):
+    """
+    (feature number, feature) from a FeatureCollection, or from newline-delimited
+    features (GeoJSON text sequences), which are read one line at a time. The
+    features array of a collection is streamed one feature at a time; of its other
+    members only the small ones before it are kept. Raises ValueError when the file
+    does not hold a JSON object; a syntax error after the first feature ends the
+    file with a row error, so the rows before it are still imported.
+    """
+    reader = _JsonStream(stream)
+    if reader.peek() != "{":
+        raise ValueError("GeoJSON must be a FeatureCollection or Feature object")
+    reader.take("{")
+    document, n, streamed = {}, 0, False
+    try:
+        if reader.peek() == "}":
+            reader.take("}")
+        else:
+            while True:
+                key = reader.value()
+                if not isinstance(key, str):
+                    raise ValueError("Object keys must be strings")
+                reader.take(":")
+                if key == "features" and reader.peek() == "[":
+                    reader.take("[")
+                    streamed = True
+                    if reader.peek() == "]":
+                        reader.take("]")
+                    else:
+                        while True:
+                            feature = reader.value()
+                            n += 1
+                            yield n, feature
+                            if reader.take(",]") == "]":
+                                break
+                else:
+                    document[key] = reader.value()
+                if reader.take(",}") == "}":
+                    break
+    except ValueError as e:
+        if not n:
+            raise
+        yield n + 1, RowError(f"Invalid JSON: {e}")
+        return
+    if streamed or document.get("type") == "FeatureCollection":
+        return
+
+    yield 1, document
+    lines = reader.rest().splitlines(keepends=True)
+    if lines and not lines[-1].endswith(("\n", "\r")):
+        lines[-1] += stream.readline()
+    n = 1
+    for line in itertools.chain(lines, stream):
+        line = line.strip().lstrip("\x1e")
+        if line:
+            n += 1
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                yield n, RowError(f"Invalid JSON: {e}")
+
+
+def _point(lat, lng):
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise RowError(f"Coordinate out of range: {lat}, {lng}")
+    return [lat, lng]
+
+
+def _ring_from_json(text):
+    """'[[lat,lng],...]' or '[{lat,lng},...]' -> [[lat, lng], ...] (closing vertex dropped)."""
+    try:
+        raw = json.loads(text)
+        ring = [_point(p["lat"], p["lng"]) if isinstance(p, dict) else _point(p[0], p[1]) for p in raw]
+    except RowError:
+        raise
+    except Exception:
+        raise RowError("coordinates_json must be [[lat, lng], ...]")
+    return _check_ring(ring)
+
+
+def _ring_from_geometry(geometry):
+    if not geometry or geometry.get("type") != "Polygon" or not geometry.get("coordinates"):
+        raise RowError("Polygon geometry required")
+    # GeoJSON positions are [lng, lat]; only the outer ring is used
+    return _check_ring([_point(p[1], p[0]) for p in geometry["coordinates"][0]])
+
+
+def _check_ring(ring):
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    if len(ring) < 3:
+        raise RowError("A polygon needs at least 3 vertices")
+    return ring
+
+
+def _validate(schema, data):
+    try:
+        return schema(**data)
+    except ValidationError as e:
+        raise RowError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+
+def _number(value, name):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{name} must be a number")
+
+
+# --- Row builders: each returns (row dict for INSERT, list of [lat, lng] points to convert) ---
+def _device_row(data, lat, lng):
+    data = dict(data)
+    for key in ("port", "owner_id"):
+        if data.get(key) is not None:
+            data[key] = int(_number(data[key], key))
+    device = _validate(DeviceCreate, data)
+    row = device.model_dump()
+    row["is_online"] = False
+    row["last_latitude"] = row["last_longitude"] = None
+    if lat is not None and lng is not None:
+        # Kept as a list until the chunk is written, so coordinate conversion can update it
+        row["last_latitude"] = _point(lat, lng)
+        return row, [row["last_latitude"]]
+    if lat is not None or lng is not None:
+        raise RowError("Both lat and lng are required for a position")
+    return row, []
+
+
+def device_from_csv(row):
+    lat = _number(row.pop("lat", row.pop("last_latitude", None)), "lat")
+    lng = _number(row.pop("lng", row.pop("last_longitude", None)), "lng")
+    return _device_row(row, lat, lng)
+
+
+def device_from_feature(feature):
+    geometry = feature.get("geometry")
+    data = dict(feature.get("properties") or {})
+    if data.get("id") is None and feature.get("id") is not None:
+        data["id"] = feature["id"]
+    if data.get("id") is not None:
+        data["id"] = str(data["id"])
+    lat = lng = None
+    if geometry:
+        if geometry.get("type") != "Point":
+            raise RowError("Devices need a Point geometry")
+        lng, lat = geometry["coordinates"][:2]
+    return _device_row(data, lat, lng)
+
+
+def _region_row(data, ring):
+    data = dict(data, coordinates_json="[]")
+    region = _validate(ProjectRegionCreate, data)
+    row = region.model_dump()
+    row["coordinates_json"] = ring
+    return row, ring
+
+
+def region_from_csv(row):
+    if "coordinates_json" not in row:
+        raise RowError("coordinates_json is required")
+    return _region_row(row, _ring_from_json(row.pop("coordinates_json")))
+
+
+def region_from_feature(feature):
+    return _region_row(feature.get("properties") or {}, _ring_from_geometry(feature.get("geometry")))
+
+
+def _fence_row(data, shape, coordinates, region_ids):
+    data = dict(data, shape=shape, coordinates_json="[]")
+    region_name = data.pop("project_region", None)
+    if data.get("project_region_id") in (None, "") and region_name:
+        if region_name not in region_ids:
+            raise RowError(f"Unknown project region: {region_name}")
+        data["project_region_id"] = region_ids[region_name]
+    for key in ("radius", "hysteresis_m"):
+        if data.get(key) is not None:
+            data[key] = _number(data[key], key)
+    for key in ("project_region_id", "dwell_seconds"):
+        if data.get(key) not in (None, ""):
+            data[key] = int(_number(data[key], key))
+    fence = _validate(FenceCreate, data)
+    if shape == "circle" and not fence.radius:
+        raise RowError("Radius is required for circular fences")
+    if fence.project_region_id is not None and fence.project_region_id not in region_ids.values():
+        raise RowError(f"Unknown project_region_id: {fence.project_region_id}")
+    row = fence.model_dump()
+    row["shape"] = FenceShape(shape)
+    row["alarm_type"] = AlarmLevel(fence.alarm_type.value)
+    row["dwell_seconds"] = row.get("dwell_seconds") or 0
+    row["hysteresis_m"] = row.get("hysteresis_m") or 0
+    row["coordinates_json"] = coordinates
+    row["is_active"] = 1
+    row["worker_count"] = 0
+    return row, [coordinates] if shape == "circle" else coordinates
+
+
+def fence_from_csv(row, region_ids):
+    shape = (row.pop("shape", None) or "polygon").lower()
+    if "coordinates_json" not in row:
+        raise RowError("coordinates_json is required")
+    if shape == "circle":
+        try:
+            center = json.loads(row.pop("coordinates_json"))
+            coordinates = (
+                _point(center["lat"], center["lng"]) if isinstance(center, dict) else _point(center[0], center[1])
+            )
+        except RowError:
+            raise
+        except Exception:
+            raise RowError("coordinates_json of a circle must be [lat, lng]")
+    elif shape == "polygon":
+        coordinates = _ring_from_json(row.pop("coordinates_json"))
+    else:
+        raise RowError(f"Unknown shape: {shape}")
+    return _fence_row(row, shape, coordinates, region_ids)
+
+
+def fence_from_feature(feature, region_ids):
+    geometry = feature.get("geometry") or {}
+    data = dict(feature.get("properties") or {})
+    if geometry.get("type") == "Point":
+        lng, lat = geometry["coordinates"][:2]
+        return _fence_row(data, "circle", _point(lat, lng), region_ids)
+    return _fence_row(data, "polygon", _ring_from_geometry(geometry), region_ids)
+
+
+def _insert_returning_ids(db: Session, model, rows) -> list:
+    """
+    Insert rows and return their ids. Uses one INSERT ... RETURNING where the dialect
+    supports it for many rows; otherwise (MySQL) the ORM inserts them and reads each
+    row's id, since ids of a multi-row INSERT are not guaranteed to be consecutive.
+    """
+    if db.get_bind().dialect.insert_executemany_returning:
+        return list(db.execute(insert(model).returning(model.id), rows).scalars())
+    objects = [model(**row) for row in rows]
+    db.add_all(objects)
+    db.flush()
+    return [obj.id for obj in objects]
+
+
+def convert_points(points):
+    """WGS-84 -> GCJ-02 in place for a chunk's [lat, lng] lists, in one vectorized call."""
+    if not points:
+        return
+    lngs, lats = wgs84_to_gcj02_array([p[1] for p in points], [p[0] for p in points])
+    for point, lat, lng in zip(points, np.round(lats, 7).tolist(), np.round(lngs, 7).tolist()):
+        point[0], point[1] = lat, lng
+
+
+class BulkImportService:
+    """
+    Bulk import of devices, project regions and fences from CSV or GeoJSON.
+
+    Rows are validated as they are parsed (with the same schemas as the single-record
+    endpoints), collected into chunks of IMPORT_CHUNK and written with one multi-row
+    INSERT and one commit per chunk. Invalid rows are skipped and reported with their
+    line / feature number. The fence engine is updated once at the end: new fences
+    are indexed and all of them are evaluated in one recount (through the background
+    recount queue when it is running); imported device positions trigger one recount
+    of every fence.
+
+    CSV columns are the field names of the create schemas. Devices take lat / lng
+    (or last_latitude / last_longitude); regions and fences take coordinates_json as
+    in the API, and fences may name their region in a project_region column.
+    GeoJSON features carry the same fields as properties: devices are Points, regions
+    Polygons, fences Polygons or Points with a radius. coords="wgs84" converts raw GPS
+    coordinates to GCJ-02 per chunk.
+    """
+
+    def __init__(self):
+        self.fence_service = FenceService()
+
+    def run(self, db: Session, kind: str, fmt: str, stream, coords: str = "gcj02") -> dict:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown import kind: {kind}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown import format: {fmt}")
+        if coords not in ("gcj02", "wgs84"):
+            raise ValueError(f"Unsupported coordinate system: {coords}")
+
+        started = time.perf_counter()
+        report = {"kind": kind, "format": fmt, "rows": 0, "inserted": 0, "skipped": 0, "errors": []}
+        items = iter_csv(stream) if fmt == "csv" else iter_geojson(stream)
+        region_ids = {}
+        if kind == "fences":
+            region_ids = {name: region_id for region_id, name in db.query(ProjectRegion.id, ProjectRegion.name)}
+        builder = self._builder(kind, fmt, region_ids)
+
+        chunk, points, seen, new_ids = [], [], set(), []
+        for n, item in items:
+            report["rows"] += 1
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                row, row_points = builder(item)
+                if kind == "devices":
+                    if row["id"] in seen:
+                        raise RowError(f"Duplicate device id in file: {row['id']}")
+                    seen.add(row["id"])
+            except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+                self._reject(report, n, e)
+                continue
+            chunk.append((n, row))
+            points.extend(row_points)
+            if len(chunk) >= IMPORT_CHUNK:
+                new_ids += self._write(db, kind, chunk, points if coords == "wgs84" else None, report)
+                chunk, points = [], []
+        if chunk:
+            new_ids += self._write(db, kind, chunk, points if coords == "wgs84" else None, report)
+
+        if report["inserted"]:
+            report["evaluation"] = self._apply(db, kind, new_ids, report)
+        report["elapsed_s"] = round(time.perf_counter() - started, 3)
+        logger.info(
+            f"Imported {report['inserted']} {kind} from {fmt} ({report['skipped']} skipped)"
+            f" in {report['elapsed_s']}s"
+        )
+        return report
+
+    def _builder(self, kind, fmt, region_ids):
+        if kind == "devices":
+            return device_from_csv if fmt == "csv" else device_from_feature
+        if kind == "regions":
+            return region_from_csv if fmt == "csv" else region_from_feature
+        if fmt == "csv":
+            return lambda row: fence_from_csv(row, region_ids)
+        return lambda feature: fence_from_feature(feature, region_ids)
+
+    @staticmethod
+    def _reject(report, n, error):
+        report["skipped"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            message = str(error) if isinstance(error, ValueError) else f"Malformed row: {error!r}"
+            report["errors"].append({"row": n, "error": message})
+
+    def _write(self, db: Session, kind, chunk, points, report) -> list:
+        """
+        One multi-row INSERT and one commit for a chunk of validated rows. Returns the
+        ids of the inserted regions / fences.
+        """
+        if points:
+            convert_points(points)
+        if kind == "devices":
+            ids = [row["id"] for _, row in chunk]
+            existing = {r[0] for r in db.query(Device.id).filter(Device.id.in_(ids))}
+            for n, row in chunk:
+                if row["id"] in existing:
+                    self._reject(report, n, RowError(f"Device already exists: {row['id']}"))
+            chunk = [(n, row) for n, row in chunk if row["id"] not in existing]
+            for _, row in chunk:
+                if row["last_latitude"] is not None:
+                    row["last_latitude"], row["last_longitude"] = row["last_latitude"]
+            model = Device
+        else:
+            for _, row in chunk:
+                row["coordinates_json"] = json.dumps(row["coordinates_json"])
+            model = ProjectRegion if kind == "regions" else ElectronicFence
+        if not chunk:
+            return []
+        rows = [row for _, row in chunk]
+        try:
+            if kind == "devices":
+                db.execute(insert(model), rows)
+                ids = []
+            else:
+                ids = _insert_returning_ids(db, model, rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Import chunk of {len(chunk)} {kind} failed: {e}")
+            for n, _ in chunk:
+                self._reject(report, n, RowError(f"Insert failed: {e.__class__.__name__}"))
+            return []
+        report["inserted"] += len(chunk)
+        if kind == "devices":
+            report["positioned"] = report.get("positioned", 0) + sum(
+                1 for _, row in chunk if row.get("last_latitude") is not None
+            )
+        return ids
+
+    @engine_gate.shared()
+    def _apply(self, db: Session, kind, new_ids, report):
+        """Bring the fence engine up to date with the imported rows, in one evaluation."""
+        if kind == "regions":
+            return None
+        if kind == "fences":
+            fences = []
+            for i in range(0, len(new_ids), IMPORT_CHUNK):
+                ids = new_ids[i:i + IMPORT_CHUNK]
+                fences += db.query(ElectronicFence).filter(ElectronicFence.id.in_(ids)).all()
+            for fence in fences:
+                fence_index.sync_fence(db, fence)
+                fence_scheduler.register(fence)
+            self.fence_service._recount_later(db, fences, raise_alarms=True)
+        else:
+            if not report.get("positioned"):
+                return None
+            fences = db.query(ElectronicFence).all()
+            self.fence_service._recount_later(db, fences)
+        return {"fences": len(fences)}
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.models.fence import ElectronicFence, ProjectRegion
+from app.services.fence_evaluator import DevicePositions
+from app.services.fence_recount import fence_recounts
+from app.services.fence_state import fence_membership, engine_gate
+from app.utils.logger import get_logger
+
+logger = get_logger("EngineSnapshot")
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_PATH = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "data", "fence_engine.npz")
+)
+
+
+def fence_fingerprint(fence: ElectronicFence, region: ProjectRegion = None) -> str:
+    """Hash of everything that decides a fence's members (geometry, rule, region)."""
+    parts = [
+        fence.coordinates_json,
+        str(getattr(fence.shape, "value", fence.shape)),
+        fence.radius,
+        fence.behavior,
+        fence.project_region_id,
+        fence.is_active,
+        region.coordinates_json if region is not None else None,
+    ]
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def fingerprints(db: Session) -> dict:
+    """{fence_id: fingerprint} for every fence."""
+    regions = {r.id: r for r in db.query(ProjectRegion).all()}
+    return {
+        fence.id: fence_fingerprint(fence, regions.get(fence.project_region_id))
+        for fence in db.query(ElectronicFence).all()
+    }
+
+
+class SnapshotData:
+    """A loaded snapshot: device positions, fence fingerprints and members."""
+
+    def __init__(self, created_at, positions: dict, fence_fps: dict, members: dict):
+        self.created_at = created_at
+        self.positions = positions  # device_id -> (lat, lng)
+        self.fence_fps = fence_fps  # fence_id -> fingerprint
+        self.members = members  # fence_id -> set(device_id)
+
+
+class EngineSnapshot:
+    """
+    Periodic compact snapshot of the fence membership table, so a restart does not
+    have to rescan every device against every fence.
+
+    The file (numpy .npz, no pickles) holds the device positions the membership was
+    computed from, a fingerprint per fence and the members as index arrays. On warm
+    start (FenceService.warm_start) only devices whose position differs and fences
+    whose fingerprint differs are re-evaluated. The open-alarm registry and schedules
+    are always reloaded from the database (one query each).
+
+    ENGINE_SNAPSHOT_PATH sets the file (default backend/data/fence_engine.npz) and
+    ENGINE_SNAPSHOT_INTERVAL the period in seconds (default 300, 0 disables the
+    periodic snapshot). A snapshot is also written on shutdown.
+    """
+
+    def __init__(self, path: str = None, interval: float = None, session_factory=SessionLocal):
+        self.path = path or os.getenv("ENGINE_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+        if interval is None:
+            interval = float(os.getenv("ENGINE_SNAPSHOT_INTERVAL", "300"))
+        self.interval = interval
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"saved": 0, "errors": 0, "last_saved_at": None, "last_bytes": 0}
+
+    def save(self, db: Session = None) -> bool:
+        """Write a snapshot of the current state. Returns False if there is nothing to save."""
+        if not fence_membership.loaded:
+            return False
+        own = db is None
+        db = db or self.session_factory()
+        try:
+            # Positions, fingerprints and members must describe the same moment
+            with engine_gate.exclusive():
+                positions = DevicePositions.load(db)
+                fence_fps = fingerprints(db)
+                members = fence_membership.export()
+                # Members of fences with a queued recount are stale: never match on load
+                for fence_id in fence_recounts.pending_ids() & fence_fps.keys():
+                    fence_fps[fence_id] = ""
+            db.rollback()  # Release the read snapshot of the transaction
+        finally:
+            if own:
+                db.close()
+
+        ids = list(positions.ids)
+        index = {device_id: i for i, device_id in enumerate(ids)}
+        lats, lngs = list(positions.lats), list(positions.lngs)
+        member_fence, member_device = [], []
+        for fence_id, devices in members.items():
+            for device_id in devices:
+                i = index.get(device_id)
+                if i is None:
+                    # Counted without a stored position: force re-evaluation on load
+                    i = index[device_id] = len(ids)
+                    ids.append(device_id)
+                    lats.append(np.nan)
+                    lngs.append(np.nan)
+                member_fence.append(fence_id)
+                member_device.append(i)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array([SNAPSHOT_VERSION]),
+                created_at=np.array([datetime.now().isoformat()]),
+                device_ids=np.array(ids, dtype=str),
+                lats=np.asarray(lats, dtype=float),
+                lngs=np.asarray(lngs, dtype=float),
+                fence_ids=np.fromiter(fence_fps.keys(), dtype=np.int64, count=len(fence_fps)),
+                fence_fps=np.array(list(fence_fps.values()), dtype=str),
+                member_fence=np.asarray(member_fence, dtype=np.int64),
+                member_device=np.asarray(member_device, dtype=np.int64),
+            )
+        os.replace(tmp, self.path)
+
+        self.stats["saved"] += 1
+        self.stats["last_saved_at"] = datetime.now().isoformat(timespec="seconds")
+        self.stats["last_bytes"] = os.path.getsize(self.path)
+        logger.info(
+            f"Engine snapshot saved: {len(ids)} devices, {len(fence_fps)} fences,"
+            f" {len(member_fence)} members, {self.stats['last_bytes']} bytes"
+        )
+        return True
+
+    def load(self):
+        """Read the snapshot file; None if it is missing, unreadable or from another version."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data["version"][0]) != SNAPSHOT_VERSION:
+                    logger.warning(f"Ignoring engine snapshot with version {int(data['version'][0])}")
+                    return None
+                ids = [str(d) for d in data["device_ids"]]
+                positions = dict(zip(ids, zip(data["lats"].tolist(), data["lngs"].tolist())))
+                fence_fps = dict(zip(data["fence_ids"].tolist(), [str(fp) for fp in data["fence_fps"]]))
+                members = {fence_id: set() for fence_id in fence_fps}
+                for fence_id, i in zip(data["member_fence"].tolist(), data["member_device"].tolist()):
+                    members.setdefault(fence_id, set()).add(ids[i])
+                created_at = str(data["created_at"][0])
+        except Exception as e:
+            logger.error(f"Failed to read engine snapshot {self.path}: {e}")
+            return None
+        return SnapshotData(created_at, positions, fence_fps, members)
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="engine-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._save_logged()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._save_logged()
+
+    def _save_logged(self):
+        try:
+            self.save()
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Engine snapshot failed: {e}")
+
+
+# 全局单例
+engine_snapshot = EngineSnapshot()
@@ -0,0 +1,94 @@
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.device import Device
+from app.models.fence import ElectronicFence, ProjectRegion
+from app.services.fence_shards import fence_shards
+from app.services.location_store import location_store
+from app.utils.fence_geometry import geometry_cache
+
+
+class DevicePositions:
+    """Column snapshot of device positions: ids plus lat/lng float arrays."""
+
+    def __init__(self, ids, lats, lngs):
+        self.ids = list(ids)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        # Same rule as the scalar checks: a 0 / missing coordinate is "no location"
+        self.valid = (self.lats != 0) & (self.lngs != 0) & ~np.isnan(self.lats) & ~np.isnan(self.lngs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, db: Session):
+        rows = (
+            db.query(Device.id, Device.last_latitude, Device.last_longitude)
+            .filter(Device.last_latitude.isnot(None))
+            .all()
+        )
+        latest = {r[0]: (r[1], r[2]) for r in rows}
+        pending = location_store.pending()
+        if pending:
+            # Positions not flushed to the devices table yet; skip devices deleted meanwhile
+            known = {r[0] for r in db.query(Device.id).filter(Device.id.in_(pending)).all()}
+            latest.update((d, p) for d, p in pending.items() if d in known)
+        return cls(latest.keys(), [p[0] for p in latest.values()], [p[1] for p in latest.values()])
+
+
+class FenceEvaluator:
+    """
+    Batch version of FenceService.check_device_violation: evaluates every device
+    against a set of fences with NumPy masks instead of one device at a time.
+    """
+
+    def inside_mask(self, fence: ElectronicFence, positions: DevicePositions):
+        geometry = geometry_cache.fence(fence)
+        if not geometry or not len(positions):
+            return np.zeros(len(positions), dtype=bool)
+        return geometry.contains_many(positions.lats, positions.lngs) & positions.valid
+
+    def region_mask(self, region: ProjectRegion, positions: DevicePositions):
+        geometry = geometry_cache.region(region)
+        if not geometry or not len(positions):
+            return np.zeros(len(positions), dtype=bool)
+        return geometry.contains_many(positions.lats, positions.lngs) & positions.valid
+
+    def violation_mask(self, db: Session, fence: ElectronicFence, positions: DevicePositions, region_masks=None):
+        """Boolean mask of the devices violating a fence's rules."""
+        is_inside = self.inside_mask(fence, positions)
+
+        if fence.behavior == "No Entry":
+            return is_inside
+        elif fence.behavior == "No Exit":
+            # If targeted to a project region, only violate if inside region but outside fence
+            if fence.project_region_id:
+                if region_masks is None:
+                    region_masks = {}
+                if fence.project_region_id not in region_masks:
+                    region = fence.project_region
+                    if not region:
+                        region = db.query(ProjectRegion).filter(ProjectRegion.id == fence.project_region_id).first()
+                    region_masks[fence.project_region_id] = (
+                        self.region_mask(region, positions) if region else None
+                    )
+                in_region = region_masks[fence.project_region_id]
+                if in_region is None:
+                    return np.zeros(len(positions), dtype=bool)
+                return in_region & ~is_inside
+            else:
+                return ~is_inside
+        return is_inside
+
+    def violation_masks(self, db: Session, fences, positions: DevicePositions, parallel: bool = True):
+        """
+        Return {fence_id: violation mask} for many fences, sharing region masks.
+        Large jobs (full recounts) are sharded across the process pool.
+        """
+        if parallel and fence_shards.should_use(len(fences), len(positions)):
+            return fence_shards.violation_masks(db, self, fences, positions)
+        region_masks = {}
+        return {
+            fence.id: self.violation_mask(db, fence, positions, region_masks)
+            for fence in fences
+        }
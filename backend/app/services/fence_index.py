@@ -0,0 +1,112 @@
+import threading
+from sqlalchemy.orm import Session
+from app.models.fence import ElectronicFence, ProjectRegion
+from app.utils.spatial_index import GridSpatialIndex
+from app.utils.fence_geometry import geometry_cache
+from app.utils.logger import get_logger
+
+logger = get_logger("FenceIndex")
+
+
+class FenceIndex:
+    """
+    In-memory spatial index over the active fences.
+
+    Each fence is indexed by the bbox in which a device can possibly violate it:
+    - "No Entry" (and unknown behaviors): the fence's own bbox
+    - "No Exit" scoped to a project region: the region's bbox
+    - "No Exit" without a region: global, every point is a candidate
+    Fences that can never be violated (inactive, broken geometry) are not indexed.
+    """
+
+    def __init__(self):
+        self.grid = GridSpatialIndex()
+        self._boundaries = {}  # fence_id -> geometries whose boundary decides a violation
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        """Rebuild the whole index from the database (startup / recovery)."""
+        self.grid.clear()
+        self._boundaries.clear()
+        fences = db.query(ElectronicFence).filter(ElectronicFence.is_active == 1).all()
+        for fence in fences:
+            self._index_fence(db, fence)
+        self._loaded = True
+        logger.info(f"Fence index built: {len(self.grid)} of {len(fences)} active fences indexed")
+
+    def sync_fence(self, db: Session, fence: ElectronicFence):
+        """Re-index a fence after create/update."""
+        if not self._loaded:
+            return  # Will be picked up by the next full build
+        self._index_fence(db, fence)
+
+    def remove_fence(self, fence_id: int):
+        self.grid.remove(fence_id)
+        self._boundaries.pop(fence_id, None)
+
+    def sync_region(self, db: Session, region_id: int):
+        """Re-index every fence scoped to a project region after the region changed."""
+        if not self._loaded:
+            return
+        fences = db.query(ElectronicFence).filter(ElectronicFence.project_region_id == region_id).all()
+        for fence in fences:
+            self._index_fence(db, fence)
+
+    def candidates(self, db: Session, lat: float, lng: float) -> set:
+        """Return the ids of the fences a device at (lat, lng) could violate."""
+        self.ensure_loaded(db)
+        return self.grid.query(lng, lat)
+
+    def near_boundary(self, db: Session, fence_ids, lat: float, lng: float, metres: float) -> bool:
+        """
+        True if (lat, lng) is within `metres` of a boundary that decides whether a
+        device violates one of `fence_ids`: the fence itself, and for a "No Exit"
+        fence scoped to a project region, the region as well.
+        """
+        self.ensure_loaded(db)
+        for fence_id in fence_ids:
+            for geometry in self._boundaries.get(fence_id, ()):
+                if geometry.boundary_distance(lat, lng) <= metres:
+                    return True
+        return False
+
+    def _index_fence(self, db: Session, fence: ElectronicFence):
+        self.grid.remove(fence.id)
+        self._boundaries.pop(fence.id, None)
+        if not fence.is_active:
+            return
+
+        geometry = geometry_cache.fence(fence)
+        if fence.behavior == "No Exit":
+            if fence.project_region_id:
+                region = fence.project_region
+                if not region:
+                    region = db.query(ProjectRegion).filter(ProjectRegion.id == fence.project_region_id).first()
+                region_geometry = geometry_cache.region(region) if region else None
+                bbox = region_geometry.bbox if region_geometry else None
+                if bbox:
+                    self._boundaries[fence.id] = tuple(g for g in (geometry, region_geometry) if g)
+            else:
+                if geometry:
+                    self._boundaries[fence.id] = (geometry,)
+                self.grid.insert_global(fence.id)
+                return
+        else:
+            bbox = geometry.bbox if geometry else None
+            if bbox:
+                self._boundaries[fence.id] = (geometry,)
+
+        if bbox:
+            self.grid.insert(fence.id, bbox)
+
+
+# 全局单例
+fence_index = FenceIndex()
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from app.utils.logger import get_logger
+
+logger = get_logger("FenceRecount")
+
+
+class RecountQueue:
+    """
+    Background worker_count recounts after fence / region edits.
+
+    A recount scans every device, so running it inside the HTTP request makes edit
+    latency grow with the fleet and lets rapid edits from the map editor queue up
+    full scans. Edits call schedule() instead, which only records the fence ids and
+    returns. Requests for the same fence are coalesced: the recount runs once the
+    fence has been quiet for RECOUNT_DELAY_S (default 0.5), but never later than
+    RECOUNT_MAX_DELAY_S (default 5) after its first pending edit. Everything due at
+    the same moment is recounted in one vectorized pass by on_recount(fence_ids,
+    raise_alarms).
+
+    status(fence_id) reports "pending", "running", "done", "failed" or "idle"; a
+    finished state is kept for RECOUNT_STATUS_TTL_S (default 3600) and then reads
+    "idle" again, so deleted / long-settled fences do not accumulate.
+    Without the worker thread (scripts, benchmarks) schedule() returns None and the
+    caller recounts synchronously as before.
+    """
+
+    def __init__(self, delay_s: float = None, max_delay_s: float = None, status_ttl_s: float = None):
+        if delay_s is None:
+            delay_s = float(os.getenv("RECOUNT_DELAY_S", "0.5"))
+        if max_delay_s is None:
+            max_delay_s = float(os.getenv("RECOUNT_MAX_DELAY_S", "5"))
+        if status_ttl_s is None:
+            status_ttl_s = float(os.getenv("RECOUNT_STATUS_TTL_S", "3600"))
+        self.delay_s = delay_s
+        self.max_delay_s = max(max_delay_s, delay_s)
+        self.status_ttl_s = status_ttl_s
+        self._pending = {}  # fence_id -> {"first": t, "due": t, "raise_alarms": bool, "requests": n, "requested_at": dt}
+        self._running = set()
+        self._done = {}  # fence_id -> (completed_at, "done" | "failed")
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        self.on_recount = None
+        self.stats = {"requested": 0, "coalesced": 0, "runs": 0, "fences": 0, "errors": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def schedule(self, fence_ids, raise_alarms: bool = False):
+        """
+        Queue a recount for `fence_ids`. Returns "pending", or None when the worker is
+        not running and the caller has to recount itself.
+        """
+        if not self.running:
+            return None
+        now = time.monotonic()
+        with self._cond:
+            for fence_id in fence_ids:
+                self.stats["requested"] += 1
+                entry = self._pending.get(fence_id)
+                if entry is None:
+                    self._pending[fence_id] = {
+                        "first": now,
+                        "due": now + self.delay_s,
+                        "raise_alarms": raise_alarms,
+                        "requests": 1,
+                        "requested_at": datetime.now(),
+                    }
+                    continue
+                self.stats["coalesced"] += 1
+                entry["due"] = min(now + self.delay_s, entry["first"] + self.max_delay_s)
+                entry["raise_alarms"] = entry["raise_alarms"] or raise_alarms
+                entry["requests"] += 1
+            self._cond.notify_all()
+        return "pending"
+
+    def cancel(self, fence_id):
+        """Forget a deleted fence."""
+        with self._cond:
+            self._pending.pop(fence_id, None)
+            self._done.pop(fence_id, None)
+
+    def pending_ids(self) -> set:
+        """Fences whose stored count / membership is about to be replaced."""
+        with self._cond:
+            return set(self._pending) | self._running
+
+    def status(self, fence_id) -> dict:
+        """{"fence_id", "state": pending | running | done | failed | idle, ...}"""
+        with self._cond:
+            entry = self._pending.get(fence_id)
+            if entry is not None:
+                return {
+                    "fence_id": fence_id,
+                    "state": "pending",
+                    "requested_at": entry["requested_at"].isoformat(timespec="milliseconds"),
+                    "requests": entry["requests"],
+                }
+            if fence_id in self._running:
+                return {"fence_id": fence_id, "state": "running"}
+            finished = self._done.get(fence_id)
+        if finished is not None:
+            completed_at, state = finished
+            return {"fence_id": fence_id, "state": state, "completed_at": completed_at.isoformat(timespec="milliseconds")}
+        return {"fence_id": fence_id, "state": "idle"}
+
+    def state(self, fence_id) -> str:
+        return self.status(fence_id)["state"]
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Block until nothing is pending or running. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def snapshot_stats(self) -> dict:
+        with self._cond:
+            return dict(self.stats, pending=len(self._pending), running=len(self._running))
+
+    def start(self, on_recount=None):
+        if on_recount is not None:
+            self.on_recount = on_recount
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fence-recount", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker; recounts still pending are run before it exits."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                stopping = self._stop.is_set()
+                due = [fid for fid, e in self._pending.items() if stopping or e["due"] <= now]
+                if not due:
+                    if stopping:
+                        return
+                    timeout = min((e["due"] for e in self._pending.values()), default=None)
+                    self._cond.wait(timeout=None if timeout is None else max(timeout - now, 0))
+                    continue
+                groups = {True: [], False: []}
+                for fence_id in due:
+                    entry = self._pending.pop(fence_id)
+                    groups[entry["raise_alarms"]].append(fence_id)
+                self._running.update(due)
+
+            results = {}
+            for raise_alarms, fence_ids in groups.items():
+                if not fence_ids:
+                    continue
+                state = "done"
+                try:
+                    self.on_recount(fence_ids, raise_alarms)
+                    self.stats["runs"] += 1
+                    self.stats["fences"] += len(fence_ids)
+                except Exception as e:
+                    state = "failed"
+                    self.stats["errors"] += 1
+                    logger.error(f"Recount of fences {fence_ids} failed: {e}")
+                results.update((fence_id, state) for fence_id in fence_ids)
+
+            completed = datetime.now()
+            expired = completed - timedelta(seconds=self.status_ttl_s)
+            with self._cond:
+                self._running.difference_update(due)
+                for fence_id in [fid for fid, (at, _) in self._done.items() if at < expired]:
+                    del self._done[fence_id]
+                for fence_id, state in results.items():
+                    self._done[fence_id] = (completed, state)
+                self._cond.notify_all()
+
+
+# 全局单例
+fence_recounts = RecountQueue()
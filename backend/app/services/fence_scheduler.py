@@ -0,0 +1,165 @@
+import heapq
+import threading
+from datetime import datetime, time, timedelta
+from app.utils.logger import get_logger
+
+logger = get_logger("FenceScheduler")
+
+# Ranges are inclusive of the end minute's first instant, so a fence switches off just after it
+_END_EPSILON = timedelta(microseconds=1)
+
+
+def parse_time_str(time_str: str) -> time:
+    """Parse 'HH:mm' or 'HH.mm' style strings."""
+    ts = time_str.strip().replace('.', ':')
+    parts = ts.split(':')
+    h = int(parts[0])
+    m = int(parts[1]) if len(parts) > 1 else 0
+    return time(h, m)
+
+
+class CompiledSchedule:
+    """effective_time (e.g. "5.00-23.00", overnight "22.00-6.00") parsed once."""
+
+    def __init__(self, effective_time):
+        self.start = None
+        self.end = None  # None -> always active
+        if not effective_time or '-' not in effective_time:
+            return
+        try:
+            start_str, end_str = effective_time.split('-')
+            self.start = parse_time_str(start_str)
+            self.end = parse_time_str(end_str)
+        except Exception as e:
+            logger.error(f"Error parsing fence time '{effective_time}': {e}")
+            self.start = self.end = None
+
+    @property
+    def always_active(self) -> bool:
+        return self.start is None
+
+    def is_active_at(self, moment: datetime) -> bool:
+        if self.always_active:
+            return True
+        now = moment.time()
+        if self.start <= self.end:
+            return self.start <= now <= self.end
+        else:  # Overnight range
+            return now >= self.start or now <= self.end
+
+    def next_transition(self, moment: datetime):
+        """First instant after `moment` at which is_active_at() may change (None if never)."""
+        if self.always_active:
+            return None
+        candidates = []
+        for day in (moment.date(), moment.date() + timedelta(days=1)):
+            candidates.append(datetime.combine(day, self.start))
+            candidates.append(datetime.combine(day, self.end) + _END_EPSILON)
+        return min(c for c in candidates if c > moment)
+
+
+class FenceScheduler:
+    """
+    Keeps every fence's "inside its effective_time window" flag as a plain boolean.
+
+    Schedules are compiled once per effective_time string. A heap holds each fence's
+    next transition; a background thread wakes exactly at those boundaries, flips the
+    flags and calls on_transition(fence_ids) once per boundary so counts are rewritten
+    in one go. A reader that sees a boundary the thread has not handled yet evaluates
+    the compiled schedule directly, so answers stay correct without the thread.
+    """
+
+    def __init__(self):
+        self._entries = {}  # fence_id -> [source, schedule, active, valid_until, generation]
+        self._heap = []  # (transition_at, fence_id, generation)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        self.on_transition = None
+
+    def is_active(self, fence) -> bool:
+        entry = self._entries.get(fence.id)
+        if entry is None or entry[0] != fence.effective_time:
+            entry = self.register(fence)
+        if entry[3] is not None:
+            now = datetime.now()
+            if now >= entry[3]:
+                # Boundary passed but the timer thread has not flipped it yet
+                return entry[1].is_active_at(now)
+        return entry[2]
+
+    def register(self, fence):
+        """Compile (or recompile) a fence's schedule and queue its next transition."""
+        with self._cond:
+            entry = self._entries.get(fence.id)
+            generation = entry[4] + 1 if entry else 0
+            now = datetime.now()
+            schedule = CompiledSchedule(fence.effective_time)
+            valid_until = schedule.next_transition(now)
+            entry = [fence.effective_time, schedule, schedule.is_active_at(now), valid_until, generation]
+            self._entries[fence.id] = entry
+            if valid_until is not None:
+                heapq.heappush(self._heap, (valid_until, fence.id, generation))
+                self._cond.notify()
+            return entry
+
+    def load(self, fences):
+        for fence in fences:
+            self.register(fence)
+
+    def remove(self, fence_id):
+        with self._cond:
+            self._entries.pop(fence_id, None)
+
+    def start(self, on_transition=None):
+        if on_transition is not None:
+            self.on_transition = on_transition
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fence-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            changed = []
+            with self._cond:
+                now = datetime.now()
+                while self._heap and self._heap[0][0] <= now:
+                    _, fence_id, generation = heapq.heappop(self._heap)
+                    entry = self._entries.get(fence_id)
+                    if entry is None or entry[4] != generation:
+                        continue  # Stale: fence re-registered or removed
+                    before = entry[2]
+                    entry[2] = entry[1].is_active_at(now)
+                    entry[3] = entry[1].next_transition(now)
+                    entry[4] += 1
+                    if entry[3] is not None:
+                        heapq.heappush(self._heap, (entry[3], fence_id, entry[4]))
+                    if entry[2] != before:
+                        changed.append(fence_id)
+                if not changed:
+                    timeout = None
+                    if self._heap:
+                        timeout = max((self._heap[0][0] - now).total_seconds(), 0)
+                    self._cond.wait(timeout=timeout)
+                    continue
+
+            if self.on_transition:
+                logger.info(f"Schedule transition for fences {changed}")
+                try:
+                    self.on_transition(changed)
+                except Exception as e:
+                    logger.error(f"Schedule transition handler failed: {e}")
+
+
+# 全局单例
+fence_scheduler = FenceScheduler()
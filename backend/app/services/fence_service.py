@@ -1,19 +1,58 @@
-import json
-import math
+import threading
 from datetime import datetime, time
+from typing import List
+import numpy as np
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from app.models.fence import ElectronicFence, ProjectRegion
 from app.models.device import Device
-from app.schemas.fence_schema import FenceCreate, FenceUpdate, ProjectRegionCreate, ProjectRegionUpdate
+from app.schemas.fence_schema import (
+    FenceCreate, FenceUpdate, ProjectRegionCreate, ProjectRegionUpdate, LocationPing
+)
 from app.schemas.alarm_schema import AlarmCreate
+from app.services.alarm_bus import alarm_bus
+from app.services.alarm_feed import alarm_feed
 from app.services.alarm_service import AlarmService
+from app.services.alarm_registry import open_alarms
+from app.services.alarm_rollup import alarm_rollups
+from app.services.fence_index import fence_index
+from app.services.fence_recount import fence_recounts
+from app.services.fence_evaluator import DevicePositions, FenceEvaluator
+from app.services.fence_state import fence_membership, fence_debouncer, engine_gate
+from app.services.engine_snapshot import engine_snapshot, fingerprints
+from app.services.ingest_filter import ingest_filter
+from app.services.fence_scheduler import fence_scheduler, parse_time_str
+from app.services.location_store import location_store
+from app.services.track_store import track_store
+from app.core.database import SessionLocal
+from app.utils.fence_geometry import geometry_cache, haversine, point_in_polygon
 from app.utils.logger import get_logger
 from app.models.alarm_records import AlarmRecord
 
 logger = get_logger("FenceService")
 
+# Rows per multi-row INSERT statement when materializing fence alarms
+ALARM_INSERT_CHUNK = 1000
+
+# Degrees (about 1 m); a position stored as FLOAT reads back within this of the snapshot
+SNAPSHOT_POSITION_TOLERANCE = 1e-5
+
+# Serializes the lazy full recount that seeds the membership table
+_state_lock = threading.Lock()
+
+
+def _local_time(ts):
+    """Device timestamps may be timezone-aware; the engine compares naive local times."""
+    if ts is not None and ts.tzinfo is not None:
+        return ts.astimezone().replace(tzinfo=None)
+    return ts
+
 
 class FenceService:
+    def __init__(self):
+        self.evaluator = FenceEvaluator()
+
     # --- Project Region CRUD ---
     def create_project_region(self, db: Session, region_data: ProjectRegionCreate):
         logger.info(f"Creating new project region: {region_data.name}")
@@ -30,6 +69,7 @@ class FenceService:
     def get_project_regions(self, db: Session, skip: int = 0, limit: int = 100):
         return db.query(ProjectRegion).offset(skip).limit(limit).all()
 
+    @engine_gate.shared()
     def update_project_region(self, db: Session, region_id: int, region_data: ProjectRegionUpdate):
         db_region = db.query(ProjectRegion).filter(ProjectRegion.id == region_id).first()
         if not db_region:
@@ -41,33 +81,38 @@ class FenceService:
         
         db.commit()
         db.refresh(db_region)
+        geometry_cache.invalidate_region(region_id)
+        fence_index.sync_region(db, region_id)
+        self._recount_later(db, db_region.fences)
         return db_region
 
+    @engine_gate.shared()
     def delete_project_region(self, db: Session, region_id: int):
         db_region = db.query(ProjectRegion).filter(ProjectRegion.id == region_id).first()
         if db_region:
+            fence_ids = [f.id for f in db_region.fences]
             # Set project_region_id to NULL for associated fences
             db.query(ElectronicFence).filter(ElectronicFence.project_region_id == region_id).update({"project_region_id": None})
             db.delete(db_region)
             db.commit()
+            geometry_cache.invalidate_region(region_id)
+            # Unscoped "No Exit" fences become global candidates
+            fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(fence_ids)).all()
+            for fence in fences:
+                fence_index.sync_fence(db, fence)
+            self._recount_later(db, fences)
             return True
         return False
 
     def is_device_inside_project_region(self, region: ProjectRegion, device: Device) -> bool:
         if not device.last_latitude or not device.last_longitude:
             return False
-        try:
-            poly_points = json.loads(region.coordinates_json)
-            poly = []
-            for p in poly_points:
-                if isinstance(p, list) and len(p) >= 2:
-                    poly.append((float(p[1]), float(p[0])))
-                elif isinstance(p, dict):
-                    poly.append((float(p.get("lng")), float(p.get("lat"))))
-            return self._is_inside_polygon((device.last_longitude, device.last_latitude), poly)
-        except Exception:
+        geometry = geometry_cache.region(region)
+        if not geometry:
             return False
+        return geometry.contains(device.last_latitude, device.last_longitude)
 
+    @engine_gate.shared()
     def create_fence(self, db: Session, fence_data: FenceCreate):
         logger.info(f"Creating new fence: {fence_data.name} ({fence_data.shape})")
 
@@ -85,10 +130,13 @@ class FenceService:
             effective_time=fence_data.effective_time,
             remark=fence_data.remark,
             alarm_type=fence_data.alarm_type,
+            dwell_seconds=fence_data.dwell_seconds or 0,
+            hysteresis_m=fence_data.hysteresis_m or 0,
         )
         db.add(new_fence)
         db.commit()
         db.refresh(new_fence)
+        fence_index.sync_fence(db, new_fence)
 
         # Immediate check for existing devices
         self._check_existing_devices(db, new_fence)
@@ -96,22 +144,29 @@ class FenceService:
         return new_fence
 
     def _check_existing_devices(self, db: Session, fence: ElectronicFence):
-        """Check all devices against the newly created fence."""
+        """Check all devices against a newly created or edited fence (bulk path, in the background)."""
         logger.info(f"Checking existing devices for fence {fence.name}")
-        devices = (
-            db.query(Device)
-            .filter(Device.last_latitude.isnot(None), Device.last_longitude.isnot(None))
-            .all()
-        )
+        self._recount_later(db, [fence], raise_alarms=True)
 
-        count = 0
-        for device in devices:
-            if self.check_device_against_fence(db, fence, device):
-                count += 1
-        
-        self._update_fence_count(db, fence)
-        logger.info(f"Fence creation check: Triggered {count} alarms.")
+    def _recount_later(self, db: Session, fences, raise_alarms: bool = False):
+        """Hand a recount to the background queue; recount in place if it is not running."""
+        if not fences:
+            return
+        if fence_recounts.schedule([fence.id for fence in fences], raise_alarms=raise_alarms) is None:
+            self._update_fence_counts(db, fences, raise_alarms=raise_alarms)
 
+    @engine_gate.shared()
+    def apply_recounts(self, fence_ids, raise_alarms: bool = False, session_factory=SessionLocal):
+        """Recount queue callback: recount the given fences in one pass."""
+        db = session_factory()
+        try:
+            fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(fence_ids)).all()
+            if fences:
+                self._update_fence_counts(db, fences, raise_alarms=raise_alarms)
+        finally:
+            db.close()
+
+    @engine_gate.shared()
     def update_fence(self, db: Session, fence_id: int, fence_data: FenceUpdate):
         logger.info(f"Updating fence ID: {fence_id}")
         db_fence = (
@@ -126,13 +181,18 @@ class FenceService:
             setattr(db_fence, key, value)
 
         db.commit()
-        self._update_fence_count(db, db_fence)
+        geometry_cache.invalidate_fence(fence_id)
+        fence_index.sync_fence(db, db_fence)
+        fence_debouncer.remove_fence(fence_id)
+        fence_scheduler.register(db_fence)
+        self._check_existing_devices(db, db_fence)
         db.refresh(db_fence)
         return db_fence
 
     def get_fences(self, db: Session, skip: int = 0, limit: int = 100):
         return db.query(ElectronicFence).offset(skip).limit(limit).all()
 
+    @engine_gate.shared()
     def delete_fence(self, db: Session, fence_id: int):
         db_fence = (
             db.query(ElectronicFence).filter(ElectronicFence.id == fence_id).first()
@@ -140,117 +200,498 @@ class FenceService:
         if db_fence:
             # Set fence_id to NULL for associated alarms instead of deleting them
             db.query(AlarmRecord).filter(AlarmRecord.fence_id == fence_id).update({"fence_id": None})
+            open_alarms.stage_remove_fence(db, fence_id)
             db.delete(db_fence)
             db.commit()
+            geometry_cache.invalidate_fence(fence_id)
+            fence_index.remove_fence(fence_id)
+            fence_membership.remove_fence(fence_id)
+            fence_debouncer.remove_fence(fence_id)
+            fence_scheduler.remove(fence_id)
+            fence_recounts.cancel(fence_id)
             return True
         return False
 
+    @engine_gate.shared()
     def check_fence_status(self, db: Session, device_id: str, lat: float, lng: float):
         """
         Check if a specific device (with new coordinates) violates any active fence.
         This is typically called by a location update stream.
         """
-        # Update device location first
+        # Seed the membership table first: its full recount commits, which would
+        # expire the in-memory position set below
+        self._ensure_state(db)
+
         device = db.query(Device).filter(Device.id == device_id).first()
-        if device:
-            device.last_latitude = lat
-            device.last_longitude = lng
-            db.commit()  # Save the new location
-        else:
+        if not device:
             logger.warning(f"Device {device_id} not found during fence check.")
+            # Keep the ingest filter from dropping (and recording as track) its next pings
+            ingest_filter.forget(device_id)
             return
 
-        active_fences = (
-            db.query(ElectronicFence).filter(ElectronicFence.is_active == 1).all()
+        # The location is buffered and flushed to the devices table in bulk later;
+        # the loaded row only reflects it in memory so it is not written by this session.
+        location_store.update(device.id, lat, lng)
+        track_store.record(device.id, lat, lng)
+        set_committed_value(device, "last_latitude", lat)
+        set_committed_value(device, "last_longitude", lng)
+
+        self._evaluate_device(db, device, ts=datetime.now())
+
+    @engine_gate.shared()
+    def check_fence_status_batch(self, db: Session, pings: List[LocationPing]) -> dict:
+        """
+        Batch version of check_fence_status for gateways that deliver bursts of positions.
+
+        Device locations go to the write-behind location store, every point is appended
+        to the trajectory store and evaluated against the candidate fences in one
+        vectorized pass (so a device that crosses a boundary and back inside the burst
+        still raises its alarm), membership uses each device's newest point, and
+        everything is committed once.
+        """
+        result = {"status": "checked", "accepted": 0, "devices": 0, "unknown_devices": []}
+        if not pings:
+            return result
+
+        # Order by device timestamp when every point carries one, else keep arrival order.
+        # Gateways mix offset-aware and naive timestamps: compare them on one clock
+        if all(p.ts is not None for p in pings):
+            pings = sorted(pings, key=lambda p: _local_time(p.ts))
+
+        requested = {p.device_id for p in pings}
+        known = {row[0] for row in db.query(Device.id).filter(Device.id.in_(requested)).all()}
+        unknown = sorted(requested - known)
+        if unknown:
+            logger.warning(f"Batch fence check: {len(unknown)} unknown devices skipped")
+            for device_id in unknown:
+                ingest_filter.forget(device_id)
+        pings = [p for p in pings if p.device_id in known]
+        result["unknown_devices"] = unknown
+        if not pings:
+            return result
+
+        self._ensure_state(db)
+
+        for p in pings:
+            track_store.record(p.device_id, p.lat, p.lng, p.ts)
+
+        latest = {}  # device_id -> index of its newest point
+        for i, p in enumerate(pings):
+            latest[p.device_id] = i
+
+        devices = {d.id: d for d in db.query(Device).filter(Device.id.in_(latest)).all()}
+        for device_id, i in list(latest.items()):
+            ping = pings[i]
+            if not location_store.update(device_id, ping.lat, ping.lng, ping.ts):
+                # A newer position is already buffered: its points still raise alarms,
+                # but they must not move the device backwards in the membership table
+                del latest[device_id]
+                continue
+            set_committed_value(devices[device_id], "last_latitude", ping.lat)
+            set_committed_value(devices[device_id], "last_longitude", ping.lng)
+
+        positions = DevicePositions(
+            [p.device_id for p in pings], [p.lat for p in pings], [p.lng for p in pings]
+        )
+        evaluate_ids = set()
+        for p in pings:
+            evaluate_ids |= fence_index.candidates(db, p.lat, p.lng)
+        for device_id in latest:
+            evaluate_ids |= fence_membership.fences_of(device_id) | fence_debouncer.pending_fences(device_id)
+
+        fences = []
+        if evaluate_ids:
+            fences = (
+                db.query(ElectronicFence)
+                .filter(ElectronicFence.id.in_(evaluate_ids), ElectronicFence.is_active == 1)
+                .all()
+            )
+        masks = self.evaluator.violation_masks(db, fences, positions)
+
+        latest_idx = np.fromiter(latest.values(), dtype=int, count=len(latest))
+        violating = {device_id: set() for device_id in latest}
+        alarms = 0
+        now = datetime.now()
+        for fence in fences:
+            mask = masks[fence.id]
+            if self._is_debounced(fence):
+                alarm_idx = self._debounce_points(db, fence, pings, mask, latest, violating, now)
+            else:
+                for i in latest_idx[mask[latest_idx]]:
+                    violating[positions.ids[i]].add(fence.id)
+                alarm_idx = np.nonzero(mask)[0]
+
+            if not self.is_fence_active_now(fence):
+                continue
+            alarmed = set()
+            for i in alarm_idx:
+                device_id = positions.ids[i]
+                if device_id in alarmed:
+                    continue
+                alarmed.add(device_id)
+                if self._raise_fence_alarm(
+                    db, fence, devices[device_id], lat=pings[i].lat, lng=pings[i].lng, commit=False
+                ):
+                    alarms += 1
+
+        changed = set()
+        for device_id, fence_ids in violating.items():
+            evaluated = fence_ids | fence_membership.fences_of(device_id)
+            changed.update(fence_membership.update_device(device_id, evaluated, fence_ids))
+        self._write_counts(db, [f for f in fences if f.id in changed])
+        db.commit()
+
+        logger.info(f"Batch fence check: {len(pings)} points, {len(devices)} devices, {alarms} alarms")
+        result["accepted"] = len(pings)
+        result["devices"] = len(devices)
+        return result
+
+    @engine_gate.shared()
+    def warm_start(self, db: Session):
+        """
+        Startup from the engine snapshot: restore the membership table and re-evaluate
+        only what changed since it was written (moved / new devices, edited / new
+        fences). Falls back to the full warm_up() without a usable snapshot.
+        """
+        snapshot = engine_snapshot.load()
+        if snapshot is None:
+            self.warm_up(db)
+            return
+
+        fence_index.rebuild(db)
+        fences = db.query(ElectronicFence).all()
+        fence_scheduler.load(fences)
+        open_alarms.warm_up(db)
+
+        with _state_lock:
+            current_fps = fingerprints(db)
+            unchanged = [f for f in fences if f.is_active and snapshot.fence_fps.get(f.id) == current_fps[f.id]]
+            unchanged_ids = {f.id for f in unchanged}
+            changed = [f for f in fences if f.id not in unchanged_ids]
+
+            positions = DevicePositions.load(db)
+            present = set(positions.ids)
+            # The columns are single-precision FLOAT on MySQL: compare within a tolerance,
+            # a device without a snapshot position (NaN) always counts as moved
+            missing = (np.nan, np.nan)
+            saved = np.array([snapshot.positions.get(d, missing) for d in positions.ids], dtype=float).reshape(-1, 2)
+            same = (
+                np.isclose(saved[:, 0], positions.lats, rtol=0, atol=SNAPSHOT_POSITION_TOLERANCE)
+                & np.isclose(saved[:, 1], positions.lngs, rtol=0, atol=SNAPSHOT_POSITION_TOLERANCE)
+            )
+            moved = np.flatnonzero(~same).tolist()
+            moved_ids = {positions.ids[i] for i in moved}
+
+            fence_membership.clear()
+            masks = {}
+            if moved and unchanged:
+                subset = DevicePositions(
+                    [positions.ids[i] for i in moved], positions.lats[moved], positions.lngs[moved]
+                )
+                masks = self.evaluator.violation_masks(db, unchanged, subset)
+            for fence in unchanged:
+                members = (snapshot.members.get(fence.id, set()) & present) - moved_ids
+                if fence.id in masks:
+                    members |= {subset.ids[i] for i in masks[fence.id].nonzero()[0]}
+                fence_membership.set_fence(fence.id, members)
+
+            # Edited, new or disabled fences get a full recount of their own
+            self._update_fence_counts(db, changed, positions)
+            self._write_counts(db, fences)
+            db.commit()
+            fence_membership.loaded = True
+        logger.info(
+            f"Warm start from snapshot of {snapshot.created_at}: {len(moved)} of {len(positions)} devices"
+            f" and {len(changed)} of {len(fences)} fences re-evaluated"
         )
-        for fence in active_fences:
-            if self.is_fence_active_now(fence):
-                self.check_device_against_fence(db, fence, device)
-            self._update_fence_count(db, fence)
+
+    def _debounce_points(self, db: Session, fence: ElectronicFence, pings, mask, latest, violating, now):
+        """
+        Batch path for a fence with dwell / hysteresis: walk each device's points in
+        order through fence_debouncer, record its final state in `violating` and
+        return the indices of the points at which it was a confirmed violator.
+        Devices whose points were all older than their buffered position are skipped.
+        """
+        members = fence_membership.members(fence.id)
+        relevant = {pings[i].device_id for i in np.nonzero(mask)[0]}
+        relevant |= members | fence_debouncer.pending(fence.id)
+        relevant &= latest.keys()
+
+        state = {device_id: device_id in members for device_id in relevant}
+        alarm_idx = []
+        for i, p in enumerate(pings):
+            if p.device_id not in state:
+                continue
+            state[p.device_id] = fence_debouncer.decide(
+                p.device_id, fence, bool(mask[i]), state[p.device_id], _local_time(p.ts) or now,
+                lambda metres, p=p: self._near_boundary(db, fence, p.lat, p.lng, metres),
+            )
+            if state[p.device_id]:
+                alarm_idx.append(i)
+        for device_id, is_violating in state.items():
+            if is_violating:
+                violating[device_id].add(fence.id)
+        return alarm_idx
+
+    def warm_up(self, db: Session):
+        """Build the fence index, schedules, open-alarm registry and membership table (startup)."""
+        fence_index.rebuild(db)
+        fence_scheduler.load(db.query(ElectronicFence).all())
+        open_alarms.warm_up(db)
+        with _state_lock:
+            self.recount_all_fences(db)
+
+    @engine_gate.shared()
+    def sync_device(self, db: Session, device: Device):
+        """Re-evaluate a device whose location was edited directly, without raising alarms."""
+        ingest_filter.forget(device.id)
+        self._evaluate_device(db, device, raise_alarms=False, debounce=False)
+
+    @engine_gate.shared()
+    def forget_device(self, db: Session, device_id: str):
+        """Drop a deleted device from the membership table and fix the affected counts."""
+        ingest_filter.forget(device_id)
+        fence_debouncer.remove_device(device_id)
+        fence_ids = fence_membership.remove_device(device_id)
+        if not fence_ids:
+            return
+        fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(fence_ids)).all()
+        self._write_counts(db, fences)
+        db.commit()
+
+    def _ensure_state(self, db: Session):
+        if fence_membership.loaded:
+            return
+        with _state_lock:
+            if not fence_membership.loaded:
+                self.recount_all_fences(db)
+
+    def _evaluate_device(
+        self, db: Session, device: Device, raise_alarms: bool = True, debounce: bool = True, ts=None
+    ):
+        """
+        Incremental path: re-evaluate one device and patch the membership table.
+        Only the fences whose bbox contains the new point, plus the fences the device
+        was counted in (or is in the dwell time of) before, are looked at; worker_count
+        is rewritten only for fences whose membership actually changed.
+        With debounce, fences with dwell_seconds / hysteresis_m go through fence_debouncer.
+        """
+        self._ensure_state(db)
+
+        candidate_ids = set()
+        if device.last_latitude is not None and device.last_longitude is not None:
+            candidate_ids = fence_index.candidates(db, device.last_latitude, device.last_longitude)
+        current_ids = fence_membership.fences_of(device.id)
+        evaluate_ids = candidate_ids | current_ids | fence_debouncer.pending_fences(device.id)
+        if not evaluate_ids:
+            return
+        ts = ts or datetime.now()
+
+        fences = (
+            db.query(ElectronicFence)
+            .filter(ElectronicFence.id.in_(evaluate_ids), ElectronicFence.is_active == 1)
+            .all()
+        )
+        violating_ids = set()
+        alarms = 0
+        for fence in fences:
+            # Outside the fence's bbox: cannot violate it
+            violating = fence.id in candidate_ids and self.check_device_violation(db, fence, device)
+            if debounce and self._is_debounced(fence):
+                violating = fence_debouncer.decide(
+                    device.id, fence, violating, fence.id in current_ids, ts,
+                    lambda metres, f=fence: self._near_boundary(
+                        db, f, device.last_latitude, device.last_longitude, metres
+                    ),
+                )
+            if violating:
+                violating_ids.add(fence.id)
+                if raise_alarms and self.is_fence_active_now(fence):
+                    # One commit for the whole ping (committing here would also expire `device`)
+                    alarms += self._raise_fence_alarm(db, fence, device, commit=False)
+
+        deltas = fence_membership.update_device(device.id, {f.id for f in fences}, violating_ids)
+        if deltas:
+            self._write_counts(db, [f for f in fences if f.id in deltas])
+        if deltas or alarms:
+            db.commit()
+
+    def _is_debounced(self, fence: ElectronicFence) -> bool:
+        return bool(fence.dwell_seconds) or bool(fence.hysteresis_m)
+
+    def _near_boundary(self, db: Session, fence: ElectronicFence, lat, lng, metres: float) -> bool:
+        """
+        Hysteresis band test for a device counted in `fence` whose point no longer
+        violates it: still within `metres` of the fence boundary (and, for a
+        region-scoped No Exit fence, still inside the region).
+        """
+        if lat is None or lng is None:
+            return False
+        geometry = geometry_cache.fence(fence)
+        if not geometry or geometry.boundary_distance(lat, lng) > metres:
+            return False
+        if fence.behavior == "No Exit" and fence.project_region_id:
+            region = fence.project_region or db.query(ProjectRegion).filter(
+                ProjectRegion.id == fence.project_region_id
+            ).first()
+            region_geometry = geometry_cache.region(region) if region else None
+            return bool(region_geometry and region_geometry.contains(lat, lng))
+        return True
 
     def is_fence_active_now(self, fence: ElectronicFence) -> bool:
         """Check if the fence is within its effective time range."""
         if not fence.is_active:
             return False
-        if not fence.effective_time or '-' not in fence.effective_time:
-            return True
-            
+        return fence_scheduler.is_active(fence)
+
+    def apply_schedule_transitions(self, fence_ids, session_factory=SessionLocal):
+        """Scheduler callback: fences crossed an effective_time boundary, rewrite their counts."""
+        db = session_factory()
         try:
-            now = datetime.now().time()
-            start_str, end_str = fence.effective_time.split('-')
-            
-            start_t = self._parse_time_str(start_str)
-            end_t = self._parse_time_str(end_str)
-            
-            if start_t <= end_t:
-                return start_t <= now <= end_t
-            else: # Overnight range
-                return now >= start_t or now <= end_t
-        except Exception as e:
-            logger.error(f"Error checking fence time: {e}")
-            return True
+            fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(fence_ids)).all()
+            self._write_counts(db, fences)
+            db.commit()
+        finally:
+            db.close()
 
     def _parse_time_str(self, time_str: str) -> time:
         """Parse 'HH:mm' or 'HH.mm' style strings."""
-        ts = time_str.strip().replace('.', ':')
-        parts = ts.split(':')
-        h = int(parts[0])
-        m = int(parts[1]) if len(parts) > 1 else 0
-        return time(h, m)
+        return parse_time_str(time_str)
 
     def is_device_inside_fence(self, fence: ElectronicFence, device: Device) -> bool:
         """Helper to determine if a device is currently inside a fence boundary."""
         if not device.last_latitude or not device.last_longitude:
             return False
 
-        gcj_lat, gcj_lng = device.last_latitude, device.last_longitude
-
-        if fence.shape == "circle":
-            try:
-                center = json.loads(fence.coordinates_json)
-                center_lat, center_lng = 0.0, 0.0
-                if isinstance(center, list) and len(center) >= 2:
-                    center_lat, center_lng = float(center[0]), float(center[1])
-                elif isinstance(center, dict):
-                    center_lat = float(center.get("lat", 0))
-                    center_lng = float(center.get("lng", 0))
-                
-                dist = self._get_distance(gcj_lat, gcj_lng, center_lat, center_lng)
-                return dist <= (fence.radius or 0)
-            except Exception:
-                return False
-
-        elif fence.shape == "polygon":
-            try:
-                polygon_points = json.loads(fence.coordinates_json)
-                poly = []
-                for p in polygon_points:
-                    if isinstance(p, list) and len(p) >= 2:
-                        poly.append((float(p[1]), float(p[0])))
-                    elif isinstance(p, dict):
-                        poly.append((float(p.get("lng")), float(p.get("lat"))))
-                return self._is_inside_polygon((gcj_lng, gcj_lat), poly)
-            except Exception:
-                return False
-        return False
+        geometry = geometry_cache.fence(fence)
+        if not geometry:
+            return False
+        return geometry.contains(device.last_latitude, device.last_longitude)
 
     def _update_fence_count(self, db: Session, fence: ElectronicFence):
         """Recalculate and update the worker_count (violator count) for a fence."""
-        # If fence is not active or out of time range, count is 0
-        if not self.is_fence_active_now(fence):
-            fence.worker_count = 0
-            db.commit()
-            return
+        self._update_fence_counts(db, [fence])
 
-        devices = db.query(Device).filter(Device.last_latitude.isnot(None)).all()
-        count = 0
-        for device in devices:
-            if self.check_device_violation(db, fence, device):
-                count += 1
-        
-        fence.worker_count = count
+    def _update_fence_counts(
+        self, db: Session, fences, positions: DevicePositions = None, raise_alarms: bool = False
+    ):
+        """
+        Recalculate worker_count for several fences in one vectorized pass
+        over the device positions, with a single commit.
+        With raise_alarms, alarms for the violators are inserted in the same transaction.
+        """
+        # Membership is geometric; disabled fences have no members at all
+        enabled = []
+        for fence in fences:
+            if fence.is_active:
+                enabled.append(fence)
+            else:
+                fence_membership.remove_fence(fence.id)
+
+        if enabled:
+            if positions is None:
+                positions = DevicePositions.load(db)
+            masks = self.evaluator.violation_masks(db, enabled, positions)
+            for fence in enabled:
+                mask = masks[fence.id]
+                fence_membership.set_fence(fence.id, [positions.ids[i] for i in mask.nonzero()[0]])
+                if raise_alarms:
+                    count = self._materialize_alarms(db, fence, positions, mask)
+                    logger.info(f"Fence {fence.name}: triggered {count} alarms.")
+
+        self._write_counts(db, fences)
         db.commit()
 
+    def _materialize_alarms(self, db: Session, fence: ElectronicFence, positions: DevicePositions, mask) -> int:
+        """
+        Insert pending alarms for every violator of a fence that has no open alarm yet,
+        through the alarm bus when it runs, else with multi-row INSERTs inside the
+        caller's transaction.
+        """
+        if not self.is_fence_active_now(fence):
+            return 0
+        open_alarms.ensure_loaded(db)
+
+        violators = {}
+        for i in mask.nonzero()[0]:
+            device_id = positions.ids[i]
+            if not open_alarms.is_open(device_id, fence.id):
+                violators[device_id] = i
+        if not violators:
+            return 0
+
+        names = dict(db.query(Device.id, Device.device_name).filter(Device.id.in_(violators)).all())
+        if fence.behavior == "No Entry":
+            alarm_type, verb = "电子围栏闯入", "entered restricted area"
+        else:
+            alarm_type, verb = "电子围栏越界", "left designated area"
+        severity = fence.alarm_type.value if hasattr(fence.alarm_type, "value") else "high"
+        now = datetime.utcnow()
+
+        rows = []
+        for device_id, i in violators.items():
+            rows.append({
+                "device_id": device_id,
+                "fence_id": fence.id,
+                "alarm_type": alarm_type,
+                "severity": severity,
+                "description": f"Device {names.get(device_id)} {verb}: {fence.name}",
+                "location": f"{fence.name} {positions.lats[i]:.6f}, {positions.lngs[i]:.6f}",
+                "status": "pending",
+                "recording_status": "pending",
+                "timestamp": now,
+            })
+        if alarm_bus.running:
+            # Group-committed by the alarm bus; reserve the pairs until they are written
+            queued = []
+            for row in rows:
+                if open_alarms.reserve(row["device_id"], fence.id):
+                    queued.append(row)
+            if alarm_bus.publish_many(queued, reserved=True) is not None:
+                logger.warning(f"  {len(queued)} VIOLATIONS DETECTED for fence {fence.name}")
+                return len(queued)
+            for row in queued:
+                open_alarms.release(row["device_id"], fence.id)
+
+        # executemany of a single INSERT: batched into multi-row VALUES by the driver/dialect
+        for start in range(0, len(rows), ALARM_INSERT_CHUNK):
+            db.execute(insert(AlarmRecord), rows[start:start + ALARM_INSERT_CHUNK])
+        # Core INSERTs bypass the session hook that keeps the rollups
+        alarm_rollups.add_rows(db, rows)
+
+        # Read back the new rows so the open-alarm registry and the live feed see them after commit
+        created = db.execute(
+            select(AlarmRecord.__table__).where(
+                AlarmRecord.fence_id == fence.id,
+                AlarmRecord.status == "pending",
+                AlarmRecord.device_id.in_(violators),
+            )
+        ).mappings().all()
+        for alarm in created:
+            open_alarms.stage_add(db, alarm["id"], alarm["device_id"], fence.id)
+        alarm_feed.stage_rows(db, created)
+
+        logger.warning(f"  {len(rows)} VIOLATIONS DETECTED for fence {fence.name}")
+        return len(rows)
+
+    def _write_counts(self, db: Session, fences):
+        """Copy membership counts into worker_count (0 while the fence is not active)."""
+        for fence in fences:
+            # If fence is not active or out of time range, count is 0
+            if self.is_fence_active_now(fence):
+                fence.worker_count = fence_membership.count(fence.id)
+            else:
+                fence.worker_count = 0
+
+    @engine_gate.shared()
+    def recount_all_fences(self, db: Session):
+        """Full worker_count recount for every fence (startup / fence edits / recovery)."""
+        fences = db.query(ElectronicFence).all()
+        fence_membership.clear()
+        self._update_fence_counts(db, fences)
+        fence_membership.loaded = True
+        logger.info(f"Recounted worker_count for {len(fences)} fences")
+
     def check_device_violation(self, db: Session, fence: ElectronicFence, device: Device) -> bool:
         """Determine if a device is violating a fence's rules."""
         is_inside = self.is_device_inside_fence(fence, device)
@@ -278,57 +719,76 @@ class FenceService:
         Core logic to check one device against one fence.
         Returns True if an alarm was triggered, False otherwise.
         """
-        violation = self.check_device_violation(db, fence, device)
-        gcj_lat, gcj_lng = device.last_latitude, device.last_longitude
+        if self.check_device_violation(db, fence, device):
+            return self._raise_fence_alarm(db, fence, device)
+        return False
 
-        if violation:
-            description = ""
-            if fence.behavior == "No Entry":
-                description = f"Device {device.device_name} entered restricted area: {fence.name}"
-            else:
-                description = f"Device {device.device_name} left designated area: {fence.name}"
-
-            # Check for duplicate ACTIVE alarms for this device and fence
-            existing_alarm = (
-                db.query(AlarmRecord)
-                .filter(
-                    AlarmRecord.device_id == device.id,
-                    AlarmRecord.fence_id == fence.id,
-                    AlarmRecord.status == "pending",
-                )
-                .first()
-            )
+    def _raise_fence_alarm(
+        self, db: Session, fence: ElectronicFence, device: Device,
+        lat: float = None, lng: float = None, commit: bool = True,
+    ) -> bool:
+        """
+        Create a pending alarm for a violating (device, fence) pair unless one is already open.
+        lat/lng default to the device's last location; commit=False leaves the commit to the caller.
+        """
+        gcj_lat = lat if lat is not None else device.last_latitude
+        gcj_lng = lng if lng is not None else device.last_longitude
 
-            if existing_alarm:
-                return False  # Already alarmed
-
-            logger.warning(f"  VIOLATION DETECTED: {description}")
-            alarm_service = AlarmService()
-            loc_str = f"{gcj_lat:.6f}, {gcj_lng:.6f}"
-
-            # Determine distinct alarm type based on behavior
-            current_alarm_type = "电子围栏越界"  # Default / No Exit
-            if fence.behavior == "No Entry":
-                current_alarm_type = "电子围栏闯入"
-
-            alarm_data = AlarmCreate(
-                device_id=device.id,
-                fence_id=fence.id,
-                alarm_type=current_alarm_type,
-                severity=(
-                    fence.alarm_type.value
-                    if hasattr(fence.alarm_type, "value")
-                    else "high"
-                ),
-                description=description,
-                location=loc_str,
-                status="pending",
-            )
-            try:
-                alarm_service.create_alarm(db, alarm_data)
+        description = ""
+        if fence.behavior == "No Entry":
+            description = f"Device {device.device_name} entered restricted area: {fence.name}"
+        else:
+            description = f"Device {device.device_name} left designated area: {fence.name}"
+
+        # Check for duplicate ACTIVE alarms for this device and fence
+        open_alarms.ensure_loaded(db)
+        if open_alarms.is_open(device.id, fence.id):
+            return False  # Already alarmed
+
+        logger.warning(f"  VIOLATION DETECTED: {description}")
+        alarm_service = AlarmService()
+        loc_str = f"{gcj_lat:.6f}, {gcj_lng:.6f}"
+
+        # Determine distinct alarm type based on behavior
+        current_alarm_type = "电子围栏越界"  # Default / No Exit
+        if fence.behavior == "No Entry":
+            current_alarm_type = "电子围栏闯入"
+
+        if alarm_bus.running:
+            # Queued for the group-committed writer; the reservation blocks duplicates meanwhile
+            if not open_alarms.reserve(device.id, fence.id):
+                return False
+            row = {
+                "device_id": device.id,
+                "fence_id": fence.id,
+                "alarm_type": current_alarm_type,
+                "severity": fence.alarm_type.value if hasattr(fence.alarm_type, "value") else "high",
+                "description": description,
+                "location": f"{fence.name} {loc_str}",
+                "status": "pending",
+            }
+            if alarm_bus.publish(row, reserved=True) is not None:
                 return True
-            except Exception as e:
-                logger.error(f"Failed to create alarm: {e}")
+            open_alarms.release(device.id, fence.id)
+
+        alarm_data = AlarmCreate(
+            device_id=device.id,
+            fence_id=fence.id,
+            alarm_type=current_alarm_type,
+            severity=(
+                fence.alarm_type.value
+                if hasattr(fence.alarm_type, "value")
+                else "high"
+            ),
+            description=description,
+            location=loc_str,
+            status="pending",
+        )
+        try:
+            alarm_service.create_alarm(db, alarm_data, commit=commit)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to create alarm: {e}")
 
         return False
 
@@ -336,19 +796,7 @@ class FenceService:
         """
         Calculate Haversine distance between two points in meters.
         """
-        R = 6371000  # Radius of Earth in meters
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
-
-        a = (
-            math.sin(delta_phi / 2.0) ** 2
-            + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2.0) ** 2
-        )
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-        return R * c
+        return haversine(lat1, lon1, lat2, lon2)
 
     def _is_inside_polygon(self, point, polygon):
         """
@@ -356,20 +804,5 @@ class FenceService:
         point: (lng, lat) -> (x, y)
         polygon: list of (lng, lat)
         """
-        if not polygon:
-            return False
         x, y = point
-        n = len(polygon)
-        inside = False
-        p1x, p1y = polygon[0]
-        for i in range(n + 1):
-            p2x, p2y = polygon[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        return inside
+        return point_in_polygon(x, y, polygon)
@@ -0,0 +1,172 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sqlalchemy.orm import Session
+from app.models.fence import ProjectRegion
+from app.utils.fence_geometry import geometry_cache, evaluate_shard
+from app.utils.logger import get_logger
+
+logger = get_logger("FenceShards")
+
+# Unscoped fences are grouped into tiles of this many degrees (~5 km)
+TILE_DEGREES = 0.05
+
+
+def _default_workers() -> int:
+    return min(max((os.cpu_count() or 1) - 1, 1), 8)
+
+
+class ShardedEvaluator:
+    """
+    Process-pool version of FenceEvaluator.violation_masks for full recounts.
+
+    Fences are sharded by ProjectRegion (scoped fences) or by geographic tile
+    (unscoped fences); each shard only receives the devices inside the bboxes its
+    fences can affect, so the work splits across cores instead of one thread
+    evaluating every device against every fence. Workers get plain arrays and
+    coordinate strings (see fence_geometry.evaluate_shard) and return indices;
+    the masks are reassembled here, so counts and alarms are handled by the
+    caller exactly as on the serial path.
+
+    FENCE_EVAL_WORKERS sets the pool size (default: cores - 1, at most 8; 0 or 1
+    disables it). Only jobs of at least FENCE_PARALLEL_MIN_WORK device x fence
+    checks (default 2,000,000) go to the pool; smaller ones are cheaper in-thread.
+    """
+
+    def __init__(self, workers: int = None, min_work: int = None):
+        if workers is None:
+            workers = int(os.getenv("FENCE_EVAL_WORKERS", str(_default_workers())))
+        if min_work is None:
+            min_work = int(os.getenv("FENCE_PARALLEL_MIN_WORK", "2000000"))
+        self.workers = workers
+        self.min_work = min_work
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1
+
+    def should_use(self, fence_count: int, device_count: int) -> bool:
+        return self.enabled and fence_count > 1 and fence_count * device_count >= self.min_work
+
+    def violation_masks(self, db: Session, evaluator, fences, positions):
+        """
+        Same result as FenceEvaluator.violation_masks. Fences whose geometry (or
+        region) is missing or invalid are left to `evaluator` in this process.
+        """
+        masks = {}
+        serial = []
+        shards = {}  # key -> {"region": geometry or None, "region_json": str, "fences": [...], "boxes": [...]}
+        regions = {}
+
+        for fence in fences:
+            geometry = geometry_cache.fence(fence)
+            if geometry is None or not geometry.bbox:
+                serial.append(fence)
+                continue
+
+            if fence.project_region_id:
+                if fence.project_region_id not in regions:
+                    region = fence.project_region or db.query(ProjectRegion).filter(
+                        ProjectRegion.id == fence.project_region_id
+                    ).first()
+                    region_geometry = geometry_cache.region(region) if region else None
+                    regions[fence.project_region_id] = (region, region_geometry)
+                region, region_geometry = regions[fence.project_region_id]
+                if region_geometry is None or not region_geometry.bbox:
+                    serial.append(fence)
+                    continue
+                key = ("region", fence.project_region_id)
+                shard = shards.setdefault(key, {"region_json": None, "fences": [], "boxes": []})
+                scoped = fence.behavior == "No Exit"
+                if scoped:
+                    shard["region_json"] = region.coordinates_json
+                    shard["boxes"].append(region_geometry.bbox)
+                else:
+                    shard["boxes"].append(geometry.bbox)
+            else:
+                min_lng, min_lat, max_lng, max_lat = geometry.bbox
+                key = (
+                    "tile",
+                    math.floor((min_lng + max_lng) / 2 / TILE_DEGREES),
+                    math.floor((min_lat + max_lat) / 2 / TILE_DEGREES),
+                )
+                shard = shards.setdefault(key, {"region_json": None, "fences": [], "boxes": []})
+                scoped = False
+                shard["boxes"].append(geometry.bbox)
+            shard["fences"].append((fence, scoped))
+
+        tasks, index_maps, shard_fences = [], [], []
+        for shard in shards.values():
+            idx = self._devices_in_boxes(positions, shard["boxes"])
+            specs = [
+                (f.id, str(getattr(f.shape, "value", f.shape)), f.coordinates_json, f.radius,
+                 scoped and shard["region_json"] is not None)
+                for f, scoped in shard["fences"]
+            ]
+            tasks.append((specs, shard["region_json"], positions.lats[idx], positions.lngs[idx]))
+            index_maps.append(idx)
+            shard_fences.append(shard["fences"])
+
+        try:
+            results = list(self._get_pool().map(evaluate_shard, tasks))
+        except Exception as e:
+            logger.error(f"Sharded fence evaluation failed, falling back to serial: {e}")
+            self.shutdown()
+            return evaluator.violation_masks(db, fences, positions, parallel=False)
+
+        n = len(positions)
+        for result, idx, members in zip(results, index_maps, shard_fences):
+            for fence, scoped in members:
+                hits = idx[result[fence.id]]
+                if fence.behavior == "No Exit" and not fence.project_region_id:
+                    # Violators are everyone outside the fence, including devices without a location
+                    mask = np.ones(n, dtype=bool)
+                    mask[hits] = False
+                else:
+                    mask = np.zeros(n, dtype=bool)
+                    mask[hits] = True
+                masks[fence.id] = mask
+
+        if serial:
+            masks.update(evaluator.violation_masks(db, serial, positions, parallel=False))
+        logger.info(
+            f"Sharded evaluation: {len(fences)} fences x {n} devices in {len(tasks)} shards"
+            f" on {self.workers} workers ({len(serial)} fences in-process)"
+        )
+        return masks
+
+    @staticmethod
+    def _devices_in_boxes(positions, boxes):
+        """Indices of valid devices inside any of the (min_lng, min_lat, max_lng, max_lat) boxes."""
+        hit = np.zeros(len(positions), dtype=bool)
+        for min_lng, min_lat, max_lng, max_lat in boxes:
+            hit |= (
+                (positions.lngs >= min_lng) & (positions.lngs <= max_lng)
+                & (positions.lats >= min_lat) & (positions.lats <= max_lat)
+            )
+        return np.nonzero(hit & positions.valid)[0]
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: the API process runs threads (scheduler, flushers), which fork does not mix with
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Started fence evaluation pool with {self.workers} workers")
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局单例
+fence_shards = ShardedEvaluator()
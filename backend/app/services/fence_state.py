@@ -0,0 +1,234 @@
+import threading
+from contextlib import contextmanager
+
+
+class FenceMembership:
+    """
+    In-memory (device, fence) -> violating table.
+
+    Membership is purely geometric (it ignores effective_time), so worker_count is
+    len(members) while the fence is in its time window and 0 outside of it.
+    It is rebuilt per fence by full recounts and patched per device on each ping.
+    """
+
+    def __init__(self):
+        self._by_device = {}  # device_id -> set(fence_id)
+        self._by_fence = {}  # fence_id -> set(device_id)
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def set_fence(self, fence_id, device_ids):
+        """Replace the members of one fence (result of a full recount)."""
+        device_ids = set(device_ids)
+        with self._lock:
+            for device_id in list(self._by_fence.get(fence_id, ())):
+                self._discard(device_id, fence_id)
+            self._by_fence[fence_id] = device_ids
+            for device_id in device_ids:
+                self._by_device.setdefault(device_id, set()).add(fence_id)
+
+    def remove_fence(self, fence_id):
+        with self._lock:
+            for device_id in list(self._by_fence.pop(fence_id, ())):
+                self._discard(device_id, fence_id)
+
+    def remove_device(self, device_id):
+        """Forget a device; returns the fence ids it was counted in."""
+        with self._lock:
+            fence_ids = self._by_device.pop(device_id, set())
+            for fence_id in fence_ids:
+                self._by_fence.get(fence_id, set()).discard(device_id)
+            return fence_ids
+
+    def update_device(self, device_id, evaluated_ids, violating_ids):
+        """
+        Apply the result of re-evaluating one device against `evaluated_ids`.
+        Returns {fence_id: +1 | -1} for the fences whose membership changed.
+        """
+        deltas = {}
+        with self._lock:
+            current = self._by_device.get(device_id, set())
+            for fence_id in evaluated_ids:
+                was = fence_id in current
+                now = fence_id in violating_ids
+                if was == now:
+                    continue
+                if now:
+                    self._by_device.setdefault(device_id, set()).add(fence_id)
+                    self._by_fence.setdefault(fence_id, set()).add(device_id)
+                    deltas[fence_id] = 1
+                else:
+                    self._discard(device_id, fence_id)
+                    deltas[fence_id] = -1
+        return deltas
+
+    def export(self) -> dict:
+        """Copy of the whole table: {fence_id: set(device_id)}."""
+        with self._lock:
+            return {fence_id: set(devices) for fence_id, devices in self._by_fence.items()}
+
+    def fences_of(self, device_id) -> set:
+        with self._lock:
+            return set(self._by_device.get(device_id, ()))
+
+    def members(self, fence_id) -> set:
+        with self._lock:
+            return set(self._by_fence.get(fence_id, ()))
+
+    def count(self, fence_id) -> int:
+        with self._lock:
+            return len(self._by_fence.get(fence_id, ()))
+
+    def clear(self):
+        with self._lock:
+            self._by_device.clear()
+            self._by_fence.clear()
+            self.loaded = False
+
+    def _discard(self, device_id, fence_id):
+        fences = self._by_device.get(device_id)
+        if fences is not None:
+            fences.discard(fence_id)
+            if not fences:
+                del self._by_device[device_id]
+        members = self._by_fence.get(fence_id)
+        if members is not None:
+            members.discard(device_id)
+
+
+class ViolationDebouncer:
+    """
+    Per-fence dwell / hysteresis on top of the raw geometric violation test.
+
+    - dwell_seconds: a device only starts counting (and alarming) once its raw
+      violation has lasted that long; the first violating ping is remembered here.
+    - hysteresis_m: a counted device stays counted while it is back on the safe
+      side but still within that many metres of the fence boundary.
+
+    So GPS jitter along a boundary no longer flips membership, worker_count and
+    alarms on every ping. Detection latency is bounded by dwell_seconds plus one
+    ping interval. Only the live ping paths are debounced; full recounts
+    (startup, fence edits) take the geometry as is.
+    """
+
+    def __init__(self):
+        self._since = {}  # device_id -> {fence_id: first raw-violating timestamp}
+        self._lock = threading.Lock()
+        self.stats = {"held_by_dwell": 0, "held_by_hysteresis": 0}
+
+    def decide(self, device_id, fence, raw: bool, was: bool, ts, near_boundary) -> bool:
+        """
+        Debounced violation state of one (device, fence) pair for a ping at `ts`.
+        `was` is the current membership; near_boundary(metres) is only called when
+        the hysteresis band matters (it computes a distance).
+        """
+        dwell = fence.dwell_seconds or 0
+        hysteresis = fence.hysteresis_m or 0
+        if was and raw:
+            return True
+        if was and hysteresis > 0 and near_boundary(hysteresis):
+            with self._lock:
+                self.stats["held_by_hysteresis"] += 1
+            return True
+        with self._lock:
+            if was:
+                self._discard(device_id, fence.id)
+                return False
+            if not raw:
+                self._discard(device_id, fence.id)
+                return False
+            if dwell <= 0:
+                return True
+            since = self._since.setdefault(device_id, {}).setdefault(fence.id, ts)
+            if (ts - since).total_seconds() >= dwell:
+                self._discard(device_id, fence.id)
+                return True
+            self.stats["held_by_dwell"] += 1
+            return False
+
+    def pending_fences(self, device_id) -> set:
+        """Fences a device is in the dwell time of (they must be re-evaluated on its next ping)."""
+        with self._lock:
+            return set(self._since.get(device_id, ()))
+
+    def pending(self, fence_id) -> set:
+        """Devices whose violation of a fence is still within its dwell time."""
+        with self._lock:
+            return {d for d, fences in self._since.items() if fence_id in fences}
+
+    def remove_fence(self, fence_id):
+        with self._lock:
+            for device_id in list(self._since):
+                self._discard(device_id, fence_id)
+
+    def remove_device(self, device_id):
+        with self._lock:
+            self._since.pop(device_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._since.clear()
+
+    def _discard(self, device_id, fence_id):
+        fences = self._since.get(device_id)
+        if fences is not None:
+            fences.pop(fence_id, None)
+            if not fences:
+                del self._since[device_id]
+
+
+class EngineGate:
+    """
+    Lets a snapshot read a consistent view of the engine state.
+
+    Every operation that moves device positions or membership runs under shared()
+    (usable as a decorator); exclusive() waits for those in flight to finish and
+    holds new ones back while the snapshot copies state. shared() is re-entrant
+    per thread, so nested engine calls never wait on a pending snapshot.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._frozen = False
+        self._local = threading.local()
+
+    @contextmanager
+    def shared(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            with self._cond:
+                while self._frozen:
+                    self._cond.wait()
+                self._active += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._active -= 1
+                    if self._active == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            while self._frozen:
+                self._cond.wait()
+            self._frozen = True
+            while self._active:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._frozen = False
+                self._cond.notify_all()
+
+
+# 全局单例
+fence_membership = FenceMembership()
+fence_debouncer = ViolationDebouncer()
+engine_gate = EngineGate()
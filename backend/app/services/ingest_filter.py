@@ -0,0 +1,136 @@
+import os
+import threading
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.services.fence_index import fence_index
+from app.services.fence_state import fence_membership, fence_debouncer
+from app.services.track_store import track_store
+from app.utils.fence_geometry import haversine
+from app.utils.logger import get_logger
+
+logger = get_logger("IngestFilter")
+
+
+class IngestFilter:
+    """
+    Per-device filter in front of the fence engine for helmets that report every
+    second while standing still.
+
+    A ping is passed on when
+      - the device is in the dwell time of a fence (fence_debouncer), so the
+        violation is confirmed on the first ping after dwell_seconds, or
+      - the device is within INGEST_BOUNDARY_MARGIN_M (default 25) of a boundary
+        that matters to it (fences it could violate at this point, fences it is
+        counted in), or
+      - it is at least INGEST_MIN_INTERVAL_S (default 0) after the last passed ping
+        and has moved INGEST_MIN_DISTANCE_M (default 5) from it, or
+      - INGEST_MAX_SILENCE_S (default 30) have passed since the last passed ping.
+
+    Everything else is dropped before any DB work. A fence state change needs the
+    device to cross a boundary, and a stationary drop is less than the minimum
+    distance from a point that was evaluated, so the margin (kept >= the minimum
+    distance) catches every crossing; rate-limited drops delay detection by at most
+    INGEST_MIN_INTERVAL_S. Dropped pings still go to the trajectory store; the engine
+    forgets devices it does not know, so their pings are never dropped (nor recorded).
+    INGEST_FILTER=0 turns the filter off.
+    """
+
+    def __init__(self, enabled: bool = None, min_distance_m: float = None, min_interval_s: float = None,
+                 max_silence_s: float = None, boundary_margin_m: float = None):
+        if enabled is None:
+            enabled = os.getenv("INGEST_FILTER", "1") not in ("0", "false", "False")
+        self.enabled = enabled
+        self.min_distance_m = min_distance_m if min_distance_m is not None else float(
+            os.getenv("INGEST_MIN_DISTANCE_M", "5"))
+        self.min_interval_s = min_interval_s if min_interval_s is not None else float(
+            os.getenv("INGEST_MIN_INTERVAL_S", "0"))
+        self.max_silence_s = max_silence_s if max_silence_s is not None else float(
+            os.getenv("INGEST_MAX_SILENCE_S", "30"))
+        margin = boundary_margin_m if boundary_margin_m is not None else float(
+            os.getenv("INGEST_BOUNDARY_MARGIN_M", "25"))
+        self.boundary_margin_m = max(margin, self.min_distance_m)
+        self._last = {}  # device_id -> (lat, lng, ts) of the last passed ping
+        self._lock = threading.Lock()
+        self.stats = {
+            "seen": 0,
+            "passed": 0,
+            "dropped_stationary": 0,
+            "dropped_rate": 0,
+            "boundary_bypass": 0,
+            "dwell_bypass": 0,
+            "heartbeat": 0,
+        }
+
+    def admit(self, db: Session, device_id, lat, lng, ts: datetime = None) -> bool:
+        """Decide whether one ping goes on to the fence engine."""
+        self.stats["seen"] += 1
+        if not self.enabled:
+            self.stats["passed"] += 1
+            return True
+        ts = ts or datetime.now()
+        if ts.tzinfo is not None:
+            ts = ts.astimezone().replace(tzinfo=None)
+
+        with self._lock:
+            last = self._last.get(device_id)
+        if last is None or ts < last[2]:
+            # First ping, or out of order: let the engine decide
+            return self._pass(device_id, lat, lng, ts)
+
+        elapsed = (ts - last[2]).total_seconds()
+        if elapsed >= self.max_silence_s:
+            self.stats["heartbeat"] += 1
+            return self._pass(device_id, lat, lng, ts)
+
+        if fence_debouncer.pending_fences(device_id):
+            # A stationary device deep inside a dwell fence must still reach the engine
+            self.stats["dwell_bypass"] += 1
+            return self._pass(device_id, lat, lng, ts)
+
+        fence_ids = fence_index.candidates(db, lat, lng) | fence_membership.fences_of(device_id)
+        if fence_ids and fence_index.near_boundary(db, fence_ids, lat, lng, self.boundary_margin_m):
+            self.stats["boundary_bypass"] += 1
+            return self._pass(device_id, lat, lng, ts)
+
+        if elapsed < self.min_interval_s:
+            self.stats["dropped_rate"] += 1
+            return False
+        if haversine(lat, lng, last[0], last[1]) < self.min_distance_m:
+            self.stats["dropped_stationary"] += 1
+            return False
+        return self._pass(device_id, lat, lng, ts)
+
+    def filter_pings(self, db: Session, pings):
+        """Batch version of admit(); dropped pings are still recorded as track points."""
+        passed = []
+        for ping in pings:
+            if self.admit(db, ping.device_id, ping.lat, ping.lng, ping.ts):
+                passed.append(ping)
+            else:
+                track_store.record(ping.device_id, ping.lat, ping.lng, ping.ts)
+        return passed
+
+    def forget(self, device_id):
+        """Drop a device's last passed point (device deleted or moved by hand)."""
+        with self._lock:
+            self._last.pop(device_id, None)
+
+    def snapshot_stats(self) -> dict:
+        seen = self.stats["seen"]
+        dropped = self.stats["dropped_stationary"] + self.stats["dropped_rate"]
+        return dict(
+            self.stats,
+            enabled=self.enabled,
+            drop_ratio=round(dropped / seen, 4) if seen else 0.0,
+            tracked_devices=len(self._last),
+        )
+
+    def _pass(self, device_id, lat, lng, ts) -> bool:
+        with self._lock:
+            self._last[device_id] = (lat, lng, ts)
+        self.stats["passed"] += 1
+        return True
+
+
+# 全局单例
+ingest_filter = IngestFilter()
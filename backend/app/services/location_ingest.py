@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from app.core.database import SessionLocal
+from app.schemas.fence_schema import LocationPing
+from app.services.fence_service import FenceService
+from app.services.ingest_filter import ingest_filter
+from app.utils.coord_transform import wgs84_to_gcj02_array
+from app.utils.logger import get_logger
+
+logger = get_logger("LocationIngest")
+
+
+def parse_ts(value):
+    """Epoch seconds / milliseconds or ISO string -> datetime."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+        ts = float(value)
+        if ts > 1e12:  # milliseconds
+            ts /= 1000.0
+        return datetime.fromtimestamp(ts)
+    return datetime.fromisoformat(str(value))
+
+
+def to_gcj02(pings, coords: str = "gcj02"):
+    """
+    Convert pings reported in `coords` ("gcj02" or "wgs84") to GCJ-02 in place, the
+    system fences are drawn in. Raw WGS-84 fixes are converted in one vectorized call.
+    """
+    if coords == "gcj02" or not pings:
+        return pings
+    if coords != "wgs84":
+        raise ValueError(f"Unsupported coordinate system: {coords}")
+    lngs, lats = wgs84_to_gcj02_array([p.lng for p in pings], [p.lat for p in pings])
+    for ping, lat, lng in zip(pings, lats.tolist(), lngs.tolist()):
+        ping.lat = lat
+        ping.lng = lng
+    return pings
+
+
+def parse_frames(payload):
+    """
+    Parse one message into LocationPings. Supported compact frames, one per line:
+      DEV-0001,31.2304,121.4737[,1700000000]
+      {"device_id": "DEV-0001", "lat": 31.2304, "lng": 121.4737, "ts": 1700000000}
+    A JSON array of such objects is accepted as well.
+    Returns (pings, rejected_count).
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode("utf-8", errors="replace")
+
+    pings, rejected = [], 0
+    text = payload.strip()
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return pings, 1
+        lines = items if isinstance(items, list) else [items]
+    else:
+        lines = [line for line in text.splitlines() if line.strip()]
+
+    for item in lines:
+        try:
+            if isinstance(item, str) and item.lstrip().startswith("{"):
+                item = json.loads(item)
+            if isinstance(item, dict):
+                device_id = item.get("device_id")
+                if device_id is None:
+                    device_id = item.get("id")
+                lat, lng, ts = item["lat"], item["lng"], parse_ts(item.get("ts"))
+            else:
+                parts = [p.strip() for p in item.split(",")]
+                device_id = parts[0]
+                lat, lng = float(parts[1]), float(parts[2])
+                ts = parse_ts(parts[3]) if len(parts) > 3 else None
+            device_id = "" if device_id is None else str(device_id).strip()
+            if not device_id:
+                raise ValueError("frame without a device id")
+            pings.append(LocationPing(device_id=device_id, lat=lat, lng=lng, ts=ts))
+        except Exception:
+            rejected += 1
+    return pings, rejected
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        pings, rejected = parse_frames(data)
+        self.ingest.stats["rejected"] += rejected
+        self.ingest.submit_nowait(pings)
+
+
+class LocationIngest:
+    """
+    Long-lived GPS ingest channel.
+
+    Frames from the WebSocket route and the optional UDP / TCP listeners go into one
+    bounded queue. A single consumer drains it in micro-batches (batch_size points or
+    flush_interval seconds) and hands each batch to FenceService.check_fence_status_batch
+    in a worker thread, so there is no per-ping HTTP request or DB session.
+
+    Backpressure: WebSocket and TCP producers await a free slot (slowing the sender
+    down through the socket); UDP has no flow control, so points are dropped and counted.
+
+    Listeners are enabled with GPS_INGEST_UDP_PORT / GPS_INGEST_TCP_PORT
+    (bound on GPS_INGEST_HOST, default 0.0.0.0). GPS_INGEST_COORDS=wgs84 declares that
+    devices send raw WGS-84 fixes; each batch is then converted to GCJ-02 at once.
+    """
+
+    def __init__(self, max_queue: int = 50000, batch_size: int = 1000,
+                 flush_interval: float = 0.05, session_factory=SessionLocal):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.coords = os.getenv("GPS_INGEST_COORDS", "gcj02").lower()
+        if self.coords not in ("gcj02", "wgs84"):
+            logger.warning(f"Unknown GPS_INGEST_COORDS '{self.coords}', assuming gcj02")
+            self.coords = "gcj02"
+        self.queue = None
+        self._worker = None
+        self._servers = []
+        self.stats = {
+            "received": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "processed": 0,
+            "batches": 0,
+            "errors": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+        host = os.getenv("GPS_INGEST_HOST", "0.0.0.0")
+        udp_port = os.getenv("GPS_INGEST_UDP_PORT")
+        tcp_port = os.getenv("GPS_INGEST_TCP_PORT")
+        loop = asyncio.get_running_loop()
+        if udp_port:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UdpProtocol(self), local_addr=(host, int(udp_port))
+            )
+            self._servers.append(transport)
+            logger.info(f"GPS UDP listener on {host}:{udp_port}")
+        if tcp_port:
+            server = await asyncio.start_server(self._handle_tcp, host, int(tcp_port))
+            self._servers.append(server)
+            logger.info(f"GPS TCP listener on {host}:{tcp_port}")
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        self._servers = []
+        if not self.running:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        # Flush what is still queued
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        if batch:
+            await asyncio.to_thread(self._process, batch)
+
+    async def submit(self, pings):
+        """Enqueue pings, waiting for room when the queue is full."""
+        for ping in pings:
+            await self.queue.put(ping)
+        self.stats["received"] += len(pings)
+
+    def submit_nowait(self, pings):
+        """Enqueue pings without waiting; overflow is dropped. Returns the accepted count."""
+        accepted = 0
+        for ping in pings:
+            try:
+                self.queue.put_nowait(ping)
+                accepted += 1
+            except asyncio.QueueFull:
+                self.stats["dropped"] += len(pings) - accepted
+                break
+        self.stats["received"] += accepted
+        return accepted
+
+    def snapshot_stats(self) -> dict:
+        return dict(
+            self.stats,
+            queued=self.queue.qsize() if self.queue else 0,
+            running=self.running,
+            filter=ingest_filter.snapshot_stats(),
+        )
+
+    async def _handle_tcp(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        logger.info(f"GPS TCP client connected: {peer}")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                pings, rejected = parse_frames(line)
+                self.stats["rejected"] += rejected
+                await self.submit(pings)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            logger.info(f"GPS TCP client disconnected: {peer}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await asyncio.to_thread(self._process, batch)
+
+    def _process(self, batch):
+        db = self.session_factory()
+        try:
+            to_gcj02(batch, self.coords)
+            passed = ingest_filter.filter_pings(db, batch)
+            if passed:
+                FenceService().check_fence_status_batch(db, passed)
+            self.stats["processed"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to process GPS batch of {len(batch)}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+# 全局单例
+location_ingest = LocationIngest()
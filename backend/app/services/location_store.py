@@ -0,0 +1,131 @@
+import os
+import threading
+from sqlalchemy import case
+from app.core.database import SessionLocal
+from app.models.device import Device
+from app.utils.logger import get_logger
+
+logger = get_logger("LocationStore")
+
+# Rows per bulk UPDATE statement
+FLUSH_CHUNK = 1000
+
+
+class LocationStore:
+    """
+    Write-behind buffer for Device.last_latitude / last_longitude.
+
+    The fence engine writes the newest position of each device here instead of
+    committing the devices row on every ping. Updates are coalesced per device and
+    flushed periodically (LOCATION_FLUSH_INTERVAL seconds, default 1) with one bulk
+    UPDATE per chunk, and once more on shutdown. Readers that need fresh positions
+    (full recounts) overlay pending() on top of what they read from the table.
+    """
+
+    def __init__(self, flush_interval: float = None, session_factory=SessionLocal):
+        if flush_interval is None:
+            flush_interval = float(os.getenv("LOCATION_FLUSH_INTERVAL", "1.0"))
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self._dirty = {}  # device_id -> (lat, lng, ts)
+        self._inflight = {}  # batch being written by flush()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"updates": 0, "flushed": 0, "flushes": 0, "errors": 0}
+
+    def update(self, device_id, lat, lng, ts=None) -> bool:
+        """
+        Record a device's newest position. Returns False (and keeps the buffered one)
+        if `ts` is older than the position already buffered for the device.
+        """
+        with self._lock:
+            current = self._dirty.get(device_id)
+            if current is not None and ts is not None and current[2] is not None:
+                try:
+                    if ts < current[2]:
+                        return False
+                except TypeError:
+                    pass  # Naive vs aware timestamps: keep arrival order
+            self._dirty[device_id] = (lat, lng, ts)
+            self.stats["updates"] += 1
+            return True
+
+    def discard(self, device_id):
+        """Drop a buffered position (device edited or deleted directly)."""
+        with self._lock:
+            self._dirty.pop(device_id, None)
+
+    def get(self, device_id):
+        with self._lock:
+            entry = self._dirty.get(device_id) or self._inflight.get(device_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def pending(self) -> dict:
+        """Snapshot of buffered positions: {device_id: (lat, lng)}."""
+        with self._lock:
+            merged = dict(self._inflight)
+            merged.update(self._dirty)
+        return {d: (e[0], e[1]) for d, e in merged.items()}
+
+    def flush(self) -> int:
+        """Write all buffered positions to the devices table. Returns the row count."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+
+            db = self.session_factory()
+            try:
+                items = list(batch.items())
+                for start in range(0, len(items), FLUSH_CHUNK):
+                    chunk = dict(items[start:start + FLUSH_CHUNK])
+                    db.query(Device).filter(Device.id.in_(chunk)).update(
+                        {
+                            Device.last_latitude: case({d: e[0] for d, e in chunk.items()}, value=Device.id),
+                            Device.last_longitude: case({d: e[1] for d, e in chunk.items()}, value=Device.id),
+                        },
+                        synchronize_session=False,
+                    )
+                db.commit()
+                self.stats["flushed"] += len(batch)
+                self.stats["flushes"] += 1
+                return len(batch)
+            except Exception as e:
+                db.rollback()
+                self.stats["errors"] += 1
+                logger.error(f"Location flush failed for {len(batch)} devices: {e}")
+                # Put the batch back unless a newer position arrived meanwhile
+                with self._lock:
+                    for device_id, entry in batch.items():
+                        self._dirty.setdefault(device_id, entry)
+                return 0
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                db.close()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="location-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+# 全局单例
+location_store = LocationStore()
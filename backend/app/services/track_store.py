@@ -0,0 +1,221 @@
+import os
+import shutil
+import threading
+from datetime import datetime, date, timedelta
+from urllib.parse import quote
+from app.utils.track_codec import encode_block, decode_blocks
+from app.utils.logger import get_logger
+
+logger = get_logger("TrackStore")
+
+DEFAULT_TRACK_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "tracks"))
+SEGMENT_SUFFIX = ".trk"
+
+
+def to_ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def from_ms(ts_ms: int) -> datetime:
+    return datetime.fromtimestamp(ts_ms / 1000.0)
+
+
+class TrackStore:
+    """
+    Append-only trajectory store: every ingested ping, not only the latest position.
+
+    Points are buffered in memory (record() is a dict append, so the fence check is not
+    slowed down) and a background thread flushes them every TRACK_FLUSH_INTERVAL seconds
+    (default 5) as delta/varint encoded blocks (see app.utils.track_codec) appended to
+    one segment file per device per day:
+
+        TRACK_DATA_DIR/YYYYMMDD/<device_id>.trk
+
+    Day directories older than TRACK_RETENTION_DAYS (default 30, 0 = keep forever)
+    are removed by the flush thread. If the buffer exceeds max_pending points
+    (the disk cannot keep up), new points are dropped and counted.
+    """
+
+    def __init__(self, root: str = None, flush_interval: float = None,
+                 retention_days: int = None, max_pending: int = 1_000_000):
+        self.root = root or os.getenv("TRACK_DATA_DIR", DEFAULT_TRACK_DIR)
+        if flush_interval is None:
+            flush_interval = float(os.getenv("TRACK_FLUSH_INTERVAL", "5.0"))
+        if retention_days is None:
+            retention_days = int(os.getenv("TRACK_RETENTION_DAYS", "30"))
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.max_pending = max_pending
+        self._pending = {}  # device_id -> [(ts_ms, lat, lng), ...]
+        self._inflight = {}  # batch being written by flush()
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pruned_on = None
+        self.stats = {"recorded": 0, "dropped": 0, "written": 0, "bytes": 0, "flushes": 0, "errors": 0}
+
+    # --- Write path ---
+    def record(self, device_id, lat, lng, ts: datetime = None):
+        """Buffer one point (ts defaults to now)."""
+        ts_ms = to_ms(ts) if ts is not None else to_ms(datetime.now())
+        with self._lock:
+            if self._pending_count >= self.max_pending:
+                self.stats["dropped"] += 1
+                return
+            self._pending.setdefault(device_id, []).append((ts_ms, lat, lng))
+            self._pending_count += 1
+            self.stats["recorded"] += 1
+
+    def flush(self) -> int:
+        """Append all buffered points to their segment files. Returns the point count."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._pending_count = 0
+                self._inflight = batch
+            if not batch:
+                return 0
+
+            written = 0
+            failed = {}
+            try:
+                for device_id, points in batch.items():
+                    points.sort()
+                    by_day = {}
+                    for point in points:
+                        by_day.setdefault(from_ms(point[0]).date(), []).append(point)
+                    for day, day_points in by_day.items():
+                        try:
+                            block = encode_block(day_points)
+                            path = self._segment_path(device_id, day, create=True)
+                            with open(path, "ab") as f:
+                                f.write(block)
+                            written += len(day_points)
+                            self.stats["bytes"] += len(block)
+                        except OSError as e:
+                            self.stats["errors"] += 1
+                            logger.error(f"Track write failed for {device_id} on {day}: {e}")
+                            failed.setdefault(device_id, []).extend(day_points)
+            finally:
+                with self._lock:
+                    # Retry failed points on the next flush
+                    for device_id, points in failed.items():
+                        self._pending.setdefault(device_id, [])[:0] = points
+                        self._pending_count += len(points)
+                    self._inflight = {}
+            self.stats["written"] += written
+            self.stats["flushes"] += 1
+            return written
+
+    def prune(self, today: date = None) -> int:
+        """Remove day directories older than the retention window. Returns the count removed."""
+        if self.retention_days <= 0 or not os.path.isdir(self.root):
+            return 0
+        cutoff = (today or date.today()) - timedelta(days=self.retention_days)
+        removed = 0
+        for name in os.listdir(self.root):
+            try:
+                day = datetime.strptime(name, "%Y%m%d").date()
+            except ValueError:
+                continue
+            if day < cutoff:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Pruned {removed} track day directories older than {cutoff}")
+        return removed
+
+    # --- Read path ---
+    def read(self, device_id, start: datetime, end: datetime):
+        """
+        Yield (ts, lat, lng) for one device with start <= ts <= end, in time order,
+        including points that are still buffered.
+        """
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        with self._lock:
+            buffered = list(self._inflight.get(device_id, ())) + list(self._pending.get(device_id, ()))
+
+        day = from_ms(start_ms).date()
+        last_day = from_ms(end_ms).date()
+        while day <= last_day:
+            points = [p for p in buffered if from_ms(p[0]).date() == day]
+            path = self._segment_path(device_id, day)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    points.extend(decode_blocks(f.read()))
+            points.sort()
+            for ts_ms, lat, lng in points:
+                if start_ms <= ts_ms <= end_ms:
+                    yield from_ms(ts_ms), lat, lng
+            day += timedelta(days=1)
+
+    def read_downsampled(self, device_id, start: datetime, end: datetime,
+                         interval: float = None, max_points: int = None):
+        """
+        read() thinned to at most one point per time bucket. The bucket is `interval`
+        seconds, or derived from max_points over the requested range; the last point
+        of the range is always kept so the track ends where the device really was.
+        """
+        if not interval and max_points:
+            interval = (end - start).total_seconds() / max_points
+        if not interval or interval <= 0:
+            yield from self.read(device_id, start, end)
+            return
+
+        bucket_ms = interval * 1000.0
+        start_ms = to_ms(start)
+        last_bucket = None
+        held = None  # newest point not emitted yet
+        for point in self.read(device_id, start, end):
+            bucket = int((to_ms(point[0]) - start_ms) // bucket_ms)
+            if bucket != last_bucket:
+                last_bucket = bucket
+                held = None
+                yield point
+            else:
+                held = point
+        if held is not None:
+            yield held
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            pending = self._pending_count
+        return dict(self.stats, pending=pending, root=self.root)
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="track-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self._pruned_on != date.today():
+                    self._pruned_on = date.today()
+                    self.prune()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Track flush failed: {e}")
+
+    def _segment_path(self, device_id, day: date, create: bool = False) -> str:
+        directory = os.path.join(self.root, day.strftime("%Y%m%d"))
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, quote(str(device_id), safe="-_.") + SEGMENT_SUFFIX)
+
+
+# 全局单例
+track_store = TrackStore()
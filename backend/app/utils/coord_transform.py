@@ -1,9 +1,12 @@
 import math
+import numpy as np
 
 x_pi = 3.14159265358979324 * 3000.0 / 180.0
 pi = 3.1415926535897932384626  # π
 a = 6378245.0  # Semi-major axis
 ee = 0.00669342162296594323  # Eccentricity squared
+MAX_INVERSE_ITERATIONS = 10  # gcj02_to_wgs84
+INVERSE_TOLERANCE = 1e-9  # degrees (~0.1 mm)
 
 def wgs84_to_gcj02(lng, lat):
     """
@@ -49,3 +52,103 @@ def out_of_china(lng, lat):
     """
     return not (73.66 < lng < 135.05 and 3.86 < lat < 53.55)
 
+
+def gcj02_to_wgs84(lng, lat):
+    """
+    Convert GCJ02 coordinate back to WGS84 (iterative, error well below 1 cm).
+    :param lng: GCJ02 longitude
+    :param lat: GCJ02 latitude
+    :return: (lng_wgs, lat_wgs)
+    """
+    if out_of_china(lng, lat):
+        return lng, lat
+    wlng, wlat = lng, lat
+    for _ in range(MAX_INVERSE_ITERATIONS):
+        glng, glat = wgs84_to_gcj02(wlng, wlat)
+        dlng, dlat = glng - lng, glat - lat
+        wlng, wlat = wlng - dlng, wlat - dlat
+        if abs(dlng) < INVERSE_TOLERANCE and abs(dlat) < INVERSE_TOLERANCE:
+            break
+    return wlng, wlat
+
+
+# --- NumPy versions for batches of points ---
+# Same formulas as above on whole arrays; scalars are accepted and arrays returned.
+
+
+def out_of_china_mask(lng, lat):
+    """Vectorized out_of_china: boolean array, True where the point is left untouched."""
+    lng = np.asarray(lng, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    return ~((lng > 73.66) & (lng < 135.05) & (lat > 3.86) & (lat < 53.55))
+
+
+def _transform_lat_array(lng, lat):
+    ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + 0.1 * lng * lat + 0.2 * np.sqrt(np.abs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * pi) + 20.0 * np.sin(2.0 * lng * pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lat * pi) + 40.0 * np.sin(lat / 3.0 * pi)) * 2.0 / 3.0
+    ret += (160.0 * np.sin(lat / 12.0 * pi) + 320 * np.sin(lat * pi / 30.0)) * 2.0 / 3.0
+    return ret
+
+
+def _transform_lng_array(lng, lat):
+    ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + 0.1 * lng * lat + 0.1 * np.sqrt(np.abs(lng))
+    ret += (20.0 * np.sin(6.0 * lng * pi) + 20.0 * np.sin(2.0 * lng * pi)) * 2.0 / 3.0
+    ret += (20.0 * np.sin(lng * pi) + 40.0 * np.sin(lng / 3.0 * pi)) * 2.0 / 3.0
+    ret += (150.0 * np.sin(lng / 12.0 * pi) + 300.0 * np.sin(lng / 30.0 * pi)) * 2.0 / 3.0
+    return ret
+
+
+def _offsets_array(lng, lat):
+    """GCJ02 - WGS84 offset (dlng, dlat) in degrees at WGS84 (lng, lat)."""
+    dlat = _transform_lat_array(lng - 105.0, lat - 35.0)
+    dlng = _transform_lng_array(lng - 105.0, lat - 35.0)
+    radlat = lat / 180.0 * pi
+    magic = np.sin(radlat)
+    magic = 1 - ee * magic * magic
+    sqrtmagic = np.sqrt(magic)
+    dlat = (dlat * 180.0) / ((a * (1 - ee)) / (magic * sqrtmagic) * pi)
+    dlng = (dlng * 180.0) / (a / sqrtmagic * np.cos(radlat) * pi)
+    return dlng, dlat
+
+
+def wgs84_to_gcj02_array(lng, lat):
+    """
+    Vectorized wgs84_to_gcj02.
+    :param lng: array of WGS84 longitudes
+    :param lat: array of WGS84 latitudes
+    :return: (lng_gcj, lat_gcj) float arrays; points outside China (and NaN) are unchanged
+    """
+    lng = np.array(lng, dtype=float)
+    lat = np.array(lat, dtype=float)
+    inside = ~out_of_china_mask(lng, lat)
+    dlng, dlat = _offsets_array(lng[inside], lat[inside])
+    lng[inside] += dlng
+    lat[inside] += dlat
+    return lng, lat
+
+
+def gcj02_to_wgs84_array(lng, lat):
+    """
+    Vectorized gcj02_to_wgs84: fixed-point iteration w <- w - (gcj(w) - g), which
+    converges to < INVERSE_TOLERANCE within a few rounds since the offset varies slowly.
+    :param lng: array of GCJ02 longitudes
+    :param lat: array of GCJ02 latitudes
+    :return: (lng_wgs, lat_wgs) float arrays; points outside China (and NaN) are unchanged
+    """
+    lng = np.array(lng, dtype=float)
+    lat = np.array(lat, dtype=float)
+    inside = ~out_of_china_mask(lng, lat)
+    glng, glat = lng[inside], lat[inside]
+    wlng, wlat = glng.copy(), glat.copy()
+    for _ in range(MAX_INVERSE_ITERATIONS):
+        dlng, dlat = _offsets_array(wlng, wlat)
+        err_lng = wlng + dlng - glng
+        err_lat = wlat + dlat - glat
+        wlng -= err_lng
+        wlat -= err_lat
+        if not len(wlng) or max(np.abs(err_lng).max(), np.abs(err_lat).max()) < INVERSE_TOLERANCE:
+            break
+    lng[inside] = wlng
+    lat[inside] = wlat
+    return lng, lat
@@ -0,0 +1,306 @@
+import json
+import math
+import threading
+import numpy as np
+from app.utils.spatial_index import METERS_PER_DEGREE, circle_bbox, points_bbox
+from app.utils.logger import get_logger
+
+try:
+    import shapely
+    from shapely.geometry import Point, Polygon
+    from shapely.prepared import prep
+    from shapely.validation import make_valid
+except Exception:
+    shapely = None
+    Point = None
+    Polygon = None
+    prep = None
+    make_valid = None
+
+logger = get_logger("FenceGeometry")
+
+EARTH_RADIUS = 6371000  # metres
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Haversine distance between two points in meters."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = (
+        math.sin(delta_phi / 2.0) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2.0) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def haversine_many(lats, lngs, lat0, lng0):
+    """Vectorized haversine distance (meters) from arrays of points to one point."""
+    phi1 = np.radians(lats)
+    phi2 = math.radians(lat0)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(lng0 - lngs)
+
+    a = np.sin(delta_phi / 2.0) ** 2 + np.cos(phi1) * math.cos(phi2) * np.sin(delta_lambda / 2.0) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def point_in_polygon(x, y, polygon):
+    """
+    Ray casting algorithm.
+    x, y: lng, lat
+    polygon: list of (lng, lat)
+    """
+    if not polygon:
+        return False
+    n = len(polygon)
+    inside = False
+    p1x, p1y = polygon[0]
+    for i in range(n + 1):
+        p2x, p2y = polygon[i % n]
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    if p1y != p2y:
+                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    if p1x == p2x or x <= xinters:
+                        inside = not inside
+        p1x, p1y = p2x, p2y
+    return inside
+
+
+def points_in_polygon(xs, ys, polygon):
+    """
+    Vectorized ray casting, same edge rules as point_in_polygon().
+    xs, ys: arrays of lng, lat
+    polygon: list of (lng, lat)
+    """
+    inside = np.zeros(len(xs), dtype=bool)
+    if not polygon:
+        return inside
+    # Edge i runs from vertex i-1 to vertex i; i=0 is the closing edge
+    for i in range(len(polygon)):
+        p1x, p1y = polygon[i - 1]
+        p2x, p2y = polygon[i]
+        inside ^= _edge_crossings(xs, ys, p1x, p1y, p2x, p2y)
+    return inside
+
+
+def _edge_crossings(xs, ys, p1x, p1y, p2x, p2y):
+    hit = (ys > min(p1y, p2y)) & (ys <= max(p1y, p2y)) & (xs <= max(p1x, p2x))
+    if p1x == p2x:
+        return hit
+    if p1y == p2y:
+        # Horizontal edge: never reached through the y-range test above
+        return np.zeros(len(xs), dtype=bool)
+    xinters = (ys - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+    return hit & (xs <= xinters)
+
+
+def parse_points(points):
+    """Parse '[[lat,lng],...]' or '[{lat,lng},...]' into a list of (lng, lat)."""
+    poly = []
+    for p in points:
+        if isinstance(p, list) and len(p) >= 2:
+            poly.append((float(p[1]), float(p[0])))
+        elif isinstance(p, dict):
+            poly.append((float(p.get("lng")), float(p.get("lat"))))
+    return poly
+
+
+def parse_center(center):
+    """Parse '[lat,lng]' or '{lat,lng}' into (lat, lng)."""
+    if isinstance(center, list) and len(center) >= 2:
+        return float(center[0]), float(center[1])
+    elif isinstance(center, dict):
+        return float(center.get("lat", 0)), float(center.get("lng", 0))
+    return 0.0, 0.0
+
+
+class CompiledGeometry:
+    """
+    Parsed and validated fence/region geometry, ready for repeated containment checks.
+    Polygons use a shapely prepared geometry when shapely is available.
+    """
+
+    def __init__(self, shape, points=None, center=None, radius=None):
+        self.shape = shape
+        self.points = points or []
+        self.center = center  # (lat, lng)
+        self.radius = radius or 0
+        self.polygon = None
+        self.prepared = None
+
+        if shape == "circle":
+            self.bbox = circle_bbox(center[0], center[1], self.radius)
+        else:
+            self.bbox = points_bbox(self.points)
+            if prep and len(self.points) >= 3:
+                polygon = Polygon(self.points)
+                if not polygon.is_valid:
+                    polygon = make_valid(polygon)
+                shapely.prepare(polygon)
+                self.polygon = polygon
+                self.prepared = prep(polygon)
+
+    def contains(self, lat, lng) -> bool:
+        if self.shape == "circle":
+            return haversine(lat, lng, self.center[0], self.center[1]) <= self.radius
+        if not self.bbox:
+            return False
+        if not (self.bbox[0] <= lng <= self.bbox[2] and self.bbox[1] <= lat <= self.bbox[3]):
+            return False
+        if self.prepared is not None:
+            return self.prepared.covers(Point(lng, lat))
+        return point_in_polygon(lng, lat, self.points)
+
+    def boundary_distance(self, lat, lng) -> float:
+        """Distance in metres from a point to the geometry's boundary (either side)."""
+        if self.shape == "circle":
+            return abs(haversine(lat, lng, self.center[0], self.center[1]) - self.radius)
+        if len(self.points) < 2:
+            return float("inf")
+        # Local equirectangular projection around the point, in metres
+        pts = np.asarray(self.points, dtype=float)
+        xs = (pts[:, 0] - lng) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        ys = (pts[:, 1] - lat) * METERS_PER_DEGREE
+        x1, y1 = xs, ys
+        x2, y2 = np.roll(xs, -1), np.roll(ys, -1)
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(length2 > 0, -(x1 * dx + y1 * dy) / length2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return float(np.min(np.hypot(x1 + t * dx, y1 + t * dy)))
+
+    def contains_many(self, lats, lngs):
+        """Vectorized contains(): boolean mask over arrays of lat / lng."""
+        if self.shape == "circle":
+            return haversine_many(lats, lngs, self.center[0], self.center[1]) <= self.radius
+        result = np.zeros(len(lats), dtype=bool)
+        if not self.bbox:
+            return result
+        in_box = (
+            (lngs >= self.bbox[0]) & (lngs <= self.bbox[2])
+            & (lats >= self.bbox[1]) & (lats <= self.bbox[3])
+        )
+        idx = np.nonzero(in_box)[0]
+        if len(idx) == 0:
+            return result
+        if self.polygon is not None:
+            result[idx] = shapely.intersects_xy(self.polygon, lngs[idx], lats[idx])
+        else:
+            result[idx] = points_in_polygon(lngs[idx], lats[idx], self.points)
+        return result
+
+
+def compile_fence(fence):
+    coords = json.loads(fence.coordinates_json)
+    if fence.shape == "circle":
+        return CompiledGeometry("circle", center=parse_center(coords), radius=fence.radius)
+    elif fence.shape == "polygon":
+        return CompiledGeometry("polygon", points=parse_points(coords))
+    return None
+
+
+def compile_region(region):
+    return CompiledGeometry("polygon", points=parse_points(json.loads(region.coordinates_json)))
+
+
+class _GeometrySource:
+    """Stand-in row for compile_fence / compile_region in shard worker processes."""
+
+    def __init__(self, coordinates_json, shape=None, radius=None):
+        self.coordinates_json = coordinates_json
+        self.shape = shape
+        self.radius = radius
+
+
+def evaluate_shard(task):
+    """
+    Process-pool worker for sharded recounts (see app.services.fence_shards).
+
+    task: (fence_specs, region_json, lats, lngs) where each fence spec is
+    (fence_id, shape, coordinates_json, radius, in_region) and lats / lngs hold only
+    the shard's devices. Returns {fence_id: local indices}: devices inside the fence,
+    or with in_region, devices inside region_json but outside the fence.
+    Only plain data crosses the process boundary; geometry is compiled here.
+    """
+    fence_specs, region_json, lats, lngs = task
+    in_region = None
+    if region_json is not None:
+        in_region = compile_region(_GeometrySource(region_json)).contains_many(lats, lngs)
+
+    result = {}
+    for fence_id, shape, coordinates_json, radius, scoped in fence_specs:
+        inside = compile_fence(_GeometrySource(coordinates_json, shape, radius)).contains_many(lats, lngs)
+        mask = in_region & ~inside if scoped else inside
+        result[fence_id] = np.nonzero(mask)[0].astype(np.int32)
+    return result
+
+
+class GeometryCache:
+    """
+    Compiled geometry keyed by (kind, id) and a version.
+
+    The version is bumped by invalidate_*() on every edit/delete; entries also remember
+    the source they were built from, so rows changed behind our back are recompiled.
+    Geometry that fails to parse is cached as None ("contains nothing").
+    """
+
+    def __init__(self):
+        self._entries = {}  # (kind, id) -> (version, source, geometry)
+        self._versions = {}  # (kind, id) -> int
+        self._lock = threading.Lock()
+
+    def fence(self, fence):
+        source = (fence.coordinates_json, str(fence.shape), fence.radius)
+        return self._get("fence", fence.id, source, compile_fence, fence)
+
+    def region(self, region):
+        source = (region.coordinates_json,)
+        return self._get("region", region.id, source, compile_region, region)
+
+    def invalidate_fence(self, fence_id):
+        self._invalidate(("fence", fence_id))
+
+    def invalidate_region(self, region_id):
+        self._invalidate(("region", region_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _invalidate(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def _get(self, kind, obj_id, source, compile_fn, obj):
+        key = (kind, obj_id)
+        with self._lock:
+            version = self._versions.get(key, 0)
+            entry = self._entries.get(key)
+        if entry and entry[0] == version and entry[1] == source:
+            return entry[2]
+
+        try:
+            geometry = compile_fn(obj)
+        except Exception as e:
+            logger.error(f"Invalid geometry for {kind} {obj_id}: {e}")
+            geometry = None
+
+        if obj_id is not None:
+            with self._lock:
+                # Don't overwrite with a stale build if an invalidation raced us
+                if self._versions.get(key, 0) == version:
+                    self._entries[key] = (version, source, geometry)
+        return geometry
+
+
+# 全局单例
+geometry_cache = GeometryCache()
@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from loguru import logger
 import os
 
@@ -10,7 +11,9 @@ os.makedirs(LOG_DIR, exist_ok=True)
 # Configure logger
 # Rotates every 500MB, keeps logs for 10 days
 LOG_PATH = os.path.join(LOG_DIR, "smart_helmet.log")
-logger.add(LOG_PATH, mode="w", rotation="500 MB", retention="10 days", level="INFO", encoding="utf-8")
+# Worker processes (fence shard pool) append to the log the main process started
+LOG_MODE = "w" if multiprocessing.parent_process() is None else "a"
+logger.add(LOG_PATH, mode=LOG_MODE, rotation="500 MB", retention="10 days", level="INFO", encoding="utf-8")
 
 def get_logger(module_name: str):
     """
@@ -0,0 +1,123 @@
+import math
+import threading
+
+# Degrees of latitude per metre (approximation, good enough for bounding boxes)
+METERS_PER_DEGREE = 111320.0
+
+
+def circle_bbox(center_lat, center_lng, radius_m, margin=1.1):
+    """
+    Bounding box (min_lng, min_lat, max_lng, max_lat) of a circle given in metres.
+    A small margin covers the difference between haversine and planar distance.
+    """
+    r = (radius_m or 0) * margin
+    dlat = r / METERS_PER_DEGREE
+    cos_lat = max(math.cos(math.radians(center_lat)), 1e-6)
+    dlng = r / (METERS_PER_DEGREE * cos_lat)
+    return (center_lng - dlng, center_lat - dlat, center_lng + dlng, center_lat + dlat)
+
+
+def points_bbox(points):
+    """Bounding box (min_lng, min_lat, max_lng, max_lat) of a list of (lng, lat)."""
+    if not points:
+        return None
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class GridSpatialIndex:
+    """
+    Uniform grid over bounding boxes (min_lng, min_lat, max_lng, max_lat).
+
+    Every key is registered in each cell its bbox overlaps, so a point query only
+    looks at one cell: O(1) lookup + O(hits) bbox checks.
+    Boxes that would span too many cells go to a small "oversized" list that is
+    scanned linearly, and global keys match every point.
+    """
+
+    def __init__(self, cell_size: float = 0.01, max_cells_per_entry: int = 4096):
+        self.cell_size = cell_size  # degrees, ~1km at the equator
+        self.max_cells_per_entry = max_cells_per_entry
+        self._cells = {}  # (cx, cy) -> set(key)
+        self._boxes = {}  # key -> bbox
+        self._oversized = set()
+        self._global = set()
+        self._lock = threading.RLock()
+
+    def _cell(self, lng, lat):
+        return (math.floor(lng / self.cell_size), math.floor(lat / self.cell_size))
+
+    def _cell_range(self, bbox):
+        min_x, min_y = self._cell(bbox[0], bbox[1])
+        max_x, max_y = self._cell(bbox[2], bbox[3])
+        return min_x, min_y, max_x, max_y
+
+    def insert(self, key, bbox):
+        """Register (or re-register) a key with its bounding box."""
+        with self._lock:
+            self.remove(key)
+            self._boxes[key] = bbox
+            min_x, min_y, max_x, max_y = self._cell_range(bbox)
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > self.max_cells_per_entry:
+                self._oversized.add(key)
+                return
+            for cx in range(min_x, max_x + 1):
+                for cy in range(min_y, max_y + 1):
+                    self._cells.setdefault((cx, cy), set()).add(key)
+
+    def insert_global(self, key):
+        """Register a key that is a candidate for every point."""
+        with self._lock:
+            self.remove(key)
+            self._global.add(key)
+
+    def remove(self, key):
+        with self._lock:
+            self._global.discard(key)
+            self._oversized.discard(key)
+            bbox = self._boxes.pop(key, None)
+            if bbox is None:
+                return
+            min_x, min_y, max_x, max_y = self._cell_range(bbox)
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > self.max_cells_per_entry:
+                return
+            for cx in range(min_x, max_x + 1):
+                for cy in range(min_y, max_y + 1):
+                    bucket = self._cells.get((cx, cy))
+                    if bucket is None:
+                        continue
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._cells[(cx, cy)]
+
+    def query(self, lng, lat):
+        """Return the set of keys whose bbox contains the point (plus global keys)."""
+        with self._lock:
+            hits = set(self._global)
+            for key in self._cells.get(self._cell(lng, lat), ()):
+                if self._bbox_contains(self._boxes[key], lng, lat):
+                    hits.add(key)
+            for key in self._oversized:
+                if self._bbox_contains(self._boxes[key], lng, lat):
+                    hits.add(key)
+            return hits
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._boxes.clear()
+            self._oversized.clear()
+            self._global.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._boxes) + len(self._global)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._boxes or key in self._global
+
+    @staticmethod
+    def _bbox_contains(bbox, lng, lat):
+        return bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3]
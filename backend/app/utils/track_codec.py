@@ -0,0 +1,105 @@
+import zlib
+
+# Coordinates are stored as integer micro-degrees (~0.11 m), timestamps as epoch ms
+COORD_SCALE = 1_000_000
+
+# Block flags
+_RAW = 0
+_ZLIB = 1
+
+
+def zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def write_varint(out: bytearray, n: int):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(buf, pos: int):
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_block(points) -> bytes:
+    """
+    Encode [(ts_ms, lat, lng), ...] (sorted by ts) as one self-contained block:
+
+      varint(body_len) | flag | body
+      body = varint(count) | first point | (dts, dlat, dlng) * (count - 1)
+
+    Every value is a zigzag varint delta from the previous point, so a helmet
+    reporting once a second while walking costs about 4 bytes per point. The body
+    is zlib-compressed when that helps (long stationary runs shrink to almost nothing).
+    Blocks are appended to a segment file as they are flushed.
+    """
+    body = bytearray()
+    write_varint(body, len(points))
+    prev_ts = prev_lat = prev_lng = 0
+    for ts, lat, lng in points:
+        ilat = round(lat * COORD_SCALE)
+        ilng = round(lng * COORD_SCALE)
+        write_varint(body, zigzag(ts - prev_ts))
+        write_varint(body, zigzag(ilat - prev_lat))
+        write_varint(body, zigzag(ilng - prev_lng))
+        prev_ts, prev_lat, prev_lng = ts, ilat, ilng
+
+    flag = _RAW
+    packed = zlib.compress(bytes(body), 6)
+    if len(packed) < len(body):
+        body, flag = packed, _ZLIB
+
+    out = bytearray()
+    write_varint(out, len(body))
+    out.append(flag)
+    out += body
+    return bytes(out)
+
+
+def decode_blocks(data: bytes):
+    """
+    Yield (ts_ms, lat, lng) from a segment file's contents, block by block.
+    A truncated trailing block (interrupted write) is ignored.
+    """
+    pos, size = 0, len(data)
+    while pos < size:
+        try:
+            length, body_start = read_varint(data, pos)
+            flag = data[body_start]
+        except IndexError:
+            return
+        body_start += 1
+        body_end = body_start + length
+        if body_end > size:
+            return
+        body = data[body_start:body_end]
+        pos = body_end
+        if flag == _ZLIB:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                continue
+
+        count, p = read_varint(body, 0)
+        ts = ilat = ilng = 0
+        for _ in range(count):
+            d, p = read_varint(body, p)
+            ts += unzigzag(d)
+            d, p = read_varint(body, p)
+            ilat += unzigzag(d)
+            d, p = read_varint(body, p)
+            ilng += unzigzag(d)
+            yield ts, ilat / COORD_SCALE, ilng / COORD_SCALE
@@ -0,0 +1,123 @@
+"""
+Shared plumbing for the fence engine benchmarks: a throwaway SQLite database,
+statement counting, latency summaries and pointing the engine singletons at it.
+"""
+import os
+import sys
+import json
+import tempfile
+import threading
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Allow `python benchmarks/xxx.py` from the backend directory as well as `python -m`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import Base
+from app.models.admin_user import User
+from app.models.alarm_records import AlarmRecord
+from app.models.alarm_rollup import AlarmRollup
+from app.models.device import Device
+from app.models.fence import ElectronicFence, ProjectRegion
+from app.models.group_call import GroupCallSession
+from app.models.video import VideoDevice
+from app.services.location_store import location_store
+from app.services.track_store import track_store
+
+
+def make_session_factory(db_url: str = "sqlite://", reset: bool = True):
+    """
+    Create the schema and return (engine, sessionmaker). With reset, existing
+    tables are dropped first. The default is an in-memory SQLite database shared
+    by all threads; pass a sqlite:///path URL to keep the data around for inspection.
+    """
+    if db_url in ("sqlite://", "sqlite:///:memory:"):
+        engine = create_engine(db_url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    elif db_url.startswith("sqlite"):
+        engine = create_engine(db_url, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(db_url)
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def use_session_factory(session_factory):
+    """Point the engine's background writers at the benchmark database."""
+    location_store.session_factory = session_factory
+    track_store.root = tempfile.mkdtemp(prefix="fence-bench-tracks-")
+
+
+def quiet_logs(level: str = "ERROR"):
+    """The engine logs every batch and alarm (INFO / WARNING); keep benchmark output readable."""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=level)
+
+
+class StatementCounter:
+    """Counts SQL statements executed on an engine, split by verb."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.counts = {}
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        with self._lock:
+            self.counts[verb] = self.counts.get(verb, 0) + 1
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.counts.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts, total=sum(self.counts.values()))
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def summarize(samples_s, count: int = None, rate: bool = True) -> dict:
+    """
+    Latency summary in milliseconds for a list of durations in seconds. With rate,
+    the samples are back-to-back calls and total time / throughput are included too.
+    """
+    if not samples_s:
+        return {"n": 0}
+    arr = np.asarray(samples_s, dtype=float) * 1000.0
+    n = count if count is not None else len(arr)
+    summary = {"n": n}
+    if rate:
+        total_s = float(arr.sum()) / 1000.0
+        summary["total_s"] = round(total_s, 4)
+        summary["per_sec"] = round(n / total_s, 1) if total_s > 0 else None
+    summary.update({
+        "mean_ms": round(float(arr.mean()), 4),
+        "p50_ms": round(float(np.percentile(arr, 50)), 4),
+        "p95_ms": round(float(np.percentile(arr, 95)), 4),
+        "p99_ms": round(float(np.percentile(arr, 99)), 4),
+        "max_ms": round(float(arr.max()), 4),
+    })
+    return summary
+
+
+def emit(result: dict, output: str = None):
+    """Write results as JSON to a file, or to stdout."""
+    text = json.dumps(result, indent=2, ensure_ascii=False, default=str)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
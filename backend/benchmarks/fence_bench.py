@@ -0,0 +1,210 @@
+"""
+Fence engine benchmark.
+
+Generates a synthetic site (N devices, M fences, K project regions) in SQLite and
+measures the fence engine entry points:
+
+  warm_up            startup: index build + full worker_count recount
+  check_status       FenceService.check_fence_status, one ping at a time
+  check_status_batch FenceService.check_fence_status_batch, in batches
+  update_count       FenceService._update_fence_count for single fences
+  create_fence       FenceService.create_fence (incl. alarms for devices inside)
+  edit_fence         bursts of FenceService.update_fence with the background recount
+                     queue running: edit latency, and time until the counts settle
+  location_flush     write-behind flush of the buffered device positions
+
+Results (latency percentiles, throughput and SQL statements per call) are written
+as JSON, so runs can be compared to catch regressions in cost per ping.
+
+Usage (from the backend directory):
+  python -m benchmarks.fence_bench --devices 5000 --fences 200 --regions 20 --output bench.json
+"""
+import argparse
+import platform
+import time
+from datetime import datetime
+import numpy as np
+import sqlalchemy
+from benchmarks.common import (
+    make_session_factory, use_session_factory, quiet_logs, StatementCounter, summarize, emit,
+)
+from benchmarks.synthetic import SyntheticSite
+from app.models.fence import ElectronicFence
+from app.schemas.fence_schema import FenceUpdate
+from app.services.fence_recount import fence_recounts
+from app.services.fence_service import FenceService
+from app.services.location_store import location_store
+from app.utils import fence_geometry
+
+SCENARIOS = [
+    "warm_up", "check_status", "check_status_batch", "update_count", "create_fence", "edit_fence", "location_flush",
+]
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def per_call(counter: StatementCounter, calls: int) -> float:
+    return round(counter.total / calls, 3) if calls else 0.0
+
+
+def edit_burst(db, service, session_factory, site, counter, edits: int) -> dict:
+    """Map-editor style edits: several quick updates to the same few fences."""
+    fence_recounts.start(lambda ids, alarms: service.apply_recounts(ids, alarms, session_factory=session_factory))
+    try:
+        fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(site.fence_ids[:5])).all()
+        before = fence_recounts.snapshot_stats()
+        samples = []
+        counter.reset()
+        for i in range(edits):
+            fence = fences[i % len(fences)]
+            payload = FenceUpdate(remark=f"edit {i}", coordinates_json=fence.coordinates_json)
+            samples.append(timed(service.update_fence, db, fence.id, payload))
+        settle_start = time.perf_counter()
+        fence_recounts.wait_idle()
+        settle = time.perf_counter() - settle_start
+        after = fence_recounts.snapshot_stats()
+    finally:
+        fence_recounts.stop()
+    return dict(
+        summarize(samples),
+        settle_s=round(settle, 3),
+        recount_runs=after["runs"] - before["runs"],
+        recounts_coalesced=after["coalesced"] - before["coalesced"],
+        statements_per_call=per_call(counter, len(samples)),
+        statements=counter.snapshot(),
+    )
+
+
+def run(args) -> dict:
+    engine, session_factory = make_session_factory(args.db)
+    use_session_factory(session_factory)
+    counter = StatementCounter(engine)
+    service = FenceService()
+    site = SyntheticSite(seed=args.seed)
+
+    db = session_factory()
+    started = time.perf_counter()
+    site.populate(db, args.devices, args.fences, args.regions)
+    results = {"populate_s": round(time.perf_counter() - started, 3)}
+    scenarios = args.scenarios or SCENARIOS
+
+    try:
+        # The engine has to be warm for the per-ping paths, so warm_up always runs
+        counter.reset()
+        results["warm_up"] = dict(summarize([timed(service.warm_up, db)]), statements=counter.snapshot())
+
+        if "check_status" in scenarios and args.pings:
+            samples = []
+            counter.reset()
+            for ping in site.pings(args.pings, args.step):
+                samples.append(timed(service.check_fence_status, db, ping.device_id, ping.lat, ping.lng))
+            results["check_status"] = dict(
+                summarize(samples), statements_per_ping=per_call(counter, len(samples)), statements=counter.snapshot()
+            )
+
+        if "check_status_batch" in scenarios and args.pings:
+            samples, points = [], 0
+            counter.reset()
+            remaining = args.pings
+            while remaining > 0:
+                batch = list(site.pings(min(args.batch_size, remaining), args.step))
+                remaining -= len(batch)
+                points += len(batch)
+                samples.append(timed(service.check_fence_status_batch, db, batch))
+            summary = summarize(samples)
+            results["check_status_batch"] = dict(
+                summary,
+                batch_size=args.batch_size,
+                points_per_sec=round(points / summary["total_s"], 1) if summary["total_s"] else None,
+                statements_per_ping=per_call(counter, points),
+                statements=counter.snapshot(),
+            )
+
+        if "update_count" in scenarios and site.fence_ids:
+            fences = db.query(ElectronicFence).filter(ElectronicFence.id.in_(site.fence_ids)).all()
+            sample = [fences[i % len(fences)] for i in range(args.recounts)]
+            counter.reset()
+            samples = [timed(service._update_fence_count, db, fence) for fence in sample]
+            results["update_count"] = dict(
+                summarize(samples), statements_per_call=per_call(counter, len(samples)), statements=counter.snapshot()
+            )
+
+        if "create_fence" in scenarios and args.creates:
+            samples = []
+            counter.reset()
+            for _ in range(args.creates):
+                payload = site.fence_create()
+                samples.append(timed(service.create_fence, db, payload))
+            results["create_fence"] = dict(
+                summarize(samples), statements_per_call=per_call(counter, len(samples)), statements=counter.snapshot()
+            )
+
+        if "edit_fence" in scenarios and args.edits and site.fence_ids:
+            results["edit_fence"] = edit_burst(db, service, session_factory, site, counter, args.edits)
+
+        if "location_flush" in scenarios:
+            pending = len(location_store.pending())
+            counter.reset()
+            elapsed = timed(location_store.flush)
+            results["location_flush"] = dict(
+                summarize([elapsed]), devices=pending, statements=counter.snapshot()
+            )
+    finally:
+        db.close()
+        counter.close()
+
+    return {
+        "benchmark": "fence_engine",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {
+            "devices": args.devices,
+            "fences": args.fences,
+            "regions": args.regions,
+            "pings": args.pings,
+            "batch_size": args.batch_size,
+            "recounts": args.recounts,
+            "creates": args.creates,
+            "edits": args.edits,
+            "step_m": args.step,
+            "seed": args.seed,
+            "db": args.db,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "numpy": np.__version__,
+            "shapely": getattr(fence_geometry.shapely, "__version__", None),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fence engine on a synthetic site.")
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--fences", type=int, default=100)
+    parser.add_argument("--regions", type=int, default=10)
+    parser.add_argument("--pings", type=int, default=2000, help="pings per check_status scenario")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--recounts", type=int, default=50, help="_update_fence_count calls")
+    parser.add_argument("--creates", type=int, default=20, help="create_fence calls")
+    parser.add_argument("--edits", type=int, default=50, help="update_fence calls (edit_fence)")
+    parser.add_argument("--step", type=float, default=5.0, help="random-walk step per ping (m)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default="sqlite://", help="SQLAlchemy URL (default: in-memory SQLite)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, help="subset to run (default: all)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args(argv)
+
+    quiet_logs(args.log_level)
+    emit(run(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
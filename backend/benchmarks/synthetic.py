@@ -0,0 +1,188 @@
+"""
+Synthetic sites for the fence engine benchmarks: project regions, fences and
+helmets placed around a city centre with realistic sizes, plus device movement.
+
+Regions are irregular 400-1500 m polygons. Inside a region sit small "No Entry"
+hazard fences (polygons with 5-10 vertices or circles, 30-250 m) and now and then a
+"No Exit" work area covering most of the region. Most devices work inside a region
+and a few wander around the city, so the fence index sees the usual mix of hits
+and misses.
+"""
+import json
+import math
+import random
+from sqlalchemy import insert
+from app.models.device import Device
+from app.models.fence import ElectronicFence, ProjectRegion, FenceShape, AlarmLevel
+from app.schemas.fence_schema import FenceCreate, LocationPing
+from app.utils.spatial_index import METERS_PER_DEGREE
+
+# Shanghai People's Square (GCJ-02), same base as reset_db.py
+DEFAULT_CENTER = (31.2304, 121.4737)
+
+SCHEDULES = ["00:00-23:59"] * 7 + ["7.00-19.00", "6.30-22.00", "22.00-6.00"]
+
+
+def offset(lat, lng, north_m, east_m):
+    """Move a point by metres north / east."""
+    dlat = north_m / METERS_PER_DEGREE
+    dlng = east_m / (METERS_PER_DEGREE * math.cos(math.radians(lat)))
+    return lat + dlat, lng + dlng
+
+
+def irregular_polygon(rng, lat, lng, radius_m, vertices):
+    """Star-shaped polygon with jittered radii, as [[lat, lng], ...]."""
+    points = []
+    for k in range(vertices):
+        angle = 2 * math.pi * k / vertices + rng.uniform(-0.2, 0.2)
+        r = radius_m * rng.uniform(0.6, 1.0)
+        p = offset(lat, lng, r * math.cos(angle), r * math.sin(angle))
+        points.append([round(p[0], 6), round(p[1], 6)])
+    return points
+
+
+class SyntheticSite:
+    """What was generated, so load generators can place devices near fences."""
+
+    def __init__(self, seed: int = 1, center=DEFAULT_CENTER, spread_m: float = 15000):
+        self.rng = random.Random(seed)
+        self.center = center
+        self.spread_m = spread_m
+        self.regions = []  # [(region_id, lat, lng, radius_m)]
+        self.fence_ids = []
+        self.devices = {}  # device_id -> [lat, lng, home region or None]
+
+    # --- Generation ---
+    def populate(self, db, n_devices: int, n_fences: int, n_regions: int):
+        """Insert regions, fences and devices in bulk."""
+        self.add_regions(db, n_regions)
+        self.add_fences(db, n_fences)
+        self.add_devices(db, n_devices)
+        db.commit()
+        return self
+
+    def random_point(self, radius_m=None, around=None):
+        lat, lng = around or self.center
+        radius_m = self.spread_m if radius_m is None else radius_m
+        r = radius_m * math.sqrt(self.rng.random())
+        angle = self.rng.uniform(0, 2 * math.pi)
+        return offset(lat, lng, r * math.cos(angle), r * math.sin(angle))
+
+    def add_regions(self, db, n, anchors=None):
+        """Add n regions, centred on random `anchors` [(lat, lng)] when given."""
+        rows = []
+        for _ in range(n):
+            lat, lng = self.rng.choice(anchors) if anchors else self.random_point()
+            radius = self.rng.uniform(400, 1500)
+            rows.append({
+                "name": f"SIM-R{len(self.regions) + len(rows) + 1}",
+                "coordinates_json": json.dumps(irregular_polygon(self.rng, lat, lng, radius, self.rng.randint(6, 12))),
+                "remark": "synthetic",
+                "_geo": (lat, lng, radius),
+            })
+        if not rows:
+            return
+        first = (db.query(ProjectRegion.id).order_by(ProjectRegion.id.desc()).first() or (0,))[0] + 1
+        db.execute(insert(ProjectRegion), [{k: v for k, v in r.items() if k != "_geo"} for r in rows])
+        ids = [r[0] for r in db.query(ProjectRegion.id).filter(ProjectRegion.id >= first).order_by(ProjectRegion.id)]
+        for region_id, row in zip(ids, rows):
+            self.regions.append((region_id,) + row["_geo"])
+
+    def fence_fields(self, region=None) -> dict:
+        """Column values for one random fence (inside `region` if given)."""
+        if region is None and self.regions:
+            region = self.rng.choice(self.regions)
+        if region is not None and self.rng.random() < 0.2:
+            # Work area: most of the region, workers must stay inside
+            behavior = "No Exit"
+            lat, lng = self.random_point(region[3] * 0.1, around=(region[1], region[2]))
+            radius = region[3] * self.rng.uniform(0.7, 1.0)
+        else:
+            # Hazard zone: small, workers must keep out
+            behavior = "No Entry"
+            if region is not None:
+                lat, lng = self.random_point(region[3] * 0.6, around=(region[1], region[2]))
+            else:
+                lat, lng = self.random_point()
+            radius = self.rng.uniform(30, 250)
+        if self.rng.random() < 0.7:
+            shape = FenceShape.POLYGON
+            coords = irregular_polygon(self.rng, lat, lng, radius, self.rng.randint(5, 10))
+        else:
+            shape = FenceShape.CIRCLE
+            coords = [round(lat, 6), round(lng, 6)]
+        return {
+            "name": f"SIM-F{self.rng.randrange(10 ** 6)}",
+            "project_region_id": region[0] if region is not None else None,
+            "shape": shape,
+            "behavior": behavior,
+            "coordinates_json": json.dumps(coords),
+            "radius": round(radius, 1),
+            "effective_time": self.rng.choice(SCHEDULES),
+            "remark": "synthetic",
+            "alarm_type": self.rng.choice(list(AlarmLevel)),
+        }
+
+    def fence_create(self, region=None) -> FenceCreate:
+        """A FenceCreate payload, as the API would receive it."""
+        fields = self.fence_fields(region)
+        fields["shape"] = fields["shape"].value
+        fields["alarm_type"] = fields["alarm_type"].value
+        return FenceCreate(**fields)
+
+    def add_fences(self, db, n):
+        rows = [dict(self.fence_fields(), worker_count=0, is_active=1) for _ in range(n)]
+        if not rows:
+            return
+        first = (db.query(ElectronicFence.id).order_by(ElectronicFence.id.desc()).first() or (0,))[0] + 1
+        db.execute(insert(ElectronicFence), rows)
+        self.fence_ids.extend(
+            r[0] for r in db.query(ElectronicFence.id).filter(ElectronicFence.id >= first).order_by(ElectronicFence.id)
+        )
+
+    def add_devices(self, db, n):
+        rows = []
+        start = len(self.devices)
+        for i in range(start, start + n):
+            region = None
+            if self.regions and self.rng.random() < 0.85:
+                region = self.rng.choice(self.regions)
+                lat, lng = self.random_point(region[3], around=(region[1], region[2]))
+            else:
+                lat, lng = self.random_point()
+            device_id = f"SIM-{i + 1:06d}"
+            self.devices[device_id] = [lat, lng, region]
+            rows.append({
+                "id": device_id,
+                "device_name": f"Synthetic {i + 1}",
+                "device_type": "HELMET_CAM",
+                "ip_address": "127.0.0.1",
+                "port": 8000,
+                "is_online": True,
+                "last_latitude": lat,
+                "last_longitude": lng,
+            })
+        if rows:
+            db.execute(insert(Device), rows)
+
+    # --- Movement ---
+    def step(self, device_id, step_m: float = 5.0):
+        """Random-walk one device (pulled back towards its region) and return its new position."""
+        state = self.devices[device_id]
+        lat, lng, region = state
+        north = self.rng.gauss(0, step_m)
+        east = self.rng.gauss(0, step_m)
+        if region is not None:
+            # Weak pull towards the region centre keeps workers on site
+            north += (region[1] - lat) * METERS_PER_DEGREE * 0.01
+            east += (region[2] - lng) * METERS_PER_DEGREE * math.cos(math.radians(lat)) * 0.01
+        state[0], state[1] = offset(lat, lng, north, east)
+        return state[0], state[1]
+
+    def pings(self, n: int, step_m: float = 5.0):
+        """n LocationPings from randomly chosen devices, each a step from its last position."""
+        ids = list(self.devices)
+        for _ in range(n):
+            device_id = self.rng.choice(ids)
+            lat, lng = self.step(device_id, step_m)
+            yield LocationPing(device_id=device_id, lat=lat, lng=lng)
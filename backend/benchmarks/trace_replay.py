@@ -0,0 +1,320 @@
+"""
+GPS trace replay for the fence / alarm pipeline.
+
+Reads a recorded trace (CSV or NDJSON with device_id, ts, lat, lng) and plays it
+through FenceService at real time (--speed 1), N times faster (--speed N) or as
+fast as possible (--speed 0). A producer thread releases each ping at its scheduled
+time into a queue; a consumer thread feeds them to check_fence_status one by one
+(--mode single) or in micro-batches to check_fence_status_batch (--mode batch, the
+path the ingest channel uses). Queueing delay therefore shows up in the latencies
+whenever the pipeline falls behind the trace.
+
+Reported as JSON:
+  ping_latency   scheduled release -> processing committed, for every ping
+  alarm_latency  scheduled release -> alarm row committed, for pings that raised one
+  alarms         alarm rows written, and per device
+  statements     SQL statements by verb, and per ping
+  lag            how far the consumer finished behind the end of the trace
+
+Devices missing from the database are registered at their first position. If the
+database has no fences, synthetic regions and fences are generated around the
+trace (see benchmarks.synthetic).
+
+Usage (from the backend directory):
+  python -m benchmarks.trace_replay trace.csv --speed 10 --mode batch --output replay.json
+  python -m benchmarks.trace_replay --make-trace trace.csv --devices 500 --duration 600
+"""
+import argparse
+import csv
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from benchmarks.common import (
+    make_session_factory, use_session_factory, quiet_logs, StatementCounter, summarize, emit,
+)
+from benchmarks.synthetic import SyntheticSite
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.models.fence import ElectronicFence
+from app.schemas.fence_schema import LocationPing
+from app.services.fence_service import FenceService
+from app.services.location_ingest import parse_ts
+
+_ALARMS_KEY = "replay_alarms"
+_DONE = object()
+
+
+# --- Trace I/O ---
+def load_trace(path):
+    """Parse a CSV (with or without header) or NDJSON trace into LocationPings, ordered by ts."""
+    pings = []
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        if first.lstrip().startswith("{"):
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    pings.append(LocationPing(
+                        device_id=str(item.get("device_id") or item.get("id")),
+                        lat=item["lat"], lng=item["lng"], ts=parse_ts(item.get("ts")),
+                    ))
+        else:
+            reader = csv.reader(f)
+            columns = ["device_id", "ts", "lat", "lng"]
+            for n, row in enumerate(reader):
+                if not row:
+                    continue
+                if n == 0 and "device_id" in [c.strip().lower() for c in row]:
+                    columns = [c.strip().lower() for c in row]
+                    continue
+                item = dict(zip(columns, row))
+                pings.append(LocationPing(
+                    device_id=item["device_id"].strip(),
+                    lat=float(item["lat"]), lng=float(item["lng"]), ts=parse_ts(item["ts"].strip()),
+                ))
+    if any(p.ts is None for p in pings):
+        raise ValueError("Every trace row needs a timestamp")
+    pings.sort(key=lambda p: p.ts)
+    return pings
+
+
+def make_trace(path, devices: int, duration_s: float, interval_s: float, seed: int):
+    """Write a synthetic CSV trace (random walks around synthetic regions)."""
+    site = SyntheticSite(seed=seed)
+    # Only the geometry is needed here, not a database
+    regions = [site.random_point() for _ in range(max(devices // 50, 1))]
+    for i in range(devices):
+        lat, lng = site.random_point(1000, around=site.rng.choice(regions))
+        site.devices[f"SIM-{i + 1:06d}"] = [lat, lng, None]
+    start = datetime.now().replace(microsecond=0)
+    rows = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["device_id", "ts", "lat", "lng"])
+        t = 0.0
+        while t < duration_s:
+            for device_id in site.devices:
+                lat, lng = site.step(device_id, step_m=1.5 * interval_s)
+                ts = start + timedelta(seconds=t + site.rng.uniform(0, interval_s))
+                writer.writerow([device_id, ts.isoformat(), f"{lat:.6f}", f"{lng:.6f}"])
+                rows += 1
+            t += interval_s
+    return rows
+
+
+# --- Database preparation ---
+def prepare(db, pings, fences: int, regions: int, seed: int) -> dict:
+    """Register unknown devices and, on a database without fences, generate some."""
+    first_seen = {}
+    for p in pings:
+        first_seen.setdefault(p.device_id, (p.lat, p.lng))
+    known = set()
+    ids = list(first_seen)
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start:start + 1000]
+        known.update(r[0] for r in db.query(Device.id).filter(Device.id.in_(chunk)))
+    rows = [
+        {
+            "id": device_id, "device_name": device_id, "device_type": "HELMET_CAM",
+            "ip_address": "127.0.0.1", "port": 8000, "is_online": True,
+            "last_latitude": lat, "last_longitude": lng,
+        }
+        for device_id, (lat, lng) in first_seen.items() if device_id not in known
+    ]
+    if rows:
+        db.execute(insert(Device), rows)
+
+    generated = 0
+    if not db.query(ElectronicFence.id).first():
+        lats = [p[0] for p in first_seen.values()]
+        lngs = [p[1] for p in first_seen.values()]
+        site = SyntheticSite(seed=seed, center=(sum(lats) / len(lats), sum(lngs) / len(lngs)))
+        site.add_regions(db, regions, anchors=list(first_seen.values()))
+        site.add_fences(db, fences)
+        generated = len(site.fence_ids)
+    db.commit()
+    return {"devices": len(first_seen), "devices_registered": len(rows), "fences_generated": generated}
+
+
+# --- Replay ---
+class Replayer:
+    def __init__(self, session_factory, counter: StatementCounter, speed: float,
+                 mode: str, batch_size: int, flush_interval: float):
+        self.session_factory = session_factory
+        self.counter = counter
+        self.speed = speed
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.ping_latency = []
+        self.alarm_latency = []
+        self.alarms_by_device = {}
+        self.errors = 0
+        self.service = FenceService()
+
+    def _produce(self, pings, t0):
+        """Release pings at their (scaled) trace time."""
+        ts0 = pings[0].ts
+        for ping in pings:
+            if self.speed > 0:
+                due = t0 + (ping.ts - ts0).total_seconds() / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due = time.perf_counter()
+            self.queue.put((due, ping))
+        self.queue.put(_DONE)
+
+    def _consume(self):
+        db = self.session_factory()
+        event.listen(db, "before_flush", self._collect_alarms)
+        try:
+            done = False
+            while not done:
+                item = self.queue.get()
+                if item is _DONE:
+                    break
+                batch = [item]
+                if self.mode == "batch":
+                    deadline = time.perf_counter() + self.flush_interval
+                    while len(batch) < self.batch_size:
+                        try:
+                            item = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                        except queue.Empty:
+                            break
+                        if item is _DONE:
+                            done = True
+                            break
+                        batch.append(item)
+                self._process(db, batch)
+        finally:
+            db.close()
+
+    def _process(self, db, batch):
+        db.info[_ALARMS_KEY] = []
+        try:
+            if self.mode == "batch":
+                self.service.check_fence_status_batch(db, [ping for _, ping in batch])
+            else:
+                due, ping = batch[0]
+                self.service.check_fence_status(db, ping.device_id, ping.lat, ping.lng)
+        except Exception:
+            self.errors += 1
+            db.rollback()
+            return
+        finished = time.perf_counter()
+
+        released = {}
+        for due, ping in batch:
+            self.ping_latency.append(finished - due)
+            released.setdefault(ping.device_id, due)
+        for device_id in db.info.pop(_ALARMS_KEY, []):
+            self.alarms_by_device[device_id] = self.alarms_by_device.get(device_id, 0) + 1
+            if device_id in released:
+                self.alarm_latency.append(finished - released[device_id])
+
+    @staticmethod
+    def _collect_alarms(session, flush_context, instances):
+        alarms = session.info.get(_ALARMS_KEY)
+        if alarms is None:
+            return
+        alarms.extend(obj.device_id for obj in session.new if isinstance(obj, AlarmRecord))
+
+    def run(self, pings) -> dict:
+        t0 = time.perf_counter()
+        consumer = threading.Thread(target=self._consume, name="replay-consumer")
+        consumer.start()
+        self._produce(pings, t0)
+        produced = time.perf_counter()
+        consumer.join()
+        finished = time.perf_counter()
+
+        trace_s = (pings[-1].ts - pings[0].ts).total_seconds()
+        return {
+            "pings": len(pings),
+            "trace_duration_s": round(trace_s, 3),
+            "wall_s": round(finished - t0, 3),
+            "lag_s": round(finished - produced, 3),
+            "pings_per_sec": round(len(pings) / (finished - t0), 1) if finished > t0 else None,
+            "ping_latency": summarize(self.ping_latency, rate=False),
+            "alarm_latency": summarize(self.alarm_latency, rate=False),
+            "alarms": sum(self.alarms_by_device.values()),
+            "alarm_devices": len(self.alarms_by_device),
+            "errors": self.errors,
+            "statements": self.counter.snapshot(),
+            "statements_per_ping": round(self.counter.total / len(pings), 3) if pings else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a GPS trace through the fence pipeline.")
+    parser.add_argument("trace", nargs="?", help="CSV or NDJSON with device_id, ts, lat, lng")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N times faster, 0 = unthrottled")
+    parser.add_argument("--mode", choices=["single", "batch"], default="batch")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="batch mode: max wait for a batch (s)")
+    parser.add_argument("--db", default="sqlite://", help="SQLAlchemy URL (default: in-memory SQLite)")
+    parser.add_argument("--reset", action="store_true", help="drop existing tables first")
+    parser.add_argument("--fences", type=int, default=100, help="synthetic fences if the database has none")
+    parser.add_argument("--regions", type=int, default=10, help="synthetic regions if the database has none")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--make-trace", metavar="PATH", help="write a synthetic CSV trace and exit")
+    parser.add_argument("--devices", type=int, default=200, help="--make-trace: devices")
+    parser.add_argument("--duration", type=float, default=300, help="--make-trace: seconds of trace")
+    parser.add_argument("--interval", type=float, default=1.0, help="--make-trace: seconds between pings")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args(argv)
+
+    quiet_logs(args.log_level)
+    if args.make_trace:
+        rows = make_trace(args.make_trace, args.devices, args.duration, args.interval, args.seed)
+        print(f"Wrote {rows} pings to {args.make_trace}")
+        return
+    if not args.trace:
+        parser.error("a trace file is required (or --make-trace)")
+
+    pings = load_trace(args.trace)
+    if not pings:
+        parser.error("trace is empty")
+
+    engine, session_factory = make_session_factory(args.db, reset=args.reset)
+    use_session_factory(session_factory)
+    db = session_factory()
+    try:
+        setup = prepare(db, pings, args.fences, args.regions, args.seed)
+        FenceService().warm_up(db)
+    finally:
+        db.close()
+
+    counter = StatementCounter(engine)
+    replayer = Replayer(session_factory, counter, args.speed, args.mode, args.batch_size, args.flush_interval)
+    try:
+        results = replayer.run(pings)
+    finally:
+        counter.close()
+
+    emit({
+        "benchmark": "trace_replay",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {
+            "trace": args.trace,
+            "speed": args.speed,
+            "mode": args.mode,
+            "batch_size": args.batch_size,
+            "flush_interval": args.flush_interval,
+            "db": args.db,
+        },
+        "setup": setup,
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.core.database import engine, Base
+from app.core.database import engine, Base, SessionLocal
+from app.core.schema import ensure_columns, ensure_indexes
 from app.controllers import (
     admin_controller,
     device_controller,
@@ -13,7 +15,19 @@ from app.controllers import (
     call_controller,
     dashboard_controller,
     auth_controller,
+    import_controller,
 )
+from app.services.alarm_archive import alarm_archive
+from app.services.alarm_bus import alarm_bus
+from app.services.alarm_rollup import alarm_rollups
+from app.services.fence_service import FenceService
+from app.services.engine_snapshot import engine_snapshot
+from app.services.location_ingest import location_ingest
+from app.services.fence_recount import fence_recounts
+from app.services.fence_scheduler import fence_scheduler
+from app.services.fence_shards import fence_shards
+from app.services.location_store import location_store
+from app.services.track_store import track_store
 from app.utils.logger import get_logger
 
 # Enable verbose ONVIF/SOAP client logging for debugging PTZ stop issues
@@ -32,11 +46,52 @@ logging.getLogger('urllib3').setLevel(logging.DEBUG)
 # Initialize Logger
 logger = get_logger("Main")
 
-# Create Database Tables (Quick setup for dev)
-Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create Database Tables (Quick setup for dev). Done at startup rather than on
+    # import: fence_shards' spawned workers re-import this module.
+    Base.metadata.create_all(bind=engine)
+    ensure_columns(engine, Base.metadata)
+    ensure_indexes(engine, Base.metadata)
+    db = SessionLocal()
+    try:
+        alarm_rollups.ensure_built(db)  # First start with the rollup table: fill it from alarm_records
+    except Exception as e:
+        logger.error(f"Alarm rollup build failed: {e}")
+    finally:
+        db.close()
+    alarm_bus.start()
+    # Warm up the fence engine: spatial index + membership from the last snapshot
+    # (falls back to a full worker_count recount)
+    fence_service = FenceService()
+    db = SessionLocal()
+    try:
+        fence_service.warm_start(db)
+    except Exception as e:
+        logger.error(f"Fence engine warm-up failed: {e}")
+    finally:
+        db.close()
+    fence_scheduler.start(fence_service.apply_schedule_transitions)
+    fence_recounts.start(fence_service.apply_recounts)
+    location_store.start()
+    track_store.start()
+    engine_snapshot.start()
+    alarm_archive.start()
+    await location_ingest.start()
+    yield
+    await location_ingest.stop()
+    fence_scheduler.stop()
+    fence_recounts.stop()  # Runs recounts still queued
+    alarm_archive.stop()  # Ends after the chunk in progress
+    alarm_bus.stop()  # Writes alarms still queued
+    engine_snapshot.stop()  # Final snapshot for the next warm start
+    location_store.stop()  # Final flush of buffered device locations
+    track_store.stop()
+    fence_shards.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 os.makedirs(static_dir, exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
@@ -59,6 +114,7 @@ app.include_router(alarm_controller.router)
 app.include_router(call_controller.router)
 app.include_router(dashboard_controller.router)
 app.include_router(auth_controller.router)
+app.include_router(import_controller.router)
 
 @app.get("/")
 def root():
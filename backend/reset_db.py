@@ -12,6 +12,7 @@ from app.core.database import SQLALCHEMY_DATABASE_URL
 from app.core.database import Base
 from app.models.admin_user import User
 from app.models.alarm_records import AlarmRecord
+from app.models.alarm_rollup import AlarmRollup
 from app.models.device import Device
 from app.models.fence import ElectronicFence, ProjectRegion, FenceShape, AlarmLevel
 from app.models.group_call import GroupCallSession
@@ -0,0 +1,69 @@
+"""
+Shared fixtures: a throwaway in-memory SQLite database with the full schema and
+the fence / alarm engine singletons reset and pointed at it.
+
+Run from the backend directory:  python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import make_session_factory, quiet_logs
+from app.services.alarm_archive import alarm_archive
+from app.services.alarm_registry import open_alarms
+from app.services.alarm_scope import alarm_scope, AlarmScope
+from app.services.fence_index import fence_index
+from app.services.fence_state import fence_membership, fence_debouncer
+from app.services.ingest_filter import ingest_filter
+from app.services.location_store import location_store
+from app.services.track_store import track_store
+from app.utils.fence_geometry import geometry_cache
+
+quiet_logs()
+
+
+def _reset_engine():
+    fence_index.grid.clear()
+    fence_index._boundaries.clear()
+    fence_index._loaded = False
+    fence_membership.clear()
+    fence_debouncer.clear()
+    geometry_cache.clear()
+    with open_alarms._lock:
+        open_alarms._pairs.clear()
+        open_alarms._by_alarm.clear()
+        open_alarms._reserved.clear()
+    open_alarms.loaded = False
+    with ingest_filter._lock:
+        ingest_filter._last.clear()
+    with location_store._lock:
+        location_store._dirty.clear()
+    with track_store._lock:
+        track_store._pending.clear()
+        track_store._pending_count = 0
+
+
+@pytest.fixture
+def session_factory(monkeypatch, tmp_path):
+    engine, factory = make_session_factory("sqlite://")
+    _reset_engine()
+    monkeypatch.setattr(location_store, "session_factory", factory)
+    monkeypatch.setattr(track_store, "root", str(tmp_path / "tracks"))
+    monkeypatch.setattr(alarm_archive, "root", str(tmp_path / "alarm_archive"))
+    monkeypatch.setattr(alarm_archive, "session_factory", factory)
+    monkeypatch.setattr(alarm_archive, "_cache", {})
+    scope = AlarmScope(session_factory=factory)
+    for name in ("session_factory", "_branches", "_regions"):
+        monkeypatch.setattr(alarm_scope, name, getattr(scope, name))
+    yield factory
+    _reset_engine()
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
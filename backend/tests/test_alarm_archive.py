@@ -0,0 +1,82 @@
+import gzip
+import os
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
+from app.models.alarm_records import AlarmRecord
+from app.models.alarm_rollup import AlarmRollup
+from app.services.alarm_archive import ARCHIVE_SUFFIX, alarm_archive
+from app.services.alarm_bus import alarm_to_dict
+from app.services.alarm_feed import AlarmFilter
+from app.services.alarm_rollup import alarm_rollups
+from app.services.alarm_service import AlarmService, _sort_key
+
+NOW = datetime(2026, 10, 17)
+
+
+def _seed(db, count=2000):
+    random.seed(9)
+    rows = [
+        dict(device_id=f"D{random.randint(0, 9)}", alarm_type=random.choice(["a", "b"]),
+             severity=random.choice(["high", "low"]), status=random.choice(["resolved", "resolved", "pending"]),
+             timestamp=NOW - timedelta(seconds=random.randint(0, 86400 * 200)), description="x")
+        for _ in range(count)
+    ]
+    db.execute(insert(AlarmRecord), rows)
+    db.commit()
+    alarm_rollups.rebuild(db)
+    return [alarm_to_dict(a) for a in db.query(AlarmRecord).order_by(AlarmRecord.timestamp.desc(),
+                                                                       AlarmRecord.id.desc())]
+
+
+def _walk(db, alarm_filter=None, limit=97):
+    service, seen, cursor = AlarmService(), [], None
+    while True:
+        page = service.query_alarms(db, limit, cursor, alarm_filter, include_archive=True)
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return seen
+
+
+def test_archive_moves_only_old_resolved_alarms(db, monkeypatch):
+    monkeypatch.setattr(alarm_archive, "chunk_size", 150)
+    monkeypatch.setattr(alarm_archive, "pause_s", 0)
+    before = _seed(db)
+    rollups = db.query(func.sum(AlarmRollup.alarm_count)).scalar()
+    cutoff = NOW - timedelta(days=alarm_archive.after_days)
+    due = [a for a in before if a["status"] == "resolved" and a["timestamp"] < cutoff]
+
+    assert alarm_archive.run_once(db, now=NOW) == len(due)
+    assert db.query(AlarmRecord).count() == len(before) - len(due)
+    assert db.query(AlarmRecord).filter(AlarmRecord.status == "resolved", AlarmRecord.timestamp < cutoff).count() == 0
+    # Counts of archived alarms stay in the rollups
+    assert db.query(func.sum(AlarmRollup.alarm_count)).scalar() == rollups
+    assert alarm_archive.run_once(db, now=NOW) == 0
+
+
+def test_archived_alarms_read_back_unchanged(db, monkeypatch):
+    monkeypatch.setattr(alarm_archive, "pause_s", 0)
+    before = _seed(db)
+    alarm_archive.run_once(db, now=NOW)
+
+    # A crash between the file write and the delete leaves a chunk twice in the file
+    path = os.path.join(alarm_archive.root, alarm_archive.months()[-1] + ARCHIVE_SUFFIX)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = f.read().splitlines()[:20]
+    with open(path, "ab") as f:
+        f.write(gzip.compress(("\n".join(lines) + "\n").encode("utf-8")))
+
+    merged = _walk(db)
+    assert [_sort_key(a) for a in merged] == [_sort_key(a) for a in before]
+    archived = [a for a in merged if isinstance(a, dict)]
+    assert archived and all(a == next(b for b in before if b["id"] == a["id"]) for a in archived[:50])
+
+
+def test_archive_pages_apply_filters(db, monkeypatch):
+    monkeypatch.setattr(alarm_archive, "pause_s", 0)
+    before = _seed(db)
+    alarm_archive.run_once(db, now=NOW)
+    alarm_filter = AlarmFilter.parse(severity="HIGH", device_id="D1,D2")
+    got = [_sort_key(a) for a in _walk(db, alarm_filter, limit=11)]
+    assert got == [_sort_key(a) for a in before if alarm_filter.matches(a)]
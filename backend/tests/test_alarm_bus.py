@@ -0,0 +1,73 @@
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.schemas.alarm_schema import AlarmCreate
+from app.services import alarm_service
+from app.services.alarm_bus import alarm_bus
+from app.services.alarm_service import AlarmService
+
+
+@pytest.fixture
+def bus(session_factory, monkeypatch):
+    gate = threading.Event()
+    gate.set()
+
+    def gated_session():
+        gate.wait()
+        return session_factory()
+
+    monkeypatch.setattr(alarm_bus, "session_factory", gated_session)
+    alarm_bus.start()
+    yield gate
+    gate.set()
+    alarm_bus.stop()
+
+
+def _alarm(description):
+    return AlarmCreate(device_id="D0", alarm_type="helmet", severity="high", description=description,
+                       location="", status="pending")
+
+
+def test_create_alarm_waits_for_the_bus(db, bus):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    alarm = AlarmService().create_alarm(db, _alarm("one"))
+    assert alarm.id is not None
+    assert db.query(AlarmRecord).count() == 1
+
+
+def test_timed_out_alarm_is_withdrawn(db, bus, monkeypatch):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    monkeypatch.setattr(alarm_service, "ALARM_WRITE_TIMEOUT", 0.2)
+    # Hold the writer inside an earlier batch so the API's alarm stays queued
+    bus.clear()
+    stuck = alarm_bus.publish(dict(device_id="D0", alarm_type="helmet", severity="high", status="pending"))
+    time.sleep(0.1)
+
+    with pytest.raises(HTTPException) as error:
+        AlarmService().create_alarm(db, _alarm("late"))
+    assert error.value.status_code == 503
+
+    bus.set()
+    stuck.result(timeout=5)
+    alarm_bus.stop()
+    assert [row.description for row in db.query(AlarmRecord).all()] == [None]
+
+
+def test_stalled_write_has_an_unknown_outcome(db, bus, monkeypatch):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    monkeypatch.setattr(alarm_service, "ALARM_WRITE_TIMEOUT", 0.2)
+    # The writer has taken the alarm but its transaction does not finish
+    bus.clear()
+    with pytest.raises(HTTPException) as error:
+        AlarmService().create_alarm(db, _alarm("slow"))
+    assert error.value.status_code == 504
+
+    bus.set()
+    alarm_bus.stop()
+    assert [row.description for row in db.query(AlarmRecord).all()] == ["slow"]
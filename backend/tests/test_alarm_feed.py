@@ -0,0 +1,44 @@
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.schemas.alarm_schema import AlarmUpdate
+from app.schemas.fence_schema import FenceCreate
+from app.services.alarm_feed import AlarmFilter, alarm_feed
+from app.services.alarm_service import AlarmService
+from app.services.fence_service import FenceService
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+
+
+class _Client:
+    filter = AlarmFilter()
+
+    def __init__(self):
+        self.changes = []
+
+    def deliver(self, change):
+        self.changes.append(change)
+
+
+def _events(client):
+    return [(c["event"], c["id"], c["alarm"]["fence_id"]) for c in client.changes]
+
+
+def test_bulk_inserted_fence_alarms_reach_the_feed(db, monkeypatch):
+    client = _Client()
+    monkeypatch.setattr(alarm_feed, "_subscribers", [client])
+    lat, lng = offset(CENTER[0], CENTER[1], 20, 0)
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True, last_latitude=lat, last_longitude=lng))
+    db.commit()
+    # A new fence over a device already inside: alarms come from the Core INSERT path
+    fence = FenceService().create_fence(db, FenceCreate(
+        name="pit", shape="circle", behavior="No Entry", coordinates_json=f"[{CENTER[0]},{CENTER[1]}]",
+        radius=100, effective_time="00:00-23:59",
+    ))
+
+    alarm = db.query(AlarmRecord).filter(AlarmRecord.fence_id == fence.id).one()
+    assert _events(client) == [("created", alarm.id, fence.id)]
+    assert client.changes[0]["alarm"]["description"] == alarm.description
+
+    AlarmService().update_alarm(db, alarm.id, AlarmUpdate(status="resolved"))
+    assert _events(client)[-1] == ("updated", alarm.id, fence.id)
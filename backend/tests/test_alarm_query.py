@@ -0,0 +1,61 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert
+from app.models.alarm_records import AlarmRecord
+from app.services.alarm_feed import AlarmFilter
+from app.services.alarm_service import AlarmService
+
+BASE = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def alarms(db):
+    random.seed(3)
+    rows = [
+        dict(device_id=f"D{random.randint(0, 9)}", fence_id=random.choice([None, 1, 2]),
+             alarm_type=random.choice(["fence", "ai"]), severity=random.choice(["high", "HIGH", "low"]),
+             status=random.choice(["pending", "resolved"]),
+             # Few distinct timestamps: pages must break ties by id
+             timestamp=BASE + timedelta(minutes=random.randint(0, 40)), description="x")
+        for _ in range(1000)
+    ]
+    db.execute(insert(AlarmRecord), rows)
+    db.commit()
+    return db
+
+
+def _walk(db, limit, alarm_filter=None, start=None, end=None):
+    service, seen, cursor = AlarmService(), [], None
+    while True:
+        page = service.query_alarms(db, limit, cursor, alarm_filter, start, end)
+        assert len(page["items"]) <= limit
+        seen += [(a.timestamp, a.id) for a in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return seen
+
+
+def _expected(db, alarm_filter=None, start=None, end=None):
+    query = AlarmService()._filtered(db, alarm_filter, start, end)
+    return [(a.timestamp, a.id) for a in query.order_by(AlarmRecord.timestamp.desc(), AlarmRecord.id.desc())]
+
+
+@pytest.mark.parametrize("limit", [1, 7, 50, 1000, 5000])
+def test_pages_cover_every_alarm_once_in_order(alarms, limit):
+    assert _walk(alarms, limit) == _expected(alarms)
+
+
+def test_pages_with_filters_and_range(alarms):
+    alarm_filter = AlarmFilter.parse(status="pending", severity="high", fence_id="1,2")
+    start, end = BASE + timedelta(minutes=5), BASE + timedelta(minutes=30)
+    got = _walk(alarms, 13, alarm_filter, start, end)
+    assert got and got == _expected(alarms, alarm_filter, start, end)
+    assert all(start <= ts < end for ts, _ in got)
+
+
+def test_invalid_cursor_is_a_bad_request(alarms):
+    with pytest.raises(HTTPException) as error:
+        AlarmService().query_alarms(alarms, 10, "not-a-cursor")
+    assert error.value.status_code == 400
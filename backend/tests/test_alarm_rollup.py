@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app.models.admin_user import User
+from app.models.alarm_records import AlarmRecord
+from app.models.alarm_rollup import AlarmRollup
+from app.models.device import Device
+from app.schemas.alarm_schema import AlarmCreate, AlarmUpdate
+from app.services.alarm_feed import AlarmFilter
+from app.services.alarm_rollup import alarm_rollups
+from app.services.alarm_service import AlarmService
+
+
+@pytest.fixture
+def scoped(db):
+    db.add_all([User(id=1, username="a", department_id=3), User(id=2, username="b", department_id=4)])
+    db.add_all([Device(id=f"D{i}", device_name=f"D{i}", ip_address="x", owner_id=(i % 3) or None) for i in range(6)])
+    db.commit()
+    return db
+
+
+def _stored(db):
+    return {
+        (r.bucket, r.alarm_type, r.severity, r.device_id, r.branch_id): r.alarm_count
+        for r in db.query(AlarmRollup) if r.alarm_count
+    }
+
+
+def _recounted(db):
+    alarm_rollups.rebuild(db)
+    return _stored(db)
+
+
+def test_incremental_counts_match_a_rebuild(scoped):
+    db, service = scoped, AlarmService()
+    for i in range(6):
+        service.create_alarm(db, AlarmCreate(device_id=f"D{i}", alarm_type="helmet", severity="high",
+                                             description="x", location="", status="pending"))
+    first = db.query(AlarmRecord).order_by(AlarmRecord.id).first()
+    service.update_alarm(db, first.id, AlarmUpdate(severity="low"))
+    service.update_alarm(db, first.id, AlarmUpdate(status="resolved"))
+    service.delete_alarm(db, first.id + 1)
+
+    # Fence engine bulk path
+    rows = [dict(device_id="D4", fence_id=None, alarm_type="fence", severity="HIGH", status="pending",
+                 timestamp=datetime.utcnow(), description="c")] * 3
+    db.execute(insert(AlarmRecord), rows)
+    alarm_rollups.add_rows(db, rows)
+    db.commit()
+
+    # Rolled back writes leave no count behind
+    db.add(AlarmRecord(device_id="D5", alarm_type="helmet", severity="low", timestamp=datetime.utcnow()))
+    db.flush()
+    db.rollback()
+
+    incremental = _stored(db)
+    assert sum(incremental.values()) == db.query(AlarmRecord).count() == 8
+    assert incremental == _recounted(db)
+
+
+def test_chart_is_zero_filled_and_grouped_by_branch(scoped):
+    db = scoped
+    base = datetime(2026, 10, 1)
+    rows = [
+        dict(device_id="D1", alarm_type="a", severity="high", status="pending", timestamp=base + timedelta(minutes=10)),
+        dict(device_id="D2", alarm_type="a", severity="high", status="pending", timestamp=base + timedelta(hours=2)),
+        dict(device_id="D3", alarm_type="a", severity="low", status="pending", timestamp=base + timedelta(hours=2)),
+    ]
+    db.execute(insert(AlarmRecord), rows)
+    db.commit()
+    alarm_rollups.rebuild(db)
+
+    chart = alarm_rollups.chart(db, base, base + timedelta(hours=3), "hour", "branch_id")
+    assert chart["buckets"] == [(base + timedelta(hours=h)).isoformat() for h in range(3)]
+    assert {s["key"]: s["counts"] for s in chart["series"]} == {3: [1, 0, 0], 4: [0, 0, 1], None: [0, 0, 1]}
+
+    high = alarm_rollups.chart(db, base, base + timedelta(days=1), "day", alarm_filter=AlarmFilter.parse(severity="HIGH"))
+    assert high["series"][0]["counts"] == [2]
+    assert alarm_rollups.total(db, base, base + timedelta(hours=1)) == 1
+
+    with pytest.raises(ValueError):
+        alarm_rollups.chart(db, base, base + timedelta(days=400))
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.models.admin_user import User
+from app.models.device import Device
+from app.services.alarm_scope import alarm_scope
+
+
+@contextmanager
+def _statements(engine):
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def _setup(db, devices=1):
+    db.add(User(id=1, username="u1", hashed_password="x", department_id=7))
+    for i in range(devices):
+        db.add(Device(id=f"D{i}", device_name=f"D{i}", ip_address="x", is_online=True, owner_id=1))
+    db.commit()
+    assert alarm_scope.branch_of("D0") == 7
+    # Well within the TTL, but past the old one-second window for reloads on a miss
+    alarm_scope._branches._loaded_at -= 5
+
+
+def test_unknown_device_is_looked_up_once(db):
+    _setup(db)
+    with _statements(db.get_bind()) as seen:
+        for _ in range(5):
+            assert alarm_scope.branch_of("BOGUS") is None
+    # One lookup by id, then the negative answer is cached
+    assert len(seen) == 1
+    assert "WHERE devices.id" in seen[0]
+
+
+def test_new_device_is_found_without_a_full_reload(db):
+    _setup(db)
+    db.add(Device(id="NEW", device_name="NEW", ip_address="x", is_online=True, owner_id=1))
+    db.commit()
+    with _statements(db.get_bind()) as seen:
+        assert alarm_scope.branch_of("NEW") == 7
+        assert alarm_scope.branch_of("NEW") == 7
+    assert len(seen) == 1
+    assert "WHERE devices.id" in seen[0]
@@ -0,0 +1,96 @@
+import io
+import json
+import pytest
+from app.services import bulk_import
+from app.services.bulk_import import BulkImportService, RowError, iter_geojson
+
+
+def _features(text):
+    return list(iter_geojson(io.StringIO(text)))
+
+
+def _collection(count, indent=None):
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"name": f"f{i}", "behavior": "No Entry", "radius": 50.5, "effective_time": "00:00-23:59"},
+            "geometry": {"type": "Point", "coordinates": [121.5 + i * 0.01, 31.3]},
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"type": "FeatureCollection", "crs": {"type": "name"}, "features": features}, indent=indent)
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_feature_collection_is_streamed(monkeypatch, indent):
+    # Reads far smaller than one feature: every feature spans several reads
+    monkeypatch.setattr(bulk_import, "GEOJSON_READ_SIZE", 7)
+    features = _features(_collection(5, indent))
+    assert [n for n, _ in features] == [1, 2, 3, 4, 5]
+    assert [f["properties"]["name"] for _, f in features] == [f"f{i}" for i in range(5)]
+
+
+def test_feature_sequence_is_read_line_by_line():
+    text = '\x1e{"type": "Feature", "id": 1}\n\x1e{"type": "Feature", "id": 2}\nnot json\n\n{"id": 3}\n'
+    features = _features(text)
+    assert [n for n, _ in features] == [1, 2, 3, 4]
+    assert isinstance(features[2][1], RowError)
+    assert features[3][1] == {"id": 3}
+
+
+@pytest.mark.parametrize("text", ["[1, 2]", "42", '"x"', "", "  \n"])
+def test_non_object_document_is_rejected(text):
+    with pytest.raises(ValueError):
+        _features(text)
+
+
+def test_truncated_collection_keeps_the_features_before_the_error():
+    features = _features('{"type": "FeatureCollection", "features": [{"id": 1}, {"id": 2}, {"id": ')
+    assert [f for _, f in features[:2]] == [{"id": 1}, {"id": 2}]
+    assert isinstance(features[2][1], RowError)
+
+
+def test_import_reports_bad_features(db):
+    collection = json.loads(_collection(3))
+    collection["features"].insert(1, [1, 2])
+    report = BulkImportService().run(db, "fences", "geojson", io.StringIO(json.dumps(collection)))
+    assert report["inserted"] == 3
+    assert report["skipped"] == 1
+    assert report["errors"][0]["row"] == 2
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_only_imported_fences_are_evaluated(db, monkeypatch, returning):
+    from app.models.fence import ElectronicFence
+    from app.schemas.fence_schema import FenceCreate
+    from app.services.fence_service import FenceService
+
+    # Without executemany RETURNING (MySQL) the ids come from the ORM instead
+    for flag in ("insert_returning", "insert_executemany_returning"):
+        monkeypatch.setattr(db.get_bind().dialect, flag, returning)
+    monkeypatch.setattr(bulk_import, "IMPORT_CHUNK", 2)
+    service = BulkImportService()
+    evaluated = []
+    monkeypatch.setattr(service.fence_service, "_recount_later",
+                        lambda db, fences, raise_alarms=False: evaluated.extend(f.id for f in fences))
+    write = service._write
+    api_fence = []
+
+    def write_with_concurrent_fence(*args):
+        ids = write(*args)
+        if not api_fence:
+            # Created through the API between two import chunks
+            api_fence.append(FenceService().create_fence(db, FenceCreate(
+                name="api", shape="circle", behavior="No Entry", coordinates_json="[31.3, 121.5]",
+                radius=10, effective_time="00:00-23:59",
+            )).id)
+        return ids
+
+    monkeypatch.setattr(service, "_write", write_with_concurrent_fence)
+    report = service.run(db, "fences", "geojson", io.StringIO(_collection(5)))
+
+    assert report["inserted"] == 5
+    imported = {f.id for f in db.query(ElectronicFence).filter(ElectronicFence.name.like("f%"))}
+    assert len(imported) == 5
+    assert sorted(evaluated) == sorted(imported)
+    assert api_fence[0] not in evaluated
@@ -0,0 +1,35 @@
+import numpy as np
+from app.utils.coord_transform import (
+    gcj02_to_wgs84, gcj02_to_wgs84_array, wgs84_to_gcj02, wgs84_to_gcj02_array,
+)
+
+
+def _points():
+    rng = np.random.default_rng(7)
+    lng = rng.uniform(74.0, 135.0, 500)
+    lat = rng.uniform(4.0, 53.5, 500)
+    # Outside China, on the bounding box edges and NaN are left untouched
+    lng = np.append(lng, [2.35, -74.0, 73.66, 135.05, 121.5, np.nan])
+    lat = np.append(lat, [48.85, 40.7, 30.0, 30.0, 3.86, 31.3])
+    return lng, lat
+
+
+def test_arrays_match_the_scalar_functions():
+    lng, lat = _points()
+    for scalar, vector in ((wgs84_to_gcj02, wgs84_to_gcj02_array), (gcj02_to_wgs84, gcj02_to_wgs84_array)):
+        got_lng, got_lat = vector(lng, lat)
+        expected = np.array([scalar(x, y) for x, y in zip(lng, lat)])
+        np.testing.assert_allclose(got_lng, expected[:, 0], rtol=0, atol=1e-9)
+        np.testing.assert_allclose(got_lat, expected[:, 1], rtol=0, atol=1e-9)
+    np.testing.assert_array_equal(wgs84_to_gcj02_array(lng[-6:], lat[-6:]), (lng[-6:], lat[-6:]))
+
+
+def test_inverse_round_trip():
+    lng, lat = _points()
+    gcj_lng, gcj_lat = wgs84_to_gcj02_array(lng, lat)
+    assert np.nanmax(np.abs(gcj_lng - lng)) > 1e-3  # The offset is hundreds of metres
+    back_lng, back_lat = gcj02_to_wgs84_array(gcj_lng, gcj_lat)
+    # 1e-8 degrees is about 1 mm
+    np.testing.assert_allclose(back_lng, lng, rtol=0, atol=1e-8)
+    np.testing.assert_allclose(back_lat, lat, rtol=0, atol=1e-8)
+    assert np.allclose(gcj02_to_wgs84(*wgs84_to_gcj02(121.5, 31.3)), (121.5, 31.3), rtol=0, atol=1e-8)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+from app.controllers.dashboard_controller import alarm_chart, dashboard_summary
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.services.alarm_service import detection_alarm_row
+
+
+def _local_midnight_utc():
+    midnight = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _alarm(db, timestamp):
+    db.add(AlarmRecord(device_id="D0", alarm_type="helmet", severity="high", status="pending", timestamp=timestamp))
+
+
+def test_summary_counts_the_local_day_on_the_utc_clock(db):
+    db.add(Device(id="D0", device_name="D0", ip_address="x", is_online=True))
+    midnight = _local_midnight_utc()
+    _alarm(db, midnight - timedelta(minutes=30))  # yesterday, local time
+    _alarm(db, midnight + timedelta(minutes=30))
+    _alarm(db, datetime.utcnow())
+    db.commit()
+    assert dashboard_summary(db)["alarmCount"] == 2
+
+
+def test_chart_defaults_to_the_last_day_in_utc(db):
+    db.add(Device(id="D0", device_name="D0", ip_address="x", is_online=True))
+    now = datetime.utcnow()
+    _alarm(db, now - timedelta(hours=2))
+    _alarm(db, now - timedelta(hours=30))
+    db.commit()
+    chart = alarm_chart(start=None, end=None, bucket="hour", group_by=None, alarm_type=None, severity=None,
+                        device_id=None, branch_id=None, db=db, user={"role": "HQ"})
+    assert sum(s["total"] for s in chart["series"]) == 1
+    assert chart["buckets"][-1] == now.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def test_chart_converts_aware_parameters_to_utc(db):
+    db.add(Device(id="D0", device_name="D0", ip_address="x", is_online=True))
+    hour = datetime(2026, 3, 1, 10)
+    _alarm(db, hour + timedelta(minutes=5))
+    db.commit()
+    plus8 = timezone(timedelta(hours=8))
+    chart = alarm_chart(start=datetime(2026, 3, 1, 18, tzinfo=plus8), end=datetime(2026, 3, 1, 19, tzinfo=plus8),
+                        bucket="hour", group_by=None, alarm_type=None, severity=None, device_id=None,
+                        branch_id=None, db=db, user={"role": "HQ"})
+    assert chart["buckets"] == [hour.isoformat()]
+    assert chart["series"][0]["counts"] == [1]
+
+
+def test_ai_detection_alarms_land_in_the_current_hour(db):
+    db.add(Device(id="D0", device_name="D0", ip_address="x", is_online=True))
+    db.add(AlarmRecord(**detection_alarm_row("D0", {"type": "no_helmet", "msg": "x"}, "")))
+    db.commit()
+    assert dashboard_summary(db)["alarmCount"] == 1
+    chart = alarm_chart(start=None, end=None, bucket="hour", group_by=None, alarm_type=None, severity=None,
+                        device_id=None, branch_id=None, db=db, user={"role": "HQ"})
+    assert chart["series"][0]["counts"][-1] == 1
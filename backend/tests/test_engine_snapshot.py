@@ -0,0 +1,60 @@
+import numpy as np
+from app.models.device import Device
+from app.schemas.fence_schema import FenceCreate
+from app.services.engine_snapshot import engine_snapshot
+from app.services.fence_service import FenceService
+from app.services.fence_state import fence_membership
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+
+
+def _device(device_id, metres):
+    lat, lng = offset(CENTER[0], CENTER[1], metres, 0)
+    return Device(id=device_id, device_name=device_id, ip_address="x", is_online=True,
+                  last_latitude=lat, last_longitude=lng)
+
+
+def _warm_start(db, service):
+    fence_membership.clear()
+    fence_membership.loaded = False
+    evaluated = []
+    evaluate = service.evaluator.violation_masks
+
+    def spy(db, fences, positions):
+        evaluated.extend(positions.ids)
+        return evaluate(db, fences, positions)
+
+    service.evaluator.violation_masks = spy
+    service.warm_start(db)
+    return evaluated
+
+
+def test_float_column_rounding_is_not_a_move(db, monkeypatch, tmp_path):
+    monkeypatch.setattr(engine_snapshot, "path", str(tmp_path / "engine.npz"))
+    db.add_all([_device("D0", 20), _device("D1", 300), _device("D2", 500)])
+    db.commit()
+    service = FenceService()
+    fence = service.create_fence(db, FenceCreate(
+        name="pit", shape="circle", behavior="No Entry", coordinates_json=f"[{CENTER[0]},{CENTER[1]}]",
+        radius=100, effective_time="00:00-23:59",
+    ))
+    service.warm_up(db)
+    assert engine_snapshot.save(db)
+
+    # Read back through a single-precision FLOAT column
+    for device in db.query(Device):
+        device.last_latitude = float(np.float32(device.last_latitude))
+        device.last_longitude = float(np.float32(device.last_longitude))
+    db.commit()
+    assert _warm_start(db, service) == []
+    assert fence_membership.members(fence.id) == {"D0"}
+
+    # Real moves and devices missing from the snapshot are re-evaluated
+    db.query(Device).filter(Device.id == "D1").update(
+        dict(zip(("last_latitude", "last_longitude"), offset(CENTER[0], CENTER[1], 30, 0)))
+    )
+    db.add(_device("D3", 10))
+    db.commit()
+    assert sorted(_warm_start(db, service)) == ["D1", "D3"]
+    assert fence_membership.members(fence.id) == {"D0", "D1", "D3"}
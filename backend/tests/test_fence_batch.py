@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.schemas.fence_schema import FenceCreate, LocationPing
+from app.services.fence_service import FenceService
+from app.services.fence_state import fence_membership
+from app.services.location_store import location_store
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+
+
+def _setup(db):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    service = FenceService()
+    fence = service.create_fence(db, FenceCreate(
+        name="pit", shape="circle", behavior="No Entry", coordinates_json=f"[{CENTER[0]},{CENTER[1]}]",
+        radius=100, effective_time="00:00-23:59",
+    ))
+    return service, fence
+
+
+def _ping(metres, ts):
+    lat, lng = offset(CENTER[0], CENTER[1], metres, 0)
+    return LocationPing(device_id="D0", lat=lat, lng=lng, ts=ts)
+
+
+def test_batch_is_ordered_by_device_time(db):
+    service, fence = _setup(db)
+    t0 = datetime.now().replace(microsecond=0)
+    # Delivered newest first: the device walked in and back out
+    outside, inside = _ping(300, t0 + timedelta(seconds=2)), _ping(20, t0 + timedelta(seconds=1))
+    service.check_fence_status_batch(db, [outside, inside])
+
+    assert location_store.get("D0") == (outside.lat, outside.lng)
+    assert "D0" not in fence_membership.members(fence.id)
+    # The crossing inside the burst still raised its alarm
+    assert db.query(AlarmRecord).filter(AlarmRecord.fence_id == fence.id).count() == 1
+
+
+def test_batch_with_mixed_aware_and_naive_timestamps(db):
+    service, fence = _setup(db)
+    t0 = datetime.now().replace(microsecond=0)
+    # The same instants, one gateway sending UTC offsets and another naive local time
+    inside = _ping(20, (t0 + timedelta(seconds=2)).astimezone(timezone.utc))
+    outside = _ping(300, t0 + timedelta(seconds=1))
+    result = service.check_fence_status_batch(db, [inside, outside])
+
+    assert result["accepted"] == 2
+    assert location_store.get("D0") == (inside.lat, inside.lng)
+    assert "D0" in fence_membership.members(fence.id)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from app.models.alarm_records import AlarmRecord
+from app.models.device import Device
+from app.schemas.fence_schema import FenceCreate, LocationPing
+from app.services.fence_service import FenceService
+from app.services.fence_state import fence_membership, fence_debouncer
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+
+
+def _setup(db, **debounce):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    service = FenceService()
+    fence = service.create_fence(db, FenceCreate(
+        name="pit", shape="circle", behavior="No Entry", coordinates_json=f"[{CENTER[0]},{CENTER[1]}]",
+        radius=100, effective_time="00:00-23:59", **debounce,
+    ))
+    return service, fence
+
+
+def _pings(t0, distances, first_second=0):
+    pings = []
+    for k, metres in enumerate(distances, start=first_second):
+        lat, lng = offset(CENTER[0], CENTER[1], metres, 0)
+        pings.append(LocationPing(device_id="D0", lat=lat, lng=lng, ts=t0 + timedelta(seconds=k)))
+    return pings
+
+
+def _alarms(db, fence):
+    return db.query(AlarmRecord).filter(AlarmRecord.fence_id == fence.id).count()
+
+
+def test_jitter_shorter_than_the_dwell_raises_nothing(db):
+    service, fence = _setup(db, dwell_seconds=10)
+    t0 = datetime.now().replace(microsecond=0)
+    service.check_fence_status_batch(db, _pings(t0, [95 if k % 2 == 0 else 105 for k in range(20)]))
+    assert "D0" not in fence_membership.members(fence.id)
+    assert _alarms(db, fence) == 0
+
+
+def test_violation_is_confirmed_after_the_dwell(db):
+    service, fence = _setup(db, dwell_seconds=10)
+    t0 = datetime.now().replace(microsecond=0)
+    service.check_fence_status_batch(db, _pings(t0, [50] * 10))
+    assert "D0" not in fence_membership.members(fence.id)
+    assert fence_debouncer.pending_fences("D0") == {fence.id}
+
+    service.check_fence_status_batch(db, _pings(t0, [50], first_second=10))
+    assert "D0" in fence_membership.members(fence.id)
+    assert _alarms(db, fence) == 1
+    assert not fence_debouncer.pending_fences("D0")
+
+
+def test_hysteresis_keeps_a_counted_device_near_the_boundary(db):
+    service, fence = _setup(db, hysteresis_m=15)
+    t0 = datetime.now().replace(microsecond=0)
+    service.check_fence_status_batch(db, _pings(t0, [90]))
+    assert "D0" in fence_membership.members(fence.id)
+
+    service.check_fence_status_batch(db, _pings(t0, [110], first_second=1))
+    assert "D0" in fence_membership.members(fence.id)
+
+    service.check_fence_status_batch(db, _pings(t0, [130], first_second=2))
+    assert "D0" not in fence_membership.members(fence.id)
+    assert _alarms(db, fence) == 1
@@ -0,0 +1,68 @@
+import random
+import numpy as np
+import pytest
+from app.models.device import Device
+from app.schemas.fence_schema import FenceCreate, ProjectRegionCreate
+from app.services.fence_evaluator import DevicePositions, FenceEvaluator
+from app.services.fence_service import FenceService
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+SQUARE = [[31.299, 121.499], [31.299, 121.501], [31.301, 121.501], [31.301, 121.499]]
+REGION = [[31.298, 121.498], [31.298, 121.502], [31.302, 121.502], [31.302, 121.498]]
+
+
+@pytest.fixture
+def fences(db):
+    service = FenceService()
+    region = service.create_project_region(db, ProjectRegionCreate(name="site", coordinates_json=str(REGION)))
+    specs = [
+        ("No Entry", "polygon", str(SQUARE), None, None),
+        ("No Exit", "polygon", str(SQUARE), None, None),
+        ("No Exit", "polygon", str(SQUARE), None, region.id),
+        ("No Entry", "circle", f"[{CENTER[0]},{CENTER[1]}]", 80, None),
+        ("No Exit", "circle", f"[{CENTER[0]},{CENTER[1]}]", 80, region.id),
+    ]
+    return service, [
+        service.create_fence(db, FenceCreate(
+            name=f"f{k}", behavior=behavior, shape=shape, coordinates_json=coords, radius=radius,
+            project_region_id=region_id, effective_time="00:00-23:59",
+        ))
+        for k, (behavior, shape, coords, radius, region_id) in enumerate(specs)
+    ]
+
+
+def _points():
+    random.seed(5)
+    points = [(CENTER[0] + random.uniform(-0.003, 0.003), CENTER[1] + random.uniform(-0.003, 0.003))
+              for _ in range(300)]
+    # No location, half a location and NaN
+    points += [(0.0, 0.0), (CENTER[0], 0.0), (0.0, CENTER[1]), (np.nan, np.nan), (CENTER[0], np.nan)]
+    # Exactly on the polygon: corners and edge midpoints, and on the region boundary
+    for ring in (SQUARE, REGION):
+        for (a_lat, a_lng), (b_lat, b_lng) in zip(ring, ring[1:] + ring[:1]):
+            points += [(a_lat, a_lng), ((a_lat + b_lat) / 2, (a_lng + b_lng) / 2)]
+    # On and just off the circle
+    for metres in (79.9, 80, 80.1):
+        points += [offset(CENTER[0], CENTER[1], metres, 0), offset(CENTER[0], CENTER[1], 0, -metres)]
+    return points
+
+
+def test_masks_match_the_scalar_check(db, fences):
+    service, fences = fences
+    points = _points()
+    devices = [Device(id=f"D{i}", last_latitude=lat, last_longitude=lng) for i, (lat, lng) in enumerate(points)]
+    positions = DevicePositions([d.id for d in devices], [p[0] for p in points], [p[1] for p in points])
+
+    masks = FenceEvaluator().violation_masks(db, fences, positions, parallel=False)
+    for fence in fences:
+        expected = [service.check_device_violation(db, fence, device) for device in devices]
+        assert masks[fence.id].tolist() == expected, fence.name
+        assert masks[fence.id].any() and not masks[fence.id].all()
+
+
+def test_points_on_a_polygon_edge_are_inside(db, fences):
+    _, fences = fences
+    corner, midpoint = SQUARE[0], [(SQUARE[0][0] + SQUARE[1][0]) / 2, (SQUARE[0][1] + SQUARE[1][1]) / 2]
+    positions = DevicePositions(["A", "B"], [corner[0], midpoint[0]], [corner[1], midpoint[1]])
+    assert FenceEvaluator().inside_mask(fences[0], positions).tolist() == [True, True]
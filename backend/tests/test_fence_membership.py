@@ -0,0 +1,61 @@
+import math
+import random
+from datetime import datetime, timedelta
+from app.models.device import Device
+from app.models.fence import ElectronicFence
+from app.schemas.fence_schema import FenceCreate, LocationPing, ProjectRegionCreate
+from app.services.fence_service import FenceService
+from app.services.fence_state import fence_membership
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+DEVICES = [f"D{i}" for i in range(8)]
+
+
+def _setup(db):
+    service = FenceService()
+    # Region: a 440 m square around the centre
+    corners = [(220, 220), (220, -220), (-220, -220), (-220, 220)]
+    ring = [offset(CENTER[0], CENTER[1], north, east) for north, east in corners]
+    region = service.create_project_region(db, ProjectRegionCreate(
+        name="site", coordinates_json=str([list(p) for p in ring]),
+    ))
+    db.add_all([Device(id=d, device_name=d, ip_address="x", is_online=True) for d in DEVICES])
+    db.commit()
+    circle = f"[{CENTER[0]},{CENTER[1]}]"
+    for behavior, radius, region_id in [("No Entry", 100, None), ("No Exit", 150, region.id), ("No Exit", 400, None)]:
+        service.create_fence(db, FenceCreate(
+            name=f"{behavior} {radius}", shape="circle", behavior=behavior, coordinates_json=circle,
+            radius=radius, project_region_id=region_id, effective_time="00:00-23:59",
+        ))
+    return service
+
+
+def _state(db):
+    db.expire_all()
+    fences = db.query(ElectronicFence).order_by(ElectronicFence.id).all()
+    return {f.id: (fence_membership.members(f.id), f.worker_count) for f in fences}
+
+
+def test_incremental_membership_matches_a_full_recount(db):
+    service = _setup(db)
+    random.seed(11)
+    t0 = datetime.now().replace(microsecond=0)
+    for step in range(30):
+        # Walk in and out of the fences and of the region (whose edge is 220-310 m out)
+        pings = []
+        for k, device_id in enumerate(random.sample(DEVICES, 4)):
+            metres, angle = random.choice([20, 90, 110, 140, 160, 250, 350, 450]), random.uniform(0, 2 * math.pi)
+            lat, lng = offset(CENTER[0], CENTER[1], metres * math.cos(angle), metres * math.sin(angle))
+            pings.append(LocationPing(device_id=device_id, lat=lat, lng=lng, ts=t0 + timedelta(seconds=step)))
+        if step % 2:
+            service.check_fence_status_batch(db, pings)
+        else:
+            for p in pings:
+                service.check_fence_status(db, p.device_id, p.lat, p.lng)
+
+        incremental = _state(db)
+        assert any(members for members, _ in incremental.values())
+        assert all(len(members) == count for members, count in incremental.values())
+        service.recount_all_fences(db)
+        assert _state(db) == incremental, f"step {step}"
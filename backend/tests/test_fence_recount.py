@@ -0,0 +1,23 @@
+from datetime import timedelta
+from app.services.fence_recount import RecountQueue
+
+
+def test_finished_states_expire():
+    recounted = []
+    queue = RecountQueue(delay_s=0, max_delay_s=0, status_ttl_s=60)
+    queue.start(on_recount=lambda fence_ids, raise_alarms: recounted.extend(fence_ids))
+    try:
+        queue.schedule([1, 2])
+        assert queue.wait_idle(timeout=5)
+        assert queue.state(1) == queue.state(2) == "done"
+
+        # Fence 1 finished long ago; the next completed recount drops it
+        completed_at, state = queue._done[1]
+        queue._done[1] = (completed_at - timedelta(seconds=120), state)
+        queue.schedule([3])
+        assert queue.wait_idle(timeout=5)
+    finally:
+        queue.stop()
+    assert sorted(recounted) == [1, 2, 3]
+    assert set(queue._done) == {2, 3}
+    assert queue.state(1) == "idle"
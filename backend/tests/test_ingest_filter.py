@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from app.controllers.fence_controller import check_fence_violation, check_fence_violation_batch
+from app.models.device import Device
+from app.schemas.fence_schema import FenceCreate, LocationPing
+from app.services.fence_service import FenceService
+from app.services.fence_state import fence_membership, fence_debouncer
+from app.services.ingest_filter import IngestFilter, ingest_filter
+from app.services.track_store import track_store
+from benchmarks.synthetic import offset
+
+CENTER = (31.30, 121.50)
+
+
+def _ping(device_id, metres, t0, second):
+    lat, lng = offset(CENTER[0], CENTER[1], metres, 0)
+    return LocationPing(device_id=device_id, lat=lat, lng=lng, ts=t0 + timedelta(seconds=second))
+
+
+def _setup(db, dwell_seconds=None):
+    db.add(Device(id="D0", device_name="Dev0", ip_address="x", is_online=True))
+    db.commit()
+    service = FenceService()
+    fence = service.create_fence(db, FenceCreate(
+        name="pit", shape="circle", behavior="No Entry", coordinates_json=f"[{CENTER[0]},{CENTER[1]}]",
+        radius=200, effective_time="00:00-23:59", dwell_seconds=dwell_seconds,
+    ))
+    return service, fence
+
+
+def test_stationary_pings_are_dropped(db):
+    service, fence = _setup(db)
+    flt = IngestFilter(enabled=True, min_distance_m=5, min_interval_s=0, max_silence_s=30, boundary_margin_m=25)
+    t0 = datetime.now()
+    pings = [_ping("D0", 1000, t0, k) for k in range(20)]
+    passed = [p for p in pings if flt.admit(db, p.device_id, p.lat, p.lng, p.ts)]
+    assert len(passed) == 1
+    assert flt.stats["dropped_stationary"] == 19
+
+
+def test_dwell_is_confirmed_without_waiting_for_the_heartbeat(db):
+    service, fence = _setup(db, dwell_seconds=10)
+    flt = IngestFilter(enabled=True, min_distance_m=5, min_interval_s=0, max_silence_s=30, boundary_margin_m=25)
+    t0 = datetime.now().replace(microsecond=0)
+    # Standing still at the centre, 200 m from the boundary: only the dwell keeps pings flowing
+    counted_at = None
+    for k in range(25):
+        ping = _ping("D0", 0, t0, k)
+        for passed in flt.filter_pings(db, [ping]):
+            service.check_fence_status_batch(db, [passed])
+        if "D0" in fence_membership.members(fence.id):
+            counted_at = k
+            break
+    assert counted_at == 10
+    assert flt.stats["dwell_bypass"] == 10
+    assert not fence_debouncer.pending_fences("D0")
+
+
+def test_pings_drop_again_once_the_dwell_is_confirmed(db):
+    service, fence = _setup(db, dwell_seconds=5)
+    flt = IngestFilter(enabled=True, min_distance_m=5, min_interval_s=0, max_silence_s=30, boundary_margin_m=25)
+    t0 = datetime.now().replace(microsecond=0)
+    for k in range(20):
+        ping = _ping("D0", 0, t0, k)
+        for passed in flt.filter_pings(db, [ping]):
+            service.check_fence_status_batch(db, [passed])
+    assert "D0" in fence_membership.members(fence.id)
+    assert flt.stats["passed"] == 6
+    assert flt.stats["dropped_stationary"] == 14
+
+
+def test_unknown_devices_leave_no_track(db, monkeypatch):
+    _setup(db)
+    monkeypatch.setattr(ingest_filter, "enabled", True)
+    t0 = datetime.now().replace(microsecond=0)
+    for device_id in ("D0", "ghost"):
+        for k in range(3):
+            ping = _ping(device_id, 1000, t0, k)
+            check_fence_violation(device_id=device_id, lat=ping.lat, lng=ping.lng, db=db)
+        ping = _ping(device_id, 1000, t0, 3)
+        check_fence_violation_batch(pings=[ping], coords="gcj02", db=db)
+    track_store.flush()
+    assert len(list(track_store.read("D0", t0 - timedelta(minutes=1), t0 + timedelta(minutes=1)))) == 4
+    assert not list(track_store.read("ghost", t0 - timedelta(minutes=1), t0 + timedelta(minutes=1)))
@@ -0,0 +1,19 @@
+import json
+from app.services.location_ingest import parse_frames
+
+
+def test_frames_without_a_device_id_are_rejected():
+    message = "\n".join([
+        "DEV-1,31.2304,121.4737,1700000000",
+        ",31.2304,121.4737",
+        json.dumps({"id": "DEV-2", "lat": 31.2, "lng": 121.4}),
+        json.dumps({"lat": 31.2, "lng": 121.4}),
+        json.dumps({"device_id": None, "lat": 31.2, "lng": 121.4}),
+        json.dumps({"device_id": 7, "lat": 31.2, "lng": 121.4}),
+    ])
+    pings, rejected = parse_frames(message)
+    assert [p.device_id for p in pings] == ["DEV-1", "DEV-2", "7"]
+    assert rejected == 3
+
+    pings, rejected = parse_frames(json.dumps([{"device_id": " ", "lat": 1, "lng": 2}, {"id": "A", "lat": 1, "lng": 2}]))
+    assert [p.device_id for p in pings] == ["A"] and rejected == 1
@@ -0,0 +1,48 @@
+import os
+from datetime import datetime, timedelta
+from app.services.track_store import TrackStore
+from app.utils.track_codec import COORD_SCALE, decode_blocks, encode_block
+
+
+def _rounded(points):
+    return [(ts, round(lat * COORD_SCALE) / COORD_SCALE, round(lng * COORD_SCALE) / COORD_SCALE)
+            for ts, lat, lng in points]
+
+
+def test_codec_round_trip():
+    t0 = 1_790_000_000_000
+    points = [
+        (t0, 31.300001, 121.500001),
+        (t0 + 1000, 31.299000, 121.498500),  # negative deltas
+        (t0 + 1000, 31.299000, 121.498500),  # identical point, same timestamp
+        (t0 + 2500, -33.868820, -151.209296),  # across both hemispheres
+        (t0 + 2600, -33.868821, -151.209290),
+    ]
+    # A long stationary run is zlib-compressed
+    stationary = [(t0 + 3000 + k * 1000, -33.868821, -151.209290) for k in range(500)]
+    data = encode_block(points) + encode_block(stationary)
+    assert len(data) < 300
+    assert list(decode_blocks(data)) == _rounded(points + stationary)
+    # An interrupted append leaves a truncated block behind: it is skipped
+    assert list(decode_blocks(data + encode_block(points)[:-3])) == _rounded(points + stationary)
+
+
+def test_points_across_midnight_and_reopened_segments(tmp_path):
+    store = TrackStore(root=str(tmp_path))
+    t0 = datetime(2026, 10, 16, 23, 59, 58)
+    first = [(t0 + timedelta(seconds=k), 31.3 + k * 1e-5, 121.5 - k * 1e-5) for k in range(4)]
+    for ts, lat, lng in first:
+        store.record("D/1", lat, lng, ts)
+    assert store.flush() == 4
+    assert sorted(os.listdir(tmp_path)) == ["20261016", "20261017"]
+
+    # Later points for the same day are appended to the existing segment file
+    later = [(t0 + timedelta(seconds=10 + k), 31.3, 121.5) for k in range(3)]
+    for ts, lat, lng in later:
+        store.record("D/1", lat, lng, ts)
+    store.flush()
+
+    reopened = TrackStore(root=str(tmp_path))
+    got = list(reopened.read("D/1", t0, t0 + timedelta(minutes=1)))
+    assert got == _rounded(first + later)
+    assert list(reopened.read("D/1", t0 + timedelta(seconds=2), t0 + timedelta(seconds=3))) == got[2:4]